@@ -0,0 +1,311 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics
+from geocode_cache import get_default_cache
+from http_session import set_rate_limit
+from latlng2address import (
+    build_row_result,
+    geocode_google,
+    geocode_nominatim,
+    reverse_geocode_google,
+    reverse_geocode_nominatim,
+)
+from spatial_index import GridIndex
+
+# 各服務預設的 (每秒請求數, 瞬間可連發數)
+# Nominatim 使用政策為每秒最多 1 次;Google 依專案配額可調高
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "google": (25.0, 25),
+    "nominatim": (1.0, 1),
+}
+
+
+class AsyncTokenBucket:
+    """
+    Token bucket 限速器:每秒補充 rate 個 token,最多累積 burst 個。
+    acquire() 取得一個 token,沒有 token 時等待到下一個補充為止。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncGeocoder:
+    """
+    以 asyncio 並行處理多列、多個服務的地理編碼。
+    實際的 HTTP 呼叫仍使用 latlng2address 中的同步函式 (在執行緒中執行),
+    只有真的要呼叫 API 時才向該服務的限速器取 token,命中快取的查詢不受限速影響。
+
+    reuse_radius_m > 0 時,反向地理編碼會沿用半徑內已查過 (含快取中) 地號的地址,
+    相鄰地號不再各自呼叫 API;沿用的列會在 "反查來源距離_m" 記下與來源地號的距離。
+    """
+
+    def __init__(self, api_key: Optional[str], rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 language: str = "zh-TW", reuse_radius_m: float = 0.0):
+        self.api_key = api_key
+        self.language = language
+        limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.limiters = {name: AsyncTokenBucket(rate, burst) for name, (rate, burst) in limits.items()}
+        # http_get 的重試不經過限速器,讓重試的等待至少為一個請求間隔
+        for name, (rate, _) in limits.items():
+            set_rate_limit(name, rate)
+        self.cache = get_default_cache()
+        # 查詢中的快取鍵 -> Task:同一個鍵同時被多列查詢時 (例如沿用鄰近地號的列回轉同一個地址) 只呼叫一次 API
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.reuse_radius_m = reuse_radius_m
+        self.reused = 0
+        if reuse_radius_m > 0:
+            self.nearby = GridIndex(cell_m=reuse_radius_m)
+            # 查詢中的點 (payload 為完成時設定的 Future),鄰近的列等它完成後直接沿用
+            self._pending = GridIndex(cell_m=reuse_radius_m)
+            self._seed_nearby()
+
+    def _seed_nearby(self) -> None:
+        """以快取中已有的反向查詢結果建立空間索引,同一點的兩個服務合併成一筆。"""
+        points: Dict[Tuple[float, float], dict] = {}
+        for provider, lat, lng, value in self.cache.iter_reverse(self.language):
+            points.setdefault((lat, lng), {"google": None, "nominatim": None})[provider] = value
+        for (lat, lng), addresses in points.items():
+            self.nearby.add(lat, lng, addresses)
+
+    def _reusable(self, addresses: dict) -> bool:
+        # 鄰近點有任一服務沒查到地址時不沿用,避免把失敗擴散到相鄰的列
+        return addresses["nominatim"] is not None and (addresses["google"] is not None or not self.api_key)
+
+    async def _call(self, provider: str, cache_key: Optional[str], func, *args):
+        if cache_key is None:
+            return await self._fetch(provider, cache_key, func, *args)
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(provider, cache_key, func, *args))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        else:
+            metrics.inc("geocode_coalesced_total", provider=provider)
+        # shield:某一列被取消時不影響其他等待同一個查詢的列
+        return await asyncio.shield(task)
+
+    async def _fetch(self, provider: str, cache_key: Optional[str], func, *args):
+        if cache_key is None or not self.cache.contains(cache_key):
+            start = time.perf_counter()
+            await self.limiters[provider].acquire()
+            metrics.observe("rate_limit_wait_seconds", time.perf_counter() - start, provider=provider)
+        return await asyncio.to_thread(func, *args)
+
+    async def reverse_google(self, lat: float, lng: float) -> Optional[str]:
+        key = self.cache.reverse_key("google", lat, lng, self.language)
+        return await self._call("google", key, reverse_geocode_google, lat, lng, self.api_key, self.language)
+
+    async def reverse_nominatim(self, lat: float, lng: float) -> Optional[dict]:
+        key = self.cache.reverse_key("nominatim", lat, lng, "zh-TW")
+        return await self._call("nominatim", key, reverse_geocode_nominatim, lat, lng)
+
+    async def reverse_geocode_both(self, lat: float, lng: float) -> dict:
+        """
+        reverse_geocode_both 的非同步版本:Google 與 Nominatim 同時查詢。
+        有設定 reuse_radius_m 時先找半徑內最近的已知地址,沿用時結果多一個 "distance" (公尺)。
+        """
+        if self.reuse_radius_m <= 0:
+            return await self._reverse_both(lat, lng)
+
+        hit = self.nearby.nearest(lat, lng, self.reuse_radius_m)
+        if hit is None:
+            pending = self._pending.nearest(lat, lng, self.reuse_radius_m)
+            if pending is not None:
+                await asyncio.shield(pending[0])
+                hit = self.nearby.nearest(lat, lng, self.reuse_radius_m)
+        if hit is not None and self._reusable(hit[0]):
+            if hit[1] == 0:
+                # 同一點 (例如快取中的原座標) 不算沿用
+                return dict(hit[0])
+            self.reused += 1
+            return {**hit[0], "distance": hit[1]}
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.add(lat, lng, future)
+        try:
+            addresses = await self._reverse_both(lat, lng)
+            self.nearby.add(lat, lng, addresses)
+        finally:
+            self._pending.remove(lat, lng, future)
+            future.set_result(None)
+        return addresses
+
+    async def _reverse_both(self, lat: float, lng: float) -> dict:
+        if self.api_key:
+            google, nominatim = await asyncio.gather(
+                self.reverse_google(lat, lng), self.reverse_nominatim(lat, lng)
+            )
+        else:
+            google, nominatim = None, await self.reverse_nominatim(lat, lng)
+        return {"google": google, "nominatim": nominatim}
+
+    async def geocode_google(self, address: Optional[str]) -> Optional[Tuple[float, float]]:
+        if not address or not self.api_key:
+            return None
+        key = self.cache.forward_key("google", address)
+        return await self._call("google", key, geocode_google, address, self.api_key, self.language)
+
+    async def geocode_nominatim(self, address: Optional[str]) -> Optional[Tuple[float, float]]:
+        if not address:
+            return None
+        key = self.cache.forward_key("nominatim", address)
+        return await self._call("nominatim", key, geocode_nominatim, address)
+
+    async def geocode_row(self, lat: float, lng: float) -> dict:
+        """單筆:反向地理編碼後再把地址轉回經緯度,兩個服務各自並行。"""
+        addresses = await self.reverse_geocode_both(lat, lng)
+        google_addr = addresses["google"]
+        nominatim_data = addresses["nominatim"]
+        re_latlng_g, re_latlng_n = await asyncio.gather(
+            self.geocode_google(google_addr),
+            # Nominatim 使用原始地址進行回轉
+            self.geocode_nominatim(nominatim_data["original"] if nominatim_data else None),
+        )
+        return build_row_result(lat, lng, google_addr, nominatim_data, re_latlng_g, re_latlng_n,
+                                addresses.get("distance"))
+
+    async def geocode_rows(self, coords: Sequence[Tuple[float, float]], concurrency: int = 16,
+                           on_row=None) -> List[dict]:
+        """
+        多筆經緯度並行處理,回傳結果與 coords 順序一致。
+        on_row: 每列完成時以 on_row(位置, 結果) 通知 (例如寫入檢查點)。
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(i, lat, lng):
+            async with semaphore:
+                row = await self.geocode_row(lat, lng)
+            if on_row:
+                on_row(i, row)
+            return row
+
+        return await asyncio.gather(*(_one(i, lat, lng) for i, (lat, lng) in enumerate(coords)))
+
+    async def geocode_stream(self, parcels: Iterable[Tuple[int, dict]], buffer_size: int = 32,
+                             concurrency: int = 16, on_result=None) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+        """
+        邊查地號邊做地理編碼:parcels 為 (index, parse_land_info 結果) 的 iterator
+        (例如 location2lat_stream),在背景執行緒中逐筆取出放進容量為 buffer_size 的佇列。
+        地理編碼跟不上時佇列會滿,查詢端自然暫停 (backpressure)。
+
+        on_result: 每列完成地理編碼時以 on_result(index, 地號結果, 地理編碼結果) 通知。
+        回傳 (地號結果 {index: dict}, 地理編碼結果 {index: 一列輸出欄位})。
+        """
+        buffer = queue.Queue(maxsize=buffer_size)
+        finished = object()
+        errors = []
+
+        def _produce():
+            try:
+                for item in parcels:
+                    buffer.put(item)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                buffer.put(finished)
+
+        threading.Thread(target=_produce, daemon=True).start()
+
+        semaphore = asyncio.Semaphore(concurrency)
+        land_results: Dict[int, dict] = {}
+        rows: Dict[int, dict] = {}
+        tasks = []
+
+        async def _one(index, lat, lng):
+            try:
+                rows[index] = await self.geocode_row(lat, lng)
+            finally:
+                semaphore.release()
+            if on_result:
+                on_result(index, land_results[index], rows[index])
+
+        while True:
+            item = await asyncio.to_thread(buffer.get)
+            if item is finished:
+                break
+            index, info = item
+            land_results[index] = info
+            lat, lng = info.get("緯度_WGS84"), info.get("經度_WGS84")
+            if lat is None or lng is None:
+                continue
+            # 並行數已滿時先不取下一筆,讓佇列累積到上限後擋住查詢端
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(_one(index, lat, lng)))
+
+        await asyncio.gather(*tasks)
+        if errors:
+            raise errors[0]
+        return land_results, rows
+
+
+def _run(api_key: Optional[str], rate_limits, concurrency: int, work, reuse_radius_m: float = 0.0):
+    """建立事件迴圈與執行緒池後執行 work(geocoder)。"""
+    if not api_key:
+        print("找不到 Google API Key,Google 反向地理編碼結果將為 None。")
+
+    async def _main():
+        loop = asyncio.get_running_loop()
+        # 每列最多同時有兩個服務在等待回應,另外保留給串流模式讀取佇列
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=max(4, concurrency * 2 + 2)))
+        geocoder = AsyncGeocoder(api_key, rate_limits, reuse_radius_m=reuse_radius_m)
+        result = await work(geocoder)
+        if reuse_radius_m > 0:
+            print(f"沿用鄰近地號反查結果: {geocoder.reused} 筆 (半徑 {reuse_radius_m} 公尺)")
+        return result
+
+    return asyncio.run(_main())
+
+
+def geocode_rows(coords: Sequence[Tuple[float, float]], api_key: Optional[str],
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None, concurrency: int = 16,
+                 on_row=None, reuse_radius_m: float = 0.0) -> List[dict]:
+    """同步呼叫的入口:在新的事件迴圈中執行 AsyncGeocoder.geocode_rows。"""
+    return _run(api_key, rate_limits, concurrency,
+                lambda geocoder: geocoder.geocode_rows(coords, concurrency, on_row), reuse_radius_m)
+
+
+def geocode_stream(parcels: Iterable[Tuple[int, dict]], api_key: Optional[str],
+                   rate_limits: Optional[Dict[str, Tuple[float, int]]] = None, concurrency: int = 16,
+                   buffer_size: int = 32, on_result=None,
+                   reuse_radius_m: float = 0.0) -> Tuple[Dict[int, dict], Dict[int, dict]]:
+    """同步呼叫的入口:在新的事件迴圈中執行 AsyncGeocoder.geocode_stream。"""
+    return _run(api_key, rate_limits, concurrency,
+                lambda geocoder: geocoder.geocode_stream(parcels, buffer_size, concurrency, on_result),
+                reuse_radius_m)
+
+
+def geocode_stream_batches(batches: Iterable[Tuple[object, Iterable[Tuple[int, dict]]]], on_batch,
+                           api_key: Optional[str], rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                           concurrency: int = 16, buffer_size: int = 32, reuse_radius_m: float = 0.0) -> None:
+    """
+    分批版本的 geocode_stream:batches 為 (tag, parcels) 的 iterator,每批依序以 geocode_stream 處理,
+    完成時呼叫 on_batch(tag, 地號結果, 地理編碼結果)。所有批次共用同一個事件迴圈與 AsyncGeocoder,
+    限速器與沿用鄰近地號的索引 (reuse_radius_m) 只建立一次。
+    """
+    async def _work(geocoder):
+        for tag, parcels in batches:
+            land_map, rows = await geocoder.geocode_stream(parcels, buffer_size, concurrency)
+            on_batch(tag, land_map, rows)
+
+    _run(api_key, rate_limits, concurrency, _work, reuse_radius_m)
@@ -0,0 +1,77 @@
+"""
+比較逐列計算距離並以 df.at 填值,與向量化計算後整欄寫入的速度。
+
+用法: python bench_haversine.py [列數,預設 100000]
+"""
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from latlng2address import haversine_distance_batch
+
+
+def _haversine_scalar(lat1, lng1, lat2, lng2):
+    # 舊版的逐列 math 實作
+    R = 6371.0
+    lat1_rad, lng1_rad = math.radians(lat1), math.radians(lng1)
+    lat2_rad, lng2_rad = math.radians(lat2), math.radians(lng2)
+    d_lat = lat2_rad - lat1_rad
+    d_lng = lng2_rad - lng1_rad
+    a = math.sin(d_lat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(d_lng / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c * 1000
+
+
+def bench_per_row(df, lat, lng, re_lat, re_lng):
+    df = df.copy()
+    for col in ("原始_緯度", "原始_經度", "迴轉緯度", "迴轉經度", "誤差_m"):
+        df[col] = None
+    start = time.perf_counter()
+    for idx in range(len(df)):
+        df.at[idx, "原始_緯度"] = lat[idx]
+        df.at[idx, "原始_經度"] = lng[idx]
+        df.at[idx, "迴轉緯度"] = re_lat[idx]
+        df.at[idx, "迴轉經度"] = re_lng[idx]
+        df.at[idx, "誤差_m"] = round(_haversine_scalar(lat[idx], lng[idx], re_lat[idx], re_lng[idx]), 2)
+    return time.perf_counter() - start, df
+
+
+def bench_columnar(df, lat, lng, re_lat, re_lng):
+    start = time.perf_counter()
+    df = df.assign(**{
+        "原始_緯度": lat,
+        "原始_經度": lng,
+        "迴轉緯度": re_lat,
+        "迴轉經度": re_lng,
+        "誤差_m": np.round(haversine_distance_batch(lat, lng, re_lat, re_lng), 2),
+    })
+    return time.perf_counter() - start, df
+
+
+def main(n: int):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(22.0, 25.3, n)
+    lng = rng.uniform(120.0, 122.0, n)
+    # 迴轉經緯度:原點附近數十公尺內
+    re_lat = lat + rng.normal(0, 3e-4, n)
+    re_lng = lng + rng.normal(0, 3e-4, n)
+    df = pd.DataFrame({"地號": np.arange(n)})
+
+    t_row, df_row = bench_per_row(df, lat, lng, re_lat, re_lng)
+    t_col, df_col = bench_columnar(df, lat, lng, re_lat, re_lng)
+
+    diff = np.abs(df_row["誤差_m"].astype(np.float64).to_numpy() - df_col["誤差_m"].to_numpy()).max()
+    print(f"列數: {n}")
+    print(f"逐列 df.at:        {t_row:.3f} 秒 ({n / t_row:,.0f} 列/秒)")
+    print(f"向量化整欄寫入:    {t_col:.4f} 秒 ({n / t_col:,.0f} 列/秒)")
+    print(f"加速倍數:          {t_row / t_col:,.1f}x")
+    print(f"兩種結果最大差異:  {diff:.4f} 公尺")
+    print(f"記憶體 (逐列 object 欄): {df_row.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"記憶體 (float64 欄):     {df_col.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,356 @@
+"""
+效能測試用的本地模擬服務 (不連外網):
+
+    /nlsc/               模擬國土測繪圖資服務雲的地號查詢頁面,元素 ID 與 XPath 與 location2latlng 使用的相同
+                         (city、area_office、select2 段名、landcode、div_cross_query、DMAPS_Info、div_cross、qryLand_tab1)
+    /nlsc/query          頁面送出查詢時呼叫的端點,也可作為 HttpLandBackend 的 LAND_QUERY_URL
+    /google/json         Google Geocoding API (latlng= 反向、address= 正向)
+    /nominatim/reverse   Nominatim 反向查詢
+    /nominatim/search    Nominatim 正向查詢
+
+每個服務可設定平均延遲 (實際延遲為平均值的 0.5~1.5 倍) 與錯誤率 (回傳 503,觸發重試)。
+單獨執行可啟動服務供手動測試: python bench_mock_services.py [--port 8765]
+"""
+import argparse
+import hashlib
+import html
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from twd97 import format_dms, wgs84_to_twd97
+
+# 模擬的縣市 -> 區域 -> (中心緯度, 中心經度, 地政事務所, 段名列表)
+CATALOG = {
+    "桃園市": {
+        "中壢區": (24.9650, 121.2250, "中壢地政事務所", ["大路段", "中原段", "興南段", "過嶺段"]),
+        "桃園區": (24.9930, 121.3010, "桃園地政事務所", ["中路段", "大有段", "三民段"]),
+    },
+    "臺北市": {
+        "大安區": (25.0260, 121.5430, "大安地政事務所", ["仁愛段", "復興段", "學府段"]),
+        "信義區": (25.0330, 121.5680, "松山地政事務所", ["三興段", "永春段"]),
+    },
+    "臺中市": {
+        "西屯區": (24.1810, 120.6450, "中正地政事務所", ["福安段", "西屯段", "港尾段"]),
+    },
+}
+
+DEFAULT_SETTINGS = {
+    # 平均延遲 (毫秒)
+    "nlsc_select_ms": 20,    # 選縣市/區域後載入下層選單
+    "nlsc_query_ms": 80,     # 送出查詢到出現結果視窗
+    "nlsc_detail_ms": 40,    # 點詳細資料到內容載入
+    "google_ms": 60,
+    "nominatim_ms": 120,
+    # 錯誤率 (0~1)
+    "nlsc_error_rate": 0.0,
+    "google_error_rate": 0.0,
+    "nominatim_error_rate": 0.0,
+    # 查無地號的比例
+    "land_miss_rate": 0.0,
+}
+
+
+def _unit(*parts) -> float:
+    """由輸入決定的 0~1 亂數 (同樣的地號每次結果相同)。"""
+    digest = hashlib.md5("|".join(map(str, parts)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def parcel_location(city: str, area: str, section: str, landcode: str) -> Optional[Tuple[float, float]]:
+    """模擬地號的 WGS84 (緯度, 經度):同一段的地號集中在區域中心附近約 1 公里內。"""
+    entry = CATALOG.get(city, {}).get(area)
+    if entry is None or section not in entry[3]:
+        return None
+    lat0, lng0 = entry[0], entry[1]
+    lat = lat0 + (_unit(section, "lat") - 0.5) * 0.02 + (_unit(section, landcode, "lat") - 0.5) * 0.004
+    lng = lng0 + (_unit(section, "lng") - 0.5) * 0.02 + (_unit(section, landcode, "lng") - 0.5) * 0.004
+    return round(lat, 7), round(lng, 7)
+
+
+def land_texts(city: str, area: str, section: str, landcode: str) -> Tuple[str, Optional[str]]:
+    """回傳 (查詢結果視窗文字, 詳細資料文字);查無資料時詳細資料為 None。"""
+    location = parcel_location(city, area, section, landcode)
+    if location is None:
+        return "查無資料", None
+    lat, lng = location
+    e, n = wgs84_to_twd97(lat, lng)
+    office = CATALOG[city][area][2]
+    info = f"行政區:{city}{area}\n經緯度WGS84:{lng:.7f},{lat:.7f}"
+    detail = "\n".join([
+        f"{office} ({city[:1]}{area[:1]}) {section} {landcode}地號",
+        f"行政區:{city}{area}",
+        f"經緯度WGS84:{lng:.7f},{lat:.7f}",
+        f"經緯度:{format_dms(lat, lng)}",
+        f"國土利用現況調查:{'住宅使用' if _unit(landcode) < 0.6 else '商業使用'}",
+        f"TWD97坐標 E:{e:.2f} N:{n:.2f}",
+    ])
+    return info, detail
+
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>模擬地號查詢</title>
+<style>
+  .hidden { display: none; }
+  #section_dropdown { position: absolute; background: #fff; border: 1px solid #999; }
+  #map { height: 200px; background: #eef; }
+</style></head>
+<body>
+<div id="map_header">
+  <div></div><div></div><div></div>
+  <div><ul></ul><ul></ul><ul><li><a href="#" id="menu_query">地號查詢</a></li></ul></div>
+</div>
+<div id="submenu_pos" class="hidden"><table><tbody>
+  <tr><td>縣市/區域</td><td>
+    <select id="city"><option value="">請選擇縣市</option></select>
+    <select id="area_office"><option value="">請選擇區域</option></select>
+  </td></tr>
+  <tr><td>段名</td><td><span class="select2"><span class="selection"><span class="select2-selection"
+      id="section_render" tabindex="0">請選擇段名</span></span></span></td></tr>
+  <tr><td>地號</td><td><input id="landcode" type="text"><input id="div_cross_query" type="button" value="查詢"></td></tr>
+</tbody></table></div>
+<div id="map"></div>
+<div id="popup"></div>
+<div id="qryLand_tab1" class="hidden"><table><tbody><tr><td></td></tr></tbody></table></div>
+<span id="section_dropdown" class="select2-dropdown hidden">
+  <input class="select2-search__field" type="text"><ul id="section_results"></ul>
+</span>
+<script>
+var CATALOG = __CATALOG__, SETTINGS = __SETTINGS__;
+function byId(id) { return document.getElementById(id); }
+function jitter(ms) { return ms * (0.5 + Math.random()); }
+function fill(select, names, placeholder) {
+  select.innerHTML = '';
+  [placeholder].concat(names).forEach(function (name, i) {
+    var opt = document.createElement('option');
+    opt.value = i ? name : ''; opt.text = name; select.appendChild(opt);
+  });
+}
+var sections = [];
+fill(byId('city'), Object.keys(CATALOG), '請選擇縣市');
+
+byId('menu_query').addEventListener('click', function (e) {
+  e.preventDefault(); byId('submenu_pos').classList.remove('hidden');
+});
+byId('city').addEventListener('change', function () {
+  var city = this.value;
+  fill(byId('area_office'), [], '請選擇區域');
+  sections = []; byId('section_render').textContent = '請選擇段名';
+  setTimeout(function () {
+    fill(byId('area_office'), city ? Object.keys(CATALOG[city]) : [], '請選擇區域');
+  }, jitter(SETTINGS.nlsc_select_ms));
+});
+byId('area_office').addEventListener('change', function () {
+  var city = byId('city').value, area = this.value;
+  sections = []; byId('section_render').textContent = '請選擇段名';
+  setTimeout(function () { sections = area ? CATALOG[city][area][3] : []; }, jitter(SETTINGS.nlsc_select_ms));
+});
+
+// 簡化的 select2:點選後出現搜尋框,輸入文字篩選,按 Enter 選第一個結果
+var search = document.querySelector('.select2-search__field');
+function renderResults() {
+  var ul = byId('section_results'); ul.innerHTML = '';
+  sections.filter(function (s) { return s.indexOf(search.value) >= 0; }).forEach(function (s) {
+    var li = document.createElement('li'); li.className = 'select2-results__option'; li.textContent = s;
+    ul.appendChild(li);
+  });
+}
+byId('section_render').addEventListener('click', function () {
+  byId('section_dropdown').classList.remove('hidden'); search.value = ''; renderResults(); search.focus();
+});
+search.addEventListener('input', renderResults);
+search.addEventListener('keyup', renderResults);
+search.addEventListener('keydown', function (e) {
+  if (e.key !== 'Enter') return;
+  renderResults();
+  var first = document.querySelector('.select2-results__option');
+  if (first) byId('section_render').textContent = first.textContent;
+  byId('section_dropdown').classList.add('hidden');
+});
+document.addEventListener('keydown', function (e) {
+  if (e.key === 'Escape') byId('section_dropdown').classList.add('hidden');
+});
+
+function lines(text) {
+  return text.split('\\n').map(function (t) {
+    var d = document.createElement('div'); d.textContent = t; return d.outerHTML;
+  }).join('');
+}
+byId('div_cross_query').addEventListener('click', function () {
+  byId('qryLand_tab1').classList.add('hidden');
+  var params = new URLSearchParams({
+    city: byId('city').value, area: byId('area_office').value,
+    section: byId('section_render').textContent, landcode: byId('landcode').value
+  });
+  fetch('/nlsc/query?' + params).then(function (r) {
+    return r.ok ? r.json() : {info: '系統忙碌,請稍後再試', text: null};
+  }).catch(function () { return {info: '系統忙碌,請稍後再試', text: null}; }).then(function (data) {
+    var popup = byId('popup');
+    popup.innerHTML = '<div id="DMAPS_Info">' + lines(data.info) + '</div>';
+    if (!data.text) return;
+    var cross = document.createElement('div'); cross.id = 'div_cross';
+    cross.innerHTML = '<input type="button" value="詳細資料">';
+    popup.appendChild(cross);
+    cross.querySelector('input').addEventListener('click', function () {
+      setTimeout(function () {
+        byId('qryLand_tab1').querySelector('td').innerHTML = lines(data.text);
+        byId('qryLand_tab1').classList.remove('hidden');
+      }, jitter(SETTINGS.nlsc_detail_ms));
+    });
+  });
+});
+</script>
+</body></html>
+"""
+
+
+class MockServices:
+    """在背景執行緒啟動模擬服務;port=0 時自動選擇可用的連接埠。"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **settings):
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._addresses: Dict[str, Tuple[float, float]] = {}
+        self._random = random.Random(0)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """讓 pipeline 改用模擬服務的環境變數。"""
+        return {
+            "NLSC_URL": f"{self.base_url}/nlsc/",
+            "LAND_QUERY_URL": f"{self.base_url}/nlsc/query",
+            "GOOGLE_GEOCODE_URL": f"{self.base_url}/google/json",
+            "NOMINATIM_BASE_URL": f"{self.base_url}/nominatim",
+        }
+
+    def start(self) -> "MockServices":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    ## ---- 模擬行為 ----
+
+    def _delay_and_fail(self, service: str, latency_key: str) -> bool:
+        """依設定延遲;回傳 True 表示這次要回傳錯誤。"""
+        with self._lock:
+            self.counts[service] = self.counts.get(service, 0) + 1
+            jitter = 0.5 + self._random.random()
+            fail = self._random.random() < self.settings[f"{service}_error_rate"]
+        time.sleep(self.settings[latency_key] / 1000 * jitter)
+        return fail
+
+    def _address(self, lat: float, lng: float) -> Tuple[str, str]:
+        """(Google 地址, Nominatim display_name),並記錄兩者轉回的座標 (偏移數公尺)。"""
+        number = int(_unit(round(lat, 5), round(lng, 5)) * 300) + 1
+        city, area = "模擬市", "模擬區"
+        best = None
+        for c, areas in CATALOG.items():
+            for a, entry in areas.items():
+                d = (entry[0] - lat) ** 2 + (entry[1] - lng) ** 2
+                if best is None or d < best:
+                    best, city, area = d, c, a
+        road = f"測試路{int(_unit(round(lat, 3), round(lng, 3)) * 9) + 1}段"
+        google = f"{city}{area}{road}{number}號"
+        nominatim = f"{number}, {road}, {area}, {city}, 000, 臺灣"
+        with self._lock:
+            self._addresses[google] = (lat + 3e-5, lng - 2e-5)
+            self._addresses[nominatim] = (lat - 4e-5, lng + 3e-5)
+        return google, nominatim
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body, content_type: str = "application/json; charset=utf-8"):
+                data = body if isinstance(body, bytes) else (
+                    body.encode("utf-8") if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode("utf-8"))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                path = url.path.rstrip("/")
+                if path == "/nlsc":
+                    page = (_PAGE.replace("__CATALOG__", json.dumps(CATALOG, ensure_ascii=False))
+                            .replace("__SETTINGS__", json.dumps(services.settings)))
+                    return self._send(200, page, "text/html; charset=utf-8")
+                if path == "/nlsc/query":
+                    if services._delay_and_fail("nlsc", "nlsc_query_ms"):
+                        return self._send(503, {"error": "busy"})
+                    args = [q.get(k, "").strip() for k in ("city", "area", "section", "landcode")]
+                    if _unit(*args, "miss") < services.settings["land_miss_rate"]:
+                        return self._send(200, {"info": "查無資料", "text": None})
+                    info, detail = land_texts(*args)
+                    return self._send(200, {"info": info, "text": detail})
+                if path == "/google/json":
+                    if services._delay_and_fail("google", "google_ms"):
+                        return self._send(503, {"status": "UNKNOWN_ERROR"})
+                    if "latlng" in q:
+                        lat, lng = map(float, q["latlng"].split(","))
+                        google, _ = services._address(lat, lng)
+                        return self._send(200, {"status": "OK", "results": [{"formatted_address": f"000臺灣{google}"}]})
+                    location = services._addresses.get(q.get("address", ""))
+                    if location is None:
+                        return self._send(200, {"status": "ZERO_RESULTS", "results": []})
+                    return self._send(200, {"status": "OK", "results": [
+                        {"geometry": {"location": {"lat": location[0], "lng": location[1]}}}]})
+                if path == "/nominatim/reverse":
+                    if services._delay_and_fail("nominatim", "nominatim_ms"):
+                        return self._send(503, {"error": "busy"})
+                    _, display = services._address(float(q["lat"]), float(q["lon"]))
+                    return self._send(200, {"display_name": display})
+                if path == "/nominatim/search":
+                    if services._delay_and_fail("nominatim", "nominatim_ms"):
+                        return self._send(503, {"error": "busy"})
+                    location = services._addresses.get(q.get("q", ""))
+                    return self._send(200, [] if location is None else
+                                      [{"lat": str(location[0]), "lon": str(location[1])}])
+                self._send(404, {"error": html.escape(url.path)})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="啟動本地模擬的 NLSC / Google / Nominatim 服務")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, value in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=value)
+    args = parser.parse_args()
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+    services = MockServices(port=args.port, **settings).start()
+    for name, value in services.env().items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
@@ -0,0 +1,88 @@
+"""
+以合成的門牌點資料測試本地反向地理編碼:與暴力搜尋比對結果,並量測單筆與批次查詢速度。
+不需要網路,也不需要真實的門牌資料。
+
+用法: python bench_offline_geocoder.py [門牌點數,預設 500000] [查詢數,預設 20000]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from offline_geocoder import AddressPointIndex, _equirect_m
+
+
+def synthetic_points(n: int, rng):
+    # 台灣本島範圍內的隨機門牌點
+    lat = rng.uniform(22.0, 25.3, n)
+    lng = rng.uniform(120.0, 122.0, n)
+    addresses = [f"測試市測試區合成路{i // 100}段{i % 100}號" for i in range(n)]
+    return addresses, lat, lng
+
+
+def brute_force(index: AddressPointIndex, lat, lng, limit: float):
+    idx = np.full(len(lat), -1, dtype=np.int64)
+    for k in range(len(lat)):
+        dist = _equirect_m(lat[k], lng[k], index.lat, index.lng)
+        best = int(dist.argmin())
+        if dist[best] <= limit:
+            idx[k] = best
+    return idx
+
+
+def main(n: int, m: int):
+    rng = np.random.default_rng(0)
+    addresses, lat, lng = synthetic_points(n, rng)
+
+    start = time.perf_counter()
+    index = AddressPointIndex.from_arrays(addresses, lat, lng, cell_m=100.0)
+    t_build = time.perf_counter() - start
+
+    # 一半的查詢落在門牌點附近 (數十公尺),一半隨機
+    pick = rng.integers(0, n, m // 2)
+    q_lat = np.concatenate([lat[pick] + rng.normal(0, 2e-4, len(pick)), rng.uniform(22.0, 25.3, m - len(pick))])
+    q_lng = np.concatenate([lng[pick] + rng.normal(0, 2e-4, len(pick)), rng.uniform(120.0, 122.0, m - len(pick))])
+    q_lat[0] = np.nan
+
+    start = time.perf_counter()
+    batch_idx, batch_dist = index.nearest_batch(q_lat, q_lng)
+    t_batch = time.perf_counter() - start
+
+    n_single = min(m, 2000)
+    start = time.perf_counter()
+    single = [index.nearest(q_lat[k], q_lng[k]) for k in range(n_single)]
+    t_single = time.perf_counter() - start
+
+    n_check = min(m, 1000)
+    expected = brute_force(index, q_lat[:n_check], q_lng[:n_check], index.cell_m)
+    batch_ok = int((batch_idx[:n_check] == expected).sum())
+    single_ok = sum(
+        (hit is None) == (expected[k] < 0) and (hit is None or hit[0] == index.address(expected[k]))
+        for k, hit in enumerate(single[:n_check])
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "address_points")
+        index.save(path)
+        loaded = AddressPointIndex.load(path, mmap=True)
+        mmap_idx, _ = loaded.nearest_batch(q_lat, q_lng)
+        mmap_ok = bool((mmap_idx == batch_idx).all())
+        first = int(np.flatnonzero(batch_idx >= 0)[0])
+        roundtrip = loaded.geocode(loaded.address(batch_idx[first]))
+        del loaded, mmap_idx
+
+    print(f"門牌點數: {n},查詢數: {m},找到門牌點: {int((batch_idx >= 0).sum())} 筆")
+    print(f"建立索引:          {t_build:.3f} 秒")
+    print(f"批次查詢:          {t_batch:.4f} 秒 ({t_batch / m * 1e6:.2f} 微秒/筆)")
+    print(f"單筆查詢:          {t_single / n_single * 1e6:.1f} 微秒/筆")
+    print(f"與暴力搜尋一致:    批次 {batch_ok}/{n_check},單筆 {single_ok}/{n_check}")
+    print(f"mmap 載入結果一致: {mmap_ok}")
+    print(f"地址迴轉座標:      {roundtrip} (原座標 {index.lat[batch_idx[first]]:.7f}, {index.lng[batch_idx[first]]:.7f})")
+    print(f"距離中位數:        {np.nanmedian(batch_dist):.1f} 公尺")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20_000)
@@ -0,0 +1,129 @@
+"""
+比較 parse_land_info 舊版 (六次未編譯的 re.search) 與單次掃描的預先編譯解析器,
+並確認兩者在語料上的結果完全相同。
+
+用法: python bench_parser.py [語料檔] [重複次數,預設 20]
+語料檔為 UTF-8 文字檔,每段查詢結果文字 (頁面 qryLand_tab1 的 .text) 之間以一行 "---" 分隔;
+未指定時以隨機產生、與查詢結果相同格式的文字測試 (部分欄位併在同一行);
+另外一律加入 EDGE_CASES 中欄位不在行首的文字。
+正確性的回歸測試在 test_land_parser.py (語料: fixtures/land_detail_texts.txt 與 EDGE_CASES)。
+"""
+import random
+import re
+import sys
+import time
+
+from land_parser import parse_land_info, parse_many
+
+
+def parse_land_info_legacy(text: str) -> dict:
+    # 舊版實作,作為正確性的比對基準
+    result = {}
+    match = re.search(r'行政區:(.+)', text)
+    if match:
+        result['行政區'] = match.group(1).strip()
+    match = re.search(r'經緯度WGS84:(\d+\.\d+),(\d+\.\d+)', text)
+    if match:
+        result['經度_WGS84'] = float(match.group(1))
+        result['緯度_WGS84'] = float(match.group(2))
+    match = re.search(r'經緯度:(.+)', text)
+    if match:
+        result['經緯度_DMS'] = match.group(1).strip()
+    match = re.search(r'國土利用現況調查:(.+)', text)
+    if match:
+        result['國土利用'] = match.group(1).strip()
+    match = re.search(r'TWD97坐標 E:(\d+\.\d+) N:(\d+\.\d+)', text)
+    if match:
+        result['TWD97_E'] = float(match.group(1))
+        result['TWD97_N'] = float(match.group(2))
+    match = re.search(r'(.+所 .+)\s+(.+)\s+(\d+)地號', text)
+    if match:
+        result['所屬所'] = match.group(1).strip()
+        result['地段'] = match.group(2).strip()
+        result['地號'] = match.group(3).strip()
+    return result
+
+
+def _dms(value: float, pos: str, neg: str) -> str:
+    hemi = pos if value >= 0 else neg
+    value = abs(value)
+    d = int(value)
+    m = int((value - d) * 60)
+    s = (value - d - m / 60) * 3600
+    return f"{d}°{m}'{s:.2f}\"{hemi}"
+
+
+# 欄位不在行首的文字 (例如查詢結果視窗 DMAPS_Info),每次都加入比對
+EDGE_CASES = [
+    "行政區:桃園市中壢區 經緯度WGS84:121.2234,24.9531",
+    "地號資訊 TWD97坐標 E:268000.12 N:2761000.34",
+    "查詢結果 經緯度WGS84:121.2234,24.9531 TWD97坐標 E:268000.12 N:2761000.34",
+    "中壢地政事務所 中壢區 大路段 815地號 行政區:桃園市中壢區",
+    "地號 815 國土利用現況調查:住宅 經緯度:121°13'24.24\"E 24°57'11.16\"N",
+    "",
+]
+
+
+def synthetic_corpus(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    offices = [("中壢地政事務所", "中壢區", "桃園市"), ("大安地政事務所", "大安區", "臺北市"), ("鳳山地政事務所", "鳳山區", "高雄市")]
+    sections = ["大路段", "中原段", "新興段", "仁愛段"]
+    uses = ["住宅", "農業使用", "商業", "空置地"]
+    texts = []
+    for _ in range(n):
+        office, area, city = rng.choice(offices)
+        lat, lng = rng.uniform(22.0, 25.3), rng.uniform(120.0, 122.0)
+        lines = [
+            f"{office} {area}",
+            rng.choice(sections),
+            f"{rng.randint(1, 9999)}地號",
+            f"行政區:{city}{area}",
+            f"經緯度WGS84:{lng:.6f},{lat:.6f}",
+            f"經緯度:{_dms(lng, 'E', 'W')} {_dms(lat, 'N', 'S')}",
+            f"國土利用現況調查:{rng.choice(uses)}",
+            f"TWD97坐標 E:{rng.uniform(150000, 350000):.2f} N:{rng.uniform(2400000, 2800000):.2f}",
+        ]
+        # 部分文字缺欄位,確認缺值時兩者行為一致
+        if rng.random() < 0.1:
+            lines.pop(rng.randrange(len(lines)))
+        # 部分文字把相鄰兩行併成一行,欄位出現在行中間
+        if rng.random() < 0.1:
+            k = rng.randrange(len(lines) - 1)
+            lines[k:k + 2] = [f"{lines[k]} {lines[k + 1]}"]
+        texts.append("\n".join(lines))
+    return texts
+
+
+def load_corpus(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [t.strip("\n") for t in f.read().split("\n---\n") if t.strip()]
+
+
+def main():
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else synthetic_corpus(5000)
+    corpus = corpus + EDGE_CASES
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    mismatches = [t for t in corpus if parse_land_info_legacy(t) != parse_land_info(t)]
+    print(f"語料: {len(corpus)} 段,結果不一致: {len(mismatches)} 段")
+    for text in mismatches[:3]:
+        print("---\n" + text)
+
+    texts = corpus * repeat
+    start = time.perf_counter()
+    for text in texts:
+        parse_land_info_legacy(text)
+    t_legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parse_many(texts)
+    t_new = time.perf_counter() - start
+
+    print(f"舊版 (六次 re.search):  {len(texts) / t_legacy:,.0f} 段/秒")
+    print(f"單次掃描 (parse_many):  {len(texts) / t_new:,.0f} 段/秒")
+    print(f"加速倍數: {t_legacy / t_new:.2f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+端對端效能測試:啟動本地模擬服務 (bench_mock_services),以 100 / 1k / 10k 筆合成地號
+執行實際的 pipeline (location2lat_stream -> geocode_stream -> 檢查點 -> assemble_result_columns,
+與 latlng2address.py --stream 相同的流程),輸出每秒列數、每列延遲 p50/p95 與最高記憶體用量 (JSON)。
+每列延遲 = 該地號的查詢耗時 + 查到後到地理編碼完成的時間;另外單獨列出地理編碼部分 (geocode_latency)。
+瀏覽器的記憶體以定期取樣所有子孫行程 (chromedriver、Chrome 及其 renderer) 的 RSS 合計估計。
+
+每個筆數在獨立的子行程中執行 (記憶體量測不受前一輪影響),快取與檢查點都放在暫存目錄。
+預設使用 Selenium 操作模擬頁面 (需要 Chrome);--backend http 時改用 HttpLandBackend 呼叫模擬服務的查詢端點,不需要瀏覽器。
+
+用法:
+    python bench_pipeline.py                              # 100, 1000, 10000 筆
+    python bench_pipeline.py --sizes 100 1000 --backend http --output bench_pipeline.json
+    python bench_pipeline.py --google-error-rate 0.05 --nominatim-ms 200
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from bench_mock_services import CATALOG, DEFAULT_SETTINGS, MockServices
+
+
+def synthetic_parcels(n: int, seed: int = 0) -> list:
+    """合成的地號清單:以段為單位成群出現 (與實際輸入相同),段之間的順序打散。"""
+    rng = random.Random(seed)
+    sections = [(city, area, section)
+                for city, areas in CATALOG.items()
+                for area, entry in areas.items()
+                for section in entry[3]]
+    parcels = []
+    while len(parcels) < n:
+        city, area, section = rng.choice(sections)
+        for _ in range(min(rng.randint(5, 50), n - len(parcels))):
+            parcels.append({"city": city, "area": area, "section": section,
+                            "landcode": str(rng.randint(1, 9999))})
+    return parcels
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _peak_rss_mb(who) -> float:
+    # Linux 的 ru_maxrss 單位為 KB (macOS 為 bytes)
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / 1024 if sys.platform != "darwin" else rss / 1024 / 1024, 1)
+
+
+def _descendant_rss_mb() -> Optional[float]:
+    """目前所有子孫行程的 RSS 合計 (MB);有 psutil 時使用 psutil,否則讀 /proc (非 Linux 回傳 None)。"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 1024 / 1024
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # 第 2 欄 (行程名稱) 可能含空白,從最後一個 ")" 之後算起
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / 1024 / 1024
+
+
+class _RssSampler:
+    """在背景執行緒中每 interval 秒取樣一次子孫行程的 RSS 合計,記錄最大值。"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            rss = _descendant_rss_mb()
+            if rss is not None:
+                self.peak = max(self.peak or 0.0, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_once(args) -> dict:
+    """子行程:執行一次 pipeline 並回傳結果 (環境變數已指向模擬服務與暫存目錄)。"""
+    import pandas as pd
+
+    import metrics
+    from async_geocode import geocode_stream
+    from checkpoint import CheckpointJournal
+    from latlng2address import assemble_result_columns
+    from location2latlng import location2lat_stream
+    from parcel_cache import parcel_key
+
+    data_list = synthetic_parcels(args.rows, args.seed)
+    keys = [parcel_key(data) for data in data_list]
+    journal = CheckpointJournal(os.path.join(args.workdir, "bench.checkpoint.jsonl"))
+    journal.reset()
+
+    yielded = {}
+    land_seconds = {}
+    latencies = []
+    geocode_latencies = []
+
+    def _timed(records):
+        # 記錄每個地號的查詢耗時,以及查詢完成 (交給地理編碼) 的時間
+        for record in records:
+            land_seconds[record.index] = record.seconds
+            yielded[record.index] = time.perf_counter()
+            yield record.index, record.info
+
+    def _on_result(index, land, row):
+        waited = time.perf_counter() - yielded[index]
+        geocode_latencies.append(waited)
+        latencies.append(land_seconds[index] + waited)
+        journal.write(index, keys[index], land, row)
+
+    start = time.perf_counter()
+    with _RssSampler() as sampler:
+        land_map, rows = geocode_stream(
+            _timed(location2lat_stream(data_list, use_cache=True, wait_profile=args.wait_profile,
+                                       workers=args.workers, backend=args.backend, extract=args.extract,
+                                       records=True)),
+            "mock-key",
+            rate_limits={"google": (args.qps, int(args.qps)), "nominatim": (args.qps, int(args.qps))},
+            concurrency=args.concurrency, buffer_size=args.buffer_size, on_result=_on_result,
+        )
+    df = pd.DataFrame({"縣市": [d["city"] for d in data_list], "區": [d["area"] for d in data_list],
+                       "段": [d["section"] for d in data_list], "地號": [d["landcode"] for d in data_list]})
+    df = assemble_result_columns(df, journal.load(), keys)
+    elapsed = time.perf_counter() - start
+    journal.close()
+
+    land_query = next((h for h in metrics.get_metrics().summary()["histograms"]
+                       if h["name"] == "land_query_seconds" and h["labels"].get("result") == "ok"), None)
+    counters = {(c["name"], c["labels"].get("provider", "")): c["value"]
+                for c in metrics.get_metrics().summary()["counters"]}
+    return {
+        "rows": args.rows,
+        "backend": args.backend,
+        "extract": args.extract,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(args.rows / elapsed, 2),
+        "parcels_found": sum(1 for info in land_map.values() if info.get("緯度_WGS84") is not None),
+        "rows_geocoded": int(df["Nominatim地址"].notna().sum()),
+        # 每列延遲:該地號的查詢耗時 (含重試) + 查詢完成到地理編碼完成 (含排隊等待)
+        "row_latency_p50_s": _percentile(latencies, 0.50),
+        "row_latency_p95_s": _percentile(latencies, 0.95),
+        # 只算地理編碼部分:地號查詢完成到該列地理編碼完成
+        "geocode_latency_p50_s": _percentile(geocode_latencies, 0.50),
+        "geocode_latency_p95_s": _percentile(geocode_latencies, 0.95),
+        # 地號查詢本身的延遲 (由 metrics 的分布估計)
+        "land_query_p50_s": land_query["p50_s"] if land_query else None,
+        "land_query_p95_s": land_query["p95_s"] if land_query else None,
+        "http_retries": {p: v for (name, p), v in counters.items() if name == "http_retries_total"},
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        # 子孫行程 (chromedriver、Chrome 及其 renderer) RSS 合計的最高取樣值;
+        # RUSAGE_CHILDREN 只含已結束且被 wait 的子行程,量不到 Chrome,因此改為取樣
+        "peak_rss_descendants_mb": round(sampler.peak, 1) if sampler.peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本地模擬服務量測 pipeline 吞吐量")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--backend", choices=["selenium", "http"], default="selenium")
+    parser.add_argument("--extract", choices=["webdriver", "js"], default="webdriver")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--wait-profile", choices=["fast", "safe"], default="fast")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--buffer-size", type=int, default=32)
+    parser.add_argument("--qps", type=float, default=1000.0, help="Google / Nominatim 限速 (模擬服務不需遵守真實配額)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="結果 JSON 檔 (未指定時只輸出到 stdout)")
+    for key, value in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=value)
+    # 子行程使用的參數
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rows is not None:
+        print(json.dumps(run_once(args), ensure_ascii=False))
+        return
+
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+    child_args = list(sys.argv[1:])
+    results = []
+    with MockServices(**settings) as services:
+        for n in args.sizes:
+            with tempfile.TemporaryDirectory() as workdir:
+                env = {
+                    **os.environ,
+                    **services.env(),
+                    "GEOCODE_CACHE_PATH": os.path.join(workdir, "geocode_cache.sqlite"),
+                    "PARCEL_CACHE_PATH": os.path.join(workdir, "parcel_cache.sqlite"),
+                    "CHROME_HEADLESS": "1",
+                }
+                proc = subprocess.run([sys.executable, os.path.abspath(__file__), *child_args,
+                                       "--rows", str(n), "--workdir", workdir],
+                                      cwd=workdir, env=env, capture_output=True, text=True)
+                lines = proc.stdout.strip().splitlines()
+                if proc.returncode != 0 or not lines:
+                    result = {"rows": n, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+                else:
+                    result = json.loads(lines[-1])
+            result["mock_requests"] = dict(services.counts)
+            services.counts.clear()
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            results.append(result)
+
+    report = {"settings": settings, "args": {k: v for k, v in vars(args).items() if k not in ("rows", "workdir")},
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
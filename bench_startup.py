@@ -0,0 +1,102 @@
+"""
+量測各入口的啟動時間:每次在新的 Python 行程中計時「import」與「import 後第一次查詢」,
+並列出載入了哪些重量級套件 (pandas / selenium / webdriver_manager)。
+
+chromedriver 一項會執行兩次:第一次沒有 chromedriver_path.json (需呼叫 ChromeDriverManager),
+第二次使用第一次記錄的路徑。所有行程都在暫存目錄中執行,不會在專案目錄留下快取檔。
+
+用法: python bench_startup.py [每項重複次數,預設 5]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("pandas", "selenium", "webdriver_manager")
+
+# 名稱: (import 敘述, 第一次查詢)
+ENTRY_POINTS = {
+    "latlng2address": (
+        "import latlng2address",
+        "latlng2address.haversine_distance(25.0, 121.5, 25.001, 121.501)",
+    ),
+    "async_geocode": (
+        "import async_geocode",
+        "async_geocode.AsyncGeocoder(None)",
+    ),
+    "offline_geocoder": (
+        "import offline_geocoder",
+        "offline_geocoder.AddressPointIndex.from_arrays(['a', 'b'], [25.0, 25.001], [121.5, 121.5])"
+        ".nearest(25.0002, 121.5)",
+    ),
+    "location2latlng": (
+        "import location2latlng",
+        "location2latlng.resolve_chromedriver()",
+    ),
+    # 對照:舊版 latlng2address 在 import 時就載入的套件
+    "eager (pandas + location2latlng)": (
+        "import pandas, location2latlng, latlng2address",
+        "latlng2address.haversine_distance(25.0, 121.5, 25.001, 121.501)",
+    ),
+}
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+{imports}
+t1 = time.perf_counter()
+error = None
+try:
+    {query}
+except Exception as e:
+    error = repr(e)[:120]
+t2 = time.perf_counter()
+print(json.dumps({{"import": t1 - t0, "first_query": t2 - t1, "error": error,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(imports: str, query: str, cwd: str) -> dict:
+    code = _PROBE.format(imports=imports, query=query, heavy=HEAVY_MODULES)
+    # REPO_DIR 放在最前面,保留原本的 PYTHONPATH (例如 venv 以外安裝的套件)
+    pythonpath = os.pathsep.join(p for p in (REPO_DIR, os.environ.get("PYTHONPATH")) if p)
+    env = {**os.environ, "PYTHONPATH": pythonpath, "GEOCODE_CACHE_BYPASS": "1"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _report(name: str, runs: list) -> None:
+    imp = statistics.median(r["import"] for r in runs) * 1000
+    first = statistics.median(r["first_query"] for r in runs) * 1000
+    heavy = ", ".join(runs[-1]["heavy"]) or "-"
+    error = f"  (錯誤: {runs[-1]['error']})" if runs[-1]["error"] else ""
+    print(f"{name:<34} import {imp:8.1f} ms   第一次查詢 {first:8.1f} ms   載入: {heavy}{error}")
+
+
+def main(repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (imports, query) in ENTRY_POINTS.items():
+            if name == "location2latlng":
+                # 冷啟動:沒有記錄的 chromedriver 路徑
+                cold = []
+                for _ in range(repeat):
+                    if os.path.exists(os.path.join(tmp, "chromedriver_path.json")):
+                        os.remove(os.path.join(tmp, "chromedriver_path.json"))
+                    cold.append(probe(imports, query, tmp))
+                _report(f"{name} (無 driver 路徑記錄)", cold)
+                record = os.path.join(tmp, "chromedriver_path.json")
+                if not os.path.exists(record):
+                    # 冷啟動沒取得 driver (例如離線):以任一存在的檔案代替,只量測路徑解析
+                    with open(record, "w", encoding="utf-8") as f:
+                        json.dump({"path": sys.executable}, f)
+                _report(f"{name} (使用記錄的路徑)", [probe(imports, query, tmp) for _ in range(repeat)])
+            else:
+                _report(name, [probe(imports, query, tmp) for _ in range(repeat)])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,60 @@
+"""
+以地號快取中網站回傳的成對坐標 (WGS84 與 TWD97) 與 fixtures/twd97_pairs.csv 的參考點
+驗證 twd97 模組的換算,並量測整欄換算的速度。
+
+用法: python bench_twd97.py [地號快取檔,預設 parcel_cache.sqlite] [列數,預設 100000]
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from parcel_cache import DEFAULT_PARCEL_CACHE_PATH
+from twd97 import load_reference_pairs, twd97_to_wgs84, validate_against_records, wgs84_to_twd97
+
+
+def load_records(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path)
+    try:
+        return [json.loads(value) for (value,) in conn.execute("SELECT value FROM parcel")]
+    finally:
+        conn.close()
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PARCEL_CACHE_PATH
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+
+    stats = validate_against_records(load_records(path))
+    if stats["count"]:
+        print(f"網站坐標比對: {stats['count']} 筆,最大誤差 {stats['max_m']:.3f} 公尺,平均 {stats['mean_m']:.3f} 公尺")
+    else:
+        print(f"{path} 中沒有同時含 WGS84 與 TWD97 的紀錄,略過網站坐標比對")
+    stats = validate_against_records(load_reference_pairs())
+    print(f"參考點比對: {stats['count']} 筆,最大誤差 {stats['max_m']:.3f} 公尺,平均 {stats['mean_m']:.3f} 公尺")
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(21.9, 25.3, n)
+    lng = rng.uniform(120.0, 122.0, n)
+
+    start = time.perf_counter()
+    e, north = wgs84_to_twd97(lat, lng)
+    t_fwd = time.perf_counter() - start
+    start = time.perf_counter()
+    lat2, lng2 = twd97_to_wgs84(e, north)
+    t_inv = time.perf_counter() - start
+
+    # 來回換算的誤差 (度 -> 約略公尺)
+    roundtrip = np.hypot((lat2 - lat) * 111_000, (lng2 - lng) * 111_000 * np.cos(np.radians(lat))).max()
+    print(f"WGS84 -> TWD97: {n / t_fwd:,.0f} 筆/秒")
+    print(f"TWD97 -> WGS84: {n / t_inv:,.0f} 筆/秒")
+    print(f"來回換算最大誤差: {roundtrip * 1000:.3f} 毫米")
+
+
+if __name__ == "__main__":
+    main()
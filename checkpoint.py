@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+class CheckpointJournal:
+    """
+    只附加 (append-only) 的 JSONL 檢查點檔,每完成一列就寫入一行:
+        {"index": 輸入列號, "parcel": [縣市, 區, 段, 地號], "land": {...}, "geocode": {...}}
+    中斷後以 load() 讀回已完成的列,重新執行時跳過這些列;最後的試算表也由檔案內容組成。
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def reset(self) -> None:
+        """清空檢查點 (重新開始一次完整的執行)。"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            open(self.path, "w", encoding="utf-8").close()
+
+    def write(self, index: int, parcel, land: dict, geocode: Optional[dict]) -> None:
+        record = {"index": index, "parcel": list(parcel), "land": land, "geocode": geocode}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            f = self._open()
+            f.write(line + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def load(self) -> Dict[int, dict]:
+        """讀回所有已完成的列 {index: record};同一列寫過多次時以最後一次為準。"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 中斷時最後一行可能只寫了一半
+                    continue
+                records[record["index"]] = record
+        return records
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
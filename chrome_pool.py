@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+
+from location2latlng import (
+    NLSC_URL,
+    LandResult,
+    _driver_alive,
+    _land_status,
+    initialize_web,
+    open_query_panel,
+    query_land,
+    set_chrome_options,
+)
+
+# chromedriver 下載/啟動同時進行容易互相干擾，一次只啟動一個瀏覽器
+_driver_start_lock = threading.Lock()
+
+
+def _start_driver(url: str, headless: bool, wait_profile):
+    with _driver_start_lock:
+        driver = set_chrome_options(headless=headless)
+    initialize_web(driver, url, wait_profile)
+    open_query_panel(driver, wait_profile)
+    return driver
+
+
+class _WorkQueue:
+    """
+    每個 worker 各有一個 shard (deque)，自己從前端取工作；
+    自己的 shard 做完後，從剩最多工作的 shard 尾端偷取，避免慢的 worker 拖住整批。
+    失敗的工作放到共用的重試佇列，所有 shard 都做完後才取用。
+    """
+
+    def __init__(self, items, workers: int):
+        self._lock = threading.Lock()
+        self._shards = [deque() for _ in range(workers)]
+        self._retries = deque()
+        # 連續切塊：相鄰的地號 (通常同段) 留在同一個瀏覽器
+        size = -(-len(items) // workers) if items else 0
+        for w in range(workers):
+            self._shards[w].extend(items[w * size:(w + 1) * size])
+
+    def take(self, worker: int):
+        with self._lock:
+            own = self._shards[worker]
+            if own:
+                return own.popleft()
+            victim = max(self._shards, key=len)
+            if victim:
+                return victim.pop()
+            if self._retries:
+                return self._retries.popleft()
+            return None
+
+    def retry(self, item):
+        """工作沒完成 (例如瀏覽器當掉) 時排到重試佇列，等其他工作都做完再以重開的查詢視窗重試。"""
+        with self._lock:
+            self._retries.append(item)
+
+
+def location2lat_pool(data_list, workers: int = 4, headless: bool = True, wait_profile="safe",
+                      url: str = NLSC_URL, max_restarts: int = 3, max_attempts: int = 3, on_result=None,
+                      coords_only: bool = False, extract: str = "webdriver", on_record=None, session=None):
+    """
+    同時開 workers 個瀏覽器查詢地號，回傳 list 與 data_list 順序一一對應 (失敗為空 dict)。
+
+    max_restarts: 每個 worker 瀏覽器當掉後最多重啟幾次，超過則該 worker 結束，剩下的工作由其他 worker 接手
+    max_attempts: 同一筆地號最多嘗試幾次 (失敗的地號排到最後重試)
+    on_result: 每筆完成 (成功或放棄) 時以 on_result(index, 結果) 通知，供串流處理使用
+    on_record: 同上，但以 LandResult (含 status / error / attempts) 通知
+    session: LandSession，worker 先沿用其中閒置的瀏覽器，結束時交還而不關閉 (分塊處理時不必每塊重開)
+    """
+    results = [{} for _ in data_list]
+    if not data_list:
+        return results
+    workers = max(1, min(workers, len(data_list)))
+    queue = _WorkQueue([(i, data, 0) for i, data in enumerate(data_list)], workers)
+    # 各地號查詢耗時 (各次嘗試合計);同一筆同時只會在一個 worker 中,不需要鎖
+    elapsed = {}
+
+    def _report(record: LandResult):
+        if on_result:
+            on_result(record.index, record.info)
+        if on_record:
+            on_record(record)
+
+    def _worker(worker: int):
+        restarts = 0
+        driver = session.take_driver() if session else None
+        try:
+            while True:
+                if driver is None:
+                    try:
+                        driver = _start_driver(url, headless, wait_profile)
+                    except Exception as e:
+                        print(f"[worker {worker}] 瀏覽器啟動失敗: {e}")
+                        return
+                item = queue.take(worker)
+                if item is None:
+                    return
+                index, data, attempts = item
+                start = time.perf_counter()
+                try:
+                    results[index] = query_land(driver, data, wait_profile, coords_only, extract)
+                    elapsed[index] = elapsed.get(index, 0.0) + time.perf_counter() - start
+                    _report(LandResult(index, _land_status(results[index]), results[index], None, attempts + 1,
+                                       elapsed[index]))
+                    continue
+                except Exception as e:
+                    elapsed[index] = elapsed.get(index, 0.0) + time.perf_counter() - start
+                    error = f"{type(e).__name__}: {e}".strip()
+                    print(f"[worker {worker}] 第 {index} 筆查詢失敗 ({attempts + 1}/{max_attempts}): {error}")
+                    metrics.inc("land_failures_total")
+
+                if attempts + 1 < max_attempts:
+                    metrics.inc("land_retries_total")
+                    queue.retry((index, data, attempts + 1))
+                else:
+                    _report(LandResult(index, "error", {}, error, attempts + 1, elapsed[index]))
+                if _driver_alive(driver):
+                    # 頁面狀態可能亂掉，重新打開查詢視窗
+                    try:
+                        open_query_panel(driver, wait_profile)
+                        continue
+                    except Exception:
+                        pass
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+                driver = None
+                restarts += 1
+                metrics.inc("chrome_restarts_total")
+                if restarts > max_restarts:
+                    print(f"[worker {worker}] 重啟次數過多，剩餘工作交由其他 worker")
+                    return
+                print(f"[worker {worker}] 重新啟動瀏覽器 ({restarts}/{max_restarts})")
+        finally:
+            if driver is not None:
+                if session is not None:
+                    session.give_driver(driver)
+                else:
+                    driver.quit()
+
+    threads = [threading.Thread(target=_worker, args=(w,), daemon=True) for w in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
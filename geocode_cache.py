@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Optional
+
+import metrics
+
+DEFAULT_CACHE_PATH = "geocode_cache.sqlite"
+
+# 找不到快取時的標記 (與「快取內容為 None」區分)
+MISS = object()
+
+# 每寫入多少筆檢查一次 TTL 與筆數上限
+EVICT_INTERVAL = 256
+
+
+def normalize_address(address: str) -> str:
+    """地址正規化:全形轉半形、去除多餘空白,作為正向查詢的快取鍵。"""
+    if not address:
+        return ""
+    address = unicodedata.normalize("NFKC", address)
+    return " ".join(address.split())
+
+
+class GeocodeCache:
+    """
+    以 SQLite 儲存的地理編碼快取。
+
+    - 反向查詢 (經緯度 -> 地址) 以 provider、language 與四捨五入後的經緯度為鍵
+    - 正向查詢 (地址 -> 經緯度) 以 provider 與正規化後的地址為鍵
+    - ttl: 資料有效秒數,None 表示永不過期
+    - max_entries: 筆數上限,超過時刪除最久未使用的資料
+    - bypass: True 時不讀也不寫快取 (等同停用)
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, precision: int = 6,
+                 ttl: Optional[float] = 30 * 24 * 3600, max_entries: Optional[int] = 200_000,
+                 bypass: bool = False):
+        self.path = path
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_accessed ON geocode(accessed)")
+        self._conn.commit()
+
+    ## ---------- 快取鍵 ----------
+
+    def reverse_key(self, provider: str, lat: float, lng: float, language: str = "zh-TW") -> str:
+        p = self.precision
+        return f"reverse|{provider}|{language}|{round(lat, p):.{p}f}|{round(lng, p):.{p}f}"
+
+    def forward_key(self, provider: str, address: str) -> str:
+        return f"forward|{provider}|{normalize_address(address)}"
+
+    ## ---------- 讀寫 ----------
+
+    def get(self, key: str) -> Any:
+        """回傳快取內容;找不到、已過期或 bypass 時回傳 MISS。"""
+        if self.bypass:
+            return MISS
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM geocode WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._record(key, "miss")
+                return MISS
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM geocode WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                self._record(key, "expired")
+                return MISS
+            self._conn.execute("UPDATE geocode SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self._record(key, "hit")
+        return json.loads(value)
+
+    @staticmethod
+    def _record(key: str, result: str) -> None:
+        # 鍵的前兩段為查詢方向與 provider (見 reverse_key / forward_key)
+        op, provider = key.split("|", 2)[:2]
+        metrics.inc("cache_lookups_total", cache="geocode", op=op, provider=provider, result=result)
+
+    def contains(self, key: str) -> bool:
+        """只檢查是否有有效的快取,不計入命中次數 (供限速器判斷是否需要等待)。"""
+        if self.bypass:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT created FROM geocode WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+    def set(self, key: str, value: Any) -> None:
+        """寫入快取;只應寫入成功取得的結果,失敗 (None) 不寫入以便下次重試。"""
+        if self.bypass or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._pending_writes += 1
+            # 淘汰需要掃描整張表,每累積一定寫入量才執行一次
+            if self._pending_writes >= EVICT_INTERVAL:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        self._pending_writes = 0
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM geocode WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            count = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM geocode WHERE key IN "
+                    "(SELECT key FROM geocode ORDER BY accessed ASC LIMIT ?)",
+                    (overflow,),
+                )
+
+    def iter_reverse(self, language: str = "zh-TW"):
+        """逐筆取出未過期的反向查詢快取:yield (provider, lat, lng, value),供建立空間索引使用。"""
+        if self.bypass:
+            return
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, created FROM geocode WHERE key LIKE 'reverse|%'"
+            ).fetchall()
+        for key, value, created in rows:
+            if self.ttl is not None and now - created > self.ttl:
+                continue
+            _, provider, lang, lat, lng = key.split("|")
+            if provider == "google" and lang != language:
+                continue
+            yield provider, float(lat), float(lng), json.loads(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM geocode")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+            self._conn.close()
+
+
+## --------------------------- 共用實例 ---------------------------
+
+_default_cache: Optional[GeocodeCache] = None
+
+
+def get_default_cache() -> GeocodeCache:
+    """
+    取得模組共用的快取實例,第一次呼叫時才建立。
+    環境變數 GEOCODE_CACHE_PATH 可指定檔案位置,GEOCODE_CACHE_BYPASS=1 可停用快取。
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GeocodeCache(
+            path=os.getenv("GEOCODE_CACHE_PATH", DEFAULT_CACHE_PATH),
+            bypass=os.getenv("GEOCODE_CACHE_BYPASS", "") == "1",
+        )
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[GeocodeCache]) -> None:
+    """替換共用的快取實例 (例如改用不同路徑、精度或 bypass 設定)。"""
+    global _default_cache
+    _default_cache = cache
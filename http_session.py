@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# 各服務的連線池與重試設定,未列出的服務使用 "default"
+#   pool_connections: 保留幾個主機的連線池
+#   pool_maxsize: 每個主機最多保留幾條 keep-alive 連線 (應 >= 並行數)
+#   max_retries: 暫時性錯誤 (429、5xx、連線失敗、逾時) 最多重試次數
+#   backoff_base / backoff_max: 指數退避的起始與最大秒數 (實際等待時間再乘上隨機 jitter)
+#   min_interval: 重試前至少等待的秒數 (= 1 / 該服務的每秒請求數上限),重試不經過限速器,
+#                 以此確保重試不會比限速更快送出 (見 set_rate_limit)
+SESSION_CONFIG: Dict[str, dict] = {
+    "default": {"pool_connections": 4, "pool_maxsize": 16, "max_retries": 4, "backoff_base": 0.5, "backoff_max": 30.0,
+                "min_interval": 0.0},
+    "google": {"pool_connections": 2, "pool_maxsize": 32, "max_retries": 4, "backoff_base": 0.5, "backoff_max": 30.0,
+               "min_interval": 1 / 25},
+    "nominatim": {"pool_connections": 2, "pool_maxsize": 4, "max_retries": 4, "backoff_base": 1.0, "backoff_max": 60.0,
+                  "min_interval": 1.0},
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_sessions: Dict[str, requests.Session] = {}
+_counters: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def configure_session(provider: str, **options) -> None:
+    """調整某個服務的連線池/重試設定;已建立的 session 會在下次使用時重建。"""
+    with _lock:
+        base = SESSION_CONFIG.get(provider, SESSION_CONFIG["default"])
+        SESSION_CONFIG[provider] = {**base, **options}
+        session = _sessions.pop(provider, None)
+    if session is not None:
+        session.close()
+
+
+def set_rate_limit(provider: str, qps: float) -> None:
+    """依該服務的每秒請求數上限設定重試的最短等待 (不重建 session)。"""
+    with _lock:
+        base = SESSION_CONFIG.get(provider, SESSION_CONFIG["default"])
+        SESSION_CONFIG[provider] = {**base, "min_interval": 1.0 / qps if qps > 0 else 0.0}
+
+
+def _config(provider: str) -> dict:
+    return SESSION_CONFIG.get(provider, SESSION_CONFIG["default"])
+
+
+def get_session(provider: str) -> requests.Session:
+    """取得該服務共用的 Session (keep-alive 連線池),第一次使用時建立。"""
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            config = _config(provider)
+            session = requests.Session()
+            # 重試由 http_get 自行處理,以便計數與遵守 Retry-After
+            adapter = HTTPAdapter(pool_connections=config["pool_connections"],
+                                  pool_maxsize=config["pool_maxsize"], max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+            _counters.setdefault(provider, {"requests": 0, "retries": 0, "failures": 0})
+        return session
+
+
+def _retry_after_seconds(resp: Optional[requests.Response]) -> Optional[float]:
+    """解析 Retry-After 標頭 (秒數或 HTTP 日期)。"""
+    if resp is None:
+        return None
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(config: dict, attempt: int, resp: Optional[requests.Response]) -> float:
+    floor = config.get("min_interval", 0.0)
+    retry_after = _retry_after_seconds(resp)
+    if retry_after is not None:
+        return max(floor, min(retry_after, config["backoff_max"]))
+    # 指數退避 + full jitter,避免多個執行緒同時重試;不短於限速的請求間隔
+    ceiling = min(config["backoff_max"], config["backoff_base"] * (2 ** attempt))
+    return max(floor, random.uniform(0, ceiling))
+
+
+def _count(provider: str, key: str) -> None:
+    with _lock:
+        _counters[provider][key] += 1
+
+
+def http_get(provider: str, url: str, params=None, headers=None, timeout: float = 10) -> requests.Response:
+    """
+    以該服務共用的 Session 發出 GET,遇到暫時性錯誤時依設定重試。
+    重試用盡後:HTTP 錯誤回傳最後一次的 response (由呼叫端 raise_for_status),連線錯誤則拋出例外。
+    """
+    session = get_session(provider)
+    config = _config(provider)
+    attempt = 0
+    while True:
+        _count(provider, "requests")
+        resp = None
+        start = time.perf_counter()
+        try:
+            resp = session.get(url, params=params, headers=headers, timeout=timeout)
+            # 每次嘗試 (含重試) 各記一筆延遲,依 HTTP 狀態分類
+            metrics.observe("http_request_seconds", time.perf_counter() - start,
+                            provider=provider, status=f"{resp.status_code // 100}xx")
+            if resp.status_code not in RETRY_STATUS:
+                return resp
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.observe("http_request_seconds", time.perf_counter() - start,
+                            provider=provider, status=type(e).__name__)
+            if attempt >= config["max_retries"]:
+                _count(provider, "failures")
+                metrics.inc("http_failures_total", provider=provider)
+                raise
+        if attempt >= config["max_retries"]:
+            _count(provider, "failures")
+            metrics.inc("http_failures_total", provider=provider)
+            return resp
+        delay = _backoff_delay(config, attempt, resp)
+        if resp is not None:
+            resp.close()
+        attempt += 1
+        _count(provider, "retries")
+        metrics.inc("http_retries_total", provider=provider)
+        time.sleep(delay)
+
+
+def session_stats() -> Dict[str, dict]:
+    """
+    各服務的請求統計:requests (含重試)、retries、failures,
+    以及連線池的 connections_opened 與 connections_reused (= 請求數 - 新建連線數)。
+    """
+    stats = {}
+    with _lock:
+        items = list(_sessions.items())
+        counters = {k: dict(v) for k, v in _counters.items()}
+    for provider, session in items:
+        opened = served = 0
+        adapter = session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                served += pool.num_requests
+        stats[provider] = {
+            **counters.get(provider, {}),
+            "connections_opened": opened,
+            "connections_reused": max(0, served - opened),
+        }
+    return stats
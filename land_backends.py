@@ -0,0 +1,208 @@
+import html
+import json
+import os
+import re
+from typing import Optional
+
+import requests
+
+import metrics
+
+from land_parser import parse_land_info
+from twd97 import complete_coordinates
+
+# HttpLandBackend 使用的相容查詢端點 (見 HttpLandBackend)，沒有預設值
+LAND_QUERY_URL = os.getenv("LAND_QUERY_URL", "")
+
+# parse_land_info 產出的欄位
+LAND_INFO_FIELDS = (
+    "行政區", "經度_WGS84", "緯度_WGS84", "經緯度_DMS",
+    "國土利用", "TWD97_E", "TWD97_N", "所屬所", "地段", "地號",
+)
+
+
+class LandBackend:
+    """地號 -> 經緯度查詢的共同介面，lookup 回傳與 parse_land_info 相同格式的 dict。"""
+
+    def lookup(self, data: dict) -> dict:
+        raise NotImplementedError
+
+    def open(self) -> None:
+        """預先建立連線或瀏覽器 (常駐服務啟動時呼叫)，預設不做事。"""
+
+    def recover(self, fresh: bool = False) -> bool:
+        """
+        查詢失敗後恢復可查詢的狀態，供 query_with_retries 使用；回傳 False 表示無法恢復。
+        fresh=True 時盡量回到全新的狀態 (例如重新載入頁面)。
+        """
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SeleniumLandBackend(LandBackend):
+    """
+    透過 Chrome 操作國土測繪圖資服務雲頁面 (原本的 location2lat_chrome 流程)。
+    location2latlng (與 Selenium) 在建立此後端時才載入，只用 HttpLandBackend 時不需要。
+    """
+
+    def __init__(self, url: Optional[str] = None, headless: bool = False, wait_profile="safe",
+                 extract: str = "webdriver"):
+        import location2latlng
+
+        self._web = location2latlng
+        self.url = url or location2latlng.NLSC_URL
+        self.headless = headless
+        self.wait_profile = wait_profile
+        self.extract = extract
+        self.driver = None
+
+    def _ensure_driver(self):
+        if self.driver is None:
+            self.driver = self._web.set_chrome_options(headless=self.headless)
+            self._web.initialize_web(self.driver, self.url, self.wait_profile)
+            self._web.open_query_panel(self.driver, self.wait_profile)
+        return self.driver
+
+    def lookup(self, data: dict) -> dict:
+        return self._web.query_land(self._ensure_driver(), data, self.wait_profile, extract=self.extract)
+
+    def open(self) -> None:
+        self._ensure_driver()
+
+    def recover(self, fresh: bool = False) -> bool:
+        """瀏覽器仍有回應時重新打開查詢視窗 (fresh 時先重新載入頁面)，否則重新啟動瀏覽器。"""
+        if self.driver is not None and self._web._driver_alive(self.driver):
+            try:
+                if fresh:
+                    self._web.initialize_web(self.driver, self.url, self.wait_profile)
+                self._web.open_query_panel(self.driver, self.wait_profile)
+                return True
+            except Exception as e:
+                print("重新打開查詢視窗失敗：", e)
+        try:
+            self.close()
+        except Exception:
+            self.driver = None
+        metrics.inc("chrome_restarts_total")
+        try:
+            self._ensure_driver()
+            return True
+        except Exception as e:
+            print("瀏覽器重新啟動失敗：", e)
+            self.driver = None
+            return False
+
+    def close(self) -> None:
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+
+def html_to_text(content: str) -> str:
+    """把查詢回應的 HTML 轉成與頁面 .text 相近的純文字，供 parse_land_info 解析。"""
+    content = re.sub(r"(?is)<(script|style).*?</\1>", "", content)
+    content = re.sub(r"(?i)<br\s*/?>|</(p|div|tr|li|h\d)>", "\n", content)
+    content = re.sub(r"(?i)</t[dh]>", " ", content)
+    content = re.sub(r"<[^>]+>", "", content)
+    content = html.unescape(content)
+    lines = [" ".join(line.split()) for line in content.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def parse_land_response(content_type: str, body: str, payload=None) -> dict:
+    """
+    解析查詢回應：
+    - JSON 且已含 parse_land_info 欄位時直接取用
+    - JSON 中包含整段結果文字 (text / html 欄位) 時解析該文字
+    - 其他情況視為 HTML/純文字頁面
+    """
+    if payload is None and "json" in (content_type or ""):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+
+    if isinstance(payload, list):
+        payload = payload[0] if payload else None
+    if isinstance(payload, dict):
+        result = {k: payload[k] for k in LAND_INFO_FIELDS if payload.get(k) not in (None, "")}
+        if result:
+            for k in ("經度_WGS84", "緯度_WGS84", "TWD97_E", "TWD97_N"):
+                if k in result:
+                    result[k] = float(result[k])
+            return result
+        for k in ("text", "html", "content"):
+            if isinstance(payload.get(k), str):
+                return parse_land_info(html_to_text(payload[k]))
+        return {}
+    return parse_land_info(html_to_text(body))
+
+
+class HttpLandBackend(LandBackend):
+    """
+    呼叫「相容的」地號查詢 HTTP 端點並解析回應，不需要瀏覽器。
+
+    這不是國土測繪圖資服務雲的用戶端：國土測繪中心的查詢協定未在此實作，
+    query_url 須指向依下列約定回應的服務 (例如自建的查詢代理，或 bench_mock_services 的 /nlsc/query)：
+      請求: GET (或 POST) 參數 city / area / section / landcode (見 build_params，可覆寫)
+      回應: 含 parse_land_info 欄位的 JSON、含 text / html / content 文字的 JSON，
+            或詳細資料的 HTML / 純文字 (見 parse_land_response)
+    query_url 未指定時使用環境變數 LAND_QUERY_URL。
+    沒有可用的公開端點，因此命令列 (latlng2address.py、lookup_server.py) 不提供此後端，
+    只供程式呼叫與效能測試 (bench_pipeline.py --backend http 搭配模擬服務) 使用。
+    """
+
+    def __init__(self, query_url: Optional[str] = None, session: Optional[requests.Session] = None,
+                 timeout: float = 10, method: str = "GET"):
+        self.query_url = query_url or LAND_QUERY_URL
+        if not self.query_url:
+            raise ValueError("未設定相容的地號查詢端點，請傳入 query_url 或設定環境變數 LAND_QUERY_URL")
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.method = method.upper()
+
+    def build_params(self, data: dict) -> dict:
+        """相容端點的查詢參數；對接其他格式的服務時覆寫此方法。"""
+        return {
+            "city": data.get("city", ""),
+            "area": data.get("area", ""),
+            "section": data.get("section", ""),
+            "landcode": data.get("landcode", ""),
+        }
+
+    @metrics.timed("land_query_seconds", backend="http")
+    def lookup(self, data: dict) -> dict:
+        params = self.build_params(data)
+        if self.method == "POST":
+            resp = self.session.post(self.query_url, data=params, timeout=self.timeout)
+        else:
+            resp = self.session.get(self.query_url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        # 未標示編碼時 requests 會假設 ISO-8859-1，中文會變亂碼
+        if not resp.encoding or resp.encoding.lower() == "iso-8859-1":
+            resp.encoding = "utf-8"
+        return complete_coordinates(parse_land_response(resp.headers.get("Content-Type", ""), resp.text))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+BACKENDS = {
+    "selenium": SeleniumLandBackend,
+    "http": HttpLandBackend,
+}
+
+
+def get_backend(name: str = "selenium", **kwargs) -> LandBackend:
+    """依名稱建立查詢後端："selenium" 或 "http"。"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的查詢後端: {name} (可用: {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,111 @@
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+# 所有欄位合併成一個預先編譯的 pattern,以 findall 掃描一次取得全部欄位。
+# 詳細資料中每個欄位通常各佔一行,因此只在行首嘗試比對 (每行開頭只比對一次,不必逐字元嘗試所有分支);
+# 欄位不在行首 (例如查詢結果視窗把多個欄位排在同一行) 時,由下方的個別 pattern 補查。
+_LAND_INFO_RE = re.compile(
+    r'^[ \t]*(?:'
+    r'行政區:(?P<district>.+)'
+    r'|經緯度WGS84:(?P<lng>\d+\.\d+),(?P<lat>\d+\.\d+)'
+    r'|經緯度:(?P<dms>.+)'
+    r'|國土利用現況調查:(?P<land_use>.+)'
+    r'|TWD97坐標 E:(?P<twd97_e>\d+\.\d+) N:(?P<twd97_n>\d+\.\d+)'
+    r'|(?P<office>.+所 .+)\s+(?P<section>.+)\s+(?P<landcode>\d+)地號'
+    r')',
+    re.MULTILINE,
+)
+_findall = _LAND_INFO_RE.findall
+
+# 各欄位的個別 pattern (與舊版 parse_land_info 相同),行首掃描沒找到的欄位才在整段文字中搜尋
+_DISTRICT_SEARCH = re.compile(r'行政區:(.+)').search
+_WGS84_SEARCH = re.compile(r'經緯度WGS84:(\d+\.\d+),(\d+\.\d+)').search
+_DMS_SEARCH = re.compile(r'經緯度:(.+)').search
+_LAND_USE_SEARCH = re.compile(r'國土利用現況調查:(.+)').search
+_TWD97_SEARCH = re.compile(r'TWD97坐標 E:(\d+\.\d+) N:(\d+\.\d+)').search
+_OFFICE_SEARCH = re.compile(r'(.+所 .+)\s+(.+)\s+(\d+)地號').search
+# 直接以 tuple 建立 NamedTuple,省去關鍵字參數的處理
+_make = tuple.__new__
+
+# LandInfo 各欄位依序對應的 parse_land_info dict 鍵 (順序與舊版輸出相同)
+_DICT_KEYS = (
+    "行政區", "經度_WGS84", "緯度_WGS84", "經緯度_DMS", "國土利用",
+    "TWD97_E", "TWD97_N", "所屬所", "地段", "地號",
+)
+
+
+class LandInfo(NamedTuple):
+    """地號詳細資料解析結果,找不到的欄位為 None。"""
+    district: Optional[str] = None      # 行政區
+    lng: Optional[float] = None         # 經度 (WGS84)
+    lat: Optional[float] = None         # 緯度 (WGS84)
+    dms: Optional[str] = None           # 經緯度 (度分秒)
+    land_use: Optional[str] = None      # 國土利用現況調查
+    twd97_e: Optional[float] = None     # TWD97 E
+    twd97_n: Optional[float] = None     # TWD97 N
+    office: Optional[str] = None        # 所屬所
+    section: Optional[str] = None       # 地段
+    landcode: Optional[str] = None      # 地號
+
+    def to_dict(self) -> dict:
+        """轉成 parse_land_info 的 dict 格式 (只包含有值的欄位)。"""
+        return {key: value for key, value in zip(_DICT_KEYS, self) if value is not None}
+
+
+def parse_land_record(text: str) -> LandInfo:
+    """
+    將查詢結果文字解析成 LandInfo,各欄位取第一次出現的值。
+    findall 在 C 層一次取出所有分支的群組 (未命中的群組為空字串),依哪個群組有值判斷是哪個欄位;
+    仍缺少的欄位再以個別 pattern 搜尋整段文字。
+    """
+    district = lng = lat = dms = land_use = twd97_e = twd97_n = office = section = landcode = None
+    for d, lg, la, dm, lu, te, tn, of, se, lc in _findall(text):
+        if d:
+            if district is None:
+                district = d.strip()
+        elif la:
+            if lat is None:
+                lng, lat = float(lg), float(la)
+        elif dm:
+            if dms is None:
+                dms = dm.strip()
+        elif lu:
+            if land_use is None:
+                land_use = lu.strip()
+        elif tn:
+            if twd97_n is None:
+                twd97_e, twd97_n = float(te), float(tn)
+        elif landcode is None:
+            office, section, landcode = of.strip(), se.strip(), lc
+
+    # 行首掃描沒找到的欄位,改在整段文字中搜尋 (結果與舊版逐欄 re.search 相同)
+    if district is None and (m := _DISTRICT_SEARCH(text)):
+        district = m.group(1).strip()
+    if lat is None and (m := _WGS84_SEARCH(text)):
+        lng, lat = float(m.group(1)), float(m.group(2))
+    if dms is None and (m := _DMS_SEARCH(text)):
+        dms = m.group(1).strip()
+    if land_use is None and (m := _LAND_USE_SEARCH(text)):
+        land_use = m.group(1).strip()
+    if twd97_n is None and (m := _TWD97_SEARCH(text)):
+        twd97_e, twd97_n = float(m.group(1)), float(m.group(2))
+    if landcode is None and (m := _OFFICE_SEARCH(text)):
+        office, section, landcode = m.group(1).strip(), m.group(2).strip(), m.group(3).strip()
+    return _make(LandInfo, (district, lng, lat, dms, land_use, twd97_e, twd97_n, office, section, landcode))
+
+
+def parse_land_info(text: str) -> dict:
+    """
+    將查詢結果文字解析成欄位字典
+
+    text: 查詢結果整段文字
+    回傳: dict，欄位如下：
+        行政區、經度_WGS84、緯度_WGS84、經緯度_DMS、
+        國土利用、TWD97_E、TWD97_N、所屬所、地段、地號
+    """
+    return parse_land_record(text).to_dict()
+
+
+def parse_many(texts: Iterable[str]) -> List[LandInfo]:
+    """批次解析多段查詢結果文字。"""
+    return [parse_land_record(text) for text in texts]
@@ -2,15 +2,24 @@ import os
 import json
 import time
 import requests
-import math
-from typing import Optional, Tuple
-import pandas as pd
+from typing import TYPE_CHECKING, Optional, Tuple
+import numpy as np
 
-# 假設 location2latlng 模組已存在且包含 location2lat 函式
-from location2latlng import location2lat
+# pandas 與 location2latlng (Selenium) 只在主程式中載入,
+# 只用到地理編碼或 haversine_distance 的呼叫端不需付出載入成本
+if TYPE_CHECKING:
+    import pandas as pd
+
+from geocode_cache import MISS, get_default_cache
+from http_session import http_get
+import metrics
 
 CONFIG_PATH = "config.json"
 
+# 服務端點 (可用環境變數改為其他位址,例如 bench_pipeline.py 的本地模擬服務)
+GOOGLE_GEOCODE_URL = os.getenv("GOOGLE_GEOCODE_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+
 ## --------------------------- API Key 載入 ---------------------------
 
 def load_api_key() -> Optional[str]:
@@ -32,16 +41,24 @@ def load_api_key() -> Optional[str]:
 
 ## --------------------------- 反向地理編碼 (Reverse Geocoding: 經緯度 -> 地址) ---------------------------
 
-def reverse_geocode_google(lat: float, lng: float, api_key: str, language: str = "zh-TW", timeout: int = 10) -> Optional[str]:
+@metrics.timed("geocode_seconds", provider="google", op="reverse")
+def reverse_geocode_google(lat: float, lng: float, api_key: str, language: str = "zh-TW", timeout: int = 10,
+                           use_cache: bool = True) -> Optional[str]:
     """呼叫 Google Geocoding API,回傳 formatted_address 或 None"""
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
+    cache = get_default_cache() if use_cache else None
+    if cache:
+        key = cache.reverse_key("google", lat, lng, language)
+        cached = cache.get(key)
+        if cached is not MISS:
+            return cached
+    url = GOOGLE_GEOCODE_URL
     params = {
         "latlng": f"{lat},{lng}",
         "key": api_key,
         "language": language
     }
     try:
-        resp = requests.get(url, params=params, timeout=timeout)
+        resp = http_get("google", url, params=params, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         status = data.get("status")
@@ -51,6 +68,8 @@ def reverse_geocode_google(lat: float, lng: float, api_key: str, language: str =
                 addr = results[0].get("formatted_address")
                 # 移除地址開頭的國家名稱
                 addr = addr[5:]
+                if cache:
+                    cache.set(key, addr)
                 return addr
             return None
         else:
@@ -60,12 +79,19 @@ def reverse_geocode_google(lat: float, lng: float, api_key: str, language: str =
         print(f"呼叫 Google Geocoding API 發生網路錯誤: {e}")
         return None
 
-def reverse_geocode_nominatim(lat: float, lng: float, timeout: int = 10) -> Optional[dict]:
+@metrics.timed("geocode_seconds", provider="nominatim", op="reverse")
+def reverse_geocode_nominatim(lat: float, lng: float, timeout: int = 10, use_cache: bool = True) -> Optional[dict]:
     """
     備援:使用 OpenStreetMap Nominatim 服務
     回傳字典包含原始地址和格式化地址
     """
-    url = "https://nominatim.openstreetmap.org/reverse"
+    cache = get_default_cache() if use_cache else None
+    if cache:
+        key = cache.reverse_key("nominatim", lat, lng, "zh-TW")
+        cached = cache.get(key)
+        if cached is not MISS:
+            return cached
+    url = f"{NOMINATIM_BASE_URL}/reverse"
     params = {
         "lat": lat,
         "lon": lng,
@@ -78,15 +104,18 @@ def reverse_geocode_nominatim(lat: float, lng: float, timeout: int = 10) -> Opti
         "User-Agent": "my-reverse-geocode-app/1.0 (zhandezhonghenry@gmail.com)"
     }
     try:
-        resp = requests.get(url, params=params, headers=headers, timeout=timeout)
+        resp = http_get("nominatim", url, params=params, headers=headers, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         original_addr = data.get("display_name")
         formatted_addr = reverse_foreign_address(original_addr)
-        return {
+        result = {
             "original": original_addr,  # 保留原始地址用於回轉查詢
             "formatted": formatted_addr  # 格式化地址用於顯示
         }
+        if cache and original_addr:
+            cache.set(key, result)
+        return result
     except requests.RequestException as e:
         print(f"Nominatim 呼叫失敗: {e}")
         return None
@@ -133,23 +162,33 @@ def reverse_foreign_address(address: str) -> str:
 
 ## --------------------------- 地理編碼 (Geocoding: 地址 -> 經緯度) ---------------------------
 
-def geocode_google(address: str, api_key: str, language: str = "zh-TW", timeout: int = 10) -> Optional[Tuple[float, float]]:
+@metrics.timed("geocode_seconds", provider="google", op="forward")
+def geocode_google(address: str, api_key: str, language: str = "zh-TW", timeout: int = 10,
+                   use_cache: bool = True) -> Optional[Tuple[float, float]]:
     """呼叫 Google Geocoding API,將地址轉換回 (緯度, 經度) 或 None"""
     if not address: return None
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
+    cache = get_default_cache() if use_cache else None
+    if cache:
+        key = cache.forward_key("google", address)
+        cached = cache.get(key)
+        if cached is not MISS:
+            return tuple(cached)
+    url = GOOGLE_GEOCODE_URL
     params = {
         "address": address,
         "key": api_key,
         "language": language
     }
     try:
-        resp = requests.get(url, params=params, timeout=timeout)
+        resp = http_get("google", url, params=params, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         if data.get("status") == "OK":
             results = data.get("results", [])
             if results:
                 location = results[0]["geometry"]["location"]
+                if cache:
+                    cache.set(key, [location["lat"], location["lng"]])
                 # 回傳 (緯度, 經度)
                 return location["lat"], location["lng"]
         return None
@@ -157,10 +196,17 @@ def geocode_google(address: str, api_key: str, language: str = "zh-TW", timeout:
         print(f"呼叫 Google Geocoding API 發生網路錯誤: {e}")
         return None
 
-def geocode_nominatim(address: str, timeout: int = 10) -> Optional[Tuple[float, float]]:
+@metrics.timed("geocode_seconds", provider="nominatim", op="forward")
+def geocode_nominatim(address: str, timeout: int = 10, use_cache: bool = True) -> Optional[Tuple[float, float]]:
     """使用 Nominatim(OpenStreetMap)將地址轉換回 (緯度, 經度) 或 None"""
     if not address: return None
-    url = "https://nominatim.openstreetmap.org/search"
+    cache = get_default_cache() if use_cache else None
+    if cache:
+        key = cache.forward_key("nominatim", address)
+        cached = cache.get(key)
+        if cached is not MISS:
+            return tuple(cached)
+    url = f"{NOMINATIM_BASE_URL}/search"
     headers = {
         "User-Agent": "my-reverse-geocode-app/1.0 (zhandezhonghenry@gmail.com)"
     }
@@ -171,12 +217,15 @@ def geocode_nominatim(address: str, timeout: int = 10) -> Optional[Tuple[float,
         "accept-language": "zh-TW"
     }
     try:
-        resp = requests.get(url, params=params, headers=headers, timeout=timeout)
+        resp = http_get("nominatim", url, params=params, headers=headers, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
         if data:
             # Nominatim 回傳的 lat/lon 是字串,需轉成浮點數
-            return float(data[0]["lat"]), float(data[0]["lon"])
+            latlng = float(data[0]["lat"]), float(data[0]["lon"])
+            if cache:
+                cache.set(key, list(latlng))
+            return latlng
         return None
     except requests.RequestException as e:
         print(f"Nominatim Geocoding 呼叫失敗: {e}")
@@ -187,34 +236,355 @@ def geocode_nominatim(address: str, timeout: int = 10) -> Optional[Tuple[float,
 
 ## --------------------------- 距離計算 ---------------------------
 
-def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+def haversine_distance_batch(lat1, lng1, lat2, lng2) -> np.ndarray:
     """
-    使用 Haversine 公式計算兩組經緯度之間的距離。
-    回傳單位:公尺 (m)
+    向量化的 Haversine 距離:參數可為純量或等長的陣列,一次計算所有距離。
+    缺值 (NaN) 的位置結果為 NaN。回傳單位:公尺 (m)
     """
     # 地球半徑 (km)
     R = 6371.0
 
     # 將經緯度從角度轉換為弧度
-    lat1_rad = math.radians(lat1)
-    lng1_rad = math.radians(lng1)
-    lat2_rad = math.radians(lat2)
-    lng2_rad = math.radians(lng2)
+    lat1_rad = np.radians(np.asarray(lat1, dtype=np.float64))
+    lng1_rad = np.radians(np.asarray(lng1, dtype=np.float64))
+    lat2_rad = np.radians(np.asarray(lat2, dtype=np.float64))
+    lng2_rad = np.radians(np.asarray(lng2, dtype=np.float64))
 
     # 經緯度差值
     d_lat = lat2_rad - lat1_rad
     d_lng = lng2_rad - lng1_rad
 
     # Haversine 公式
-    a = math.sin(d_lat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(d_lng / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    a = np.sin(d_lat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(d_lng / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return R * c * 1000 # 轉換為公尺 (m)
 
-    distance_km = R * c
-    return distance_km * 1000 # 轉換為公尺 (m)
+def haversine_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    使用 Haversine 公式計算兩組經緯度之間的距離。
+    回傳單位:公尺 (m)
+    """
+    return float(haversine_distance_batch(lat1, lng1, lat2, lng2))
+
+## --------------------------- 單筆處理 ---------------------------
+
+RESULT_COLUMNS = [
+    "Google地址",
+    "Nominatim地址",
+    "Nominatim地址_原始",
+    "Google地址_迴轉緯度",
+    "Google地址_迴轉經度",
+    "Nominatim地址_迴轉緯度",
+    "Nominatim地址_迴轉經度",
+    "Google_誤差_m",
+    "Nominatim_誤差_m",
+    "反查來源距離_m",
+]
+
+def build_row_result(lat: float, lng: float, google_addr: Optional[str], nominatim_data: Optional[dict],
+                     re_latlng_g: Optional[Tuple[float, float]], re_latlng_n: Optional[Tuple[float, float]],
+                     source_distance_m: Optional[float] = None) -> dict:
+    """
+    把反向/正向地理編碼的結果整理成一列輸出欄位,並計算地址迴轉誤差 (公尺)。
+    source_distance_m: 地址沿用鄰近地號的反查結果時,該地號與本筆的距離 (公尺)
+    """
+    row = dict.fromkeys(RESULT_COLUMNS)
+    row["Google地址"] = google_addr
+    if source_distance_m is not None:
+        row["反查來源距離_m"] = round(source_distance_m, 2)
+    if nominatim_data:
+        row["Nominatim地址"] = nominatim_data["formatted"]
+        row["Nominatim地址_原始"] = nominatim_data["original"]
+
+    if re_latlng_g:
+        re_lat_g, re_lng_g = re_latlng_g
+        row["Google地址_迴轉緯度"] = re_lat_g
+        row["Google地址_迴轉經度"] = re_lng_g
+        row["Google_誤差_m"] = round(haversine_distance(lat, lng, re_lat_g, re_lng_g), 2)
+
+    if re_latlng_n:
+        re_lat_n, re_lng_n = re_latlng_n
+        row["Nominatim地址_迴轉緯度"] = re_lat_n
+        row["Nominatim地址_迴轉經度"] = re_lng_n
+        row["Nominatim_誤差_m"] = round(haversine_distance(lat, lng, re_lat_n, re_lng_n), 2)
+    return row
+
+def geocode_row(lat: float, lng: float, api_key: Optional[str]) -> dict:
+    """單筆經緯度:反向地理編碼取得地址,再把地址轉回經緯度計算誤差 (同步版本)。"""
+    addresses = reverse_geocode_both(lat, lng, api_key)
+    google_addr = addresses["google"]
+    nominatim_data = addresses["nominatim"]
+
+    re_latlng_g = geocode_google(google_addr, api_key) if google_addr and api_key else None
+    # Nominatim 使用原始地址進行回轉
+    re_latlng_n = geocode_nominatim(nominatim_data["original"]) if nominatim_data else None
+    return build_row_result(lat, lng, google_addr, nominatim_data, re_latlng_g, re_latlng_n)
+
+## --------------------------- 結果欄位組裝 ---------------------------
+
+# 數值欄位以 float64 陣列收集 (缺值為 NaN),文字欄位以 object 陣列收集
+FLOAT_COLUMNS = [
+    "原始_經度",
+    "原始_緯度",
+    "Google地址_迴轉緯度",
+    "Google地址_迴轉經度",
+    "Nominatim地址_迴轉緯度",
+    "Nominatim地址_迴轉經度",
+    "Google_誤差_m",      # Google 地址轉回經緯度與原經緯度的距離 (公尺)
+    "Nominatim_誤差_m",   # Nominatim 地址轉回經緯度與原經緯度的距離 (公尺)
+    "反查來源距離_m",     # 沿用鄰近地號的反查地址時,與該地號的距離 (公尺)
+]
+TEXT_COLUMNS = ["Google地址", "Nominatim地址", "Nominatim地址_原始"]
+
+# 有提供本地門牌點索引時才加入的欄位
+LOCAL_FLOAT_COLUMNS = ["本地地址_迴轉緯度", "本地地址_迴轉經度", "本地_誤差_m"]
+LOCAL_TEXT_COLUMNS = ["本地地址"]
+
+def _to_float(value) -> float:
+    return np.nan if value is None else float(value)
+
+def assemble_result_columns(df: "pd.DataFrame", records: dict, keys: Optional[list] = None,
+                            address_index=None, max_distance_m: Optional[float] = None) -> "pd.DataFrame":
+    """
+    把每列的結果 ({index: {"land": ..., "geocode": ...}},例如檢查點內容) 組成整欄寫回 df。
+    keys 有給時,只採用地號與 keys[index] 相同的紀錄。誤差距離以向量化方式一次計算。
+    address_index: 本地門牌點索引 (offline_geocoder.AddressPointIndex),有給時整欄批次查詢本地地址。
+    """
+    n = len(df)
+    floats = {col: np.full(n, np.nan, dtype=np.float64) for col in FLOAT_COLUMNS}
+    texts = {col: np.full(n, None, dtype=object) for col in TEXT_COLUMNS}
+
+    for idx, rec in records.items():
+        if idx >= n or (keys is not None and tuple(rec["parcel"]) != keys[idx]):
+            continue
+        land = rec["land"] or {}
+        geocode = rec["geocode"] or {}
+        floats["原始_緯度"][idx] = _to_float(land.get("緯度_WGS84"))
+        floats["原始_經度"][idx] = _to_float(land.get("經度_WGS84"))
+        for col in ("Google地址_迴轉緯度", "Google地址_迴轉經度", "Nominatim地址_迴轉緯度", "Nominatim地址_迴轉經度",
+                    "反查來源距離_m"):
+            floats[col][idx] = _to_float(geocode.get(col))
+        for col in TEXT_COLUMNS:
+            texts[col][idx] = geocode.get(col)
+
+    floats["Google_誤差_m"] = np.round(haversine_distance_batch(
+        floats["原始_緯度"], floats["原始_經度"], floats["Google地址_迴轉緯度"], floats["Google地址_迴轉經度"]), 2)
+    floats["Nominatim_誤差_m"] = np.round(haversine_distance_batch(
+        floats["原始_緯度"], floats["原始_經度"], floats["Nominatim地址_迴轉緯度"], floats["Nominatim地址_迴轉經度"]), 2)
+
+    if address_index is not None:
+        nearest, _ = address_index.nearest_batch(floats["原始_緯度"], floats["原始_經度"], max_distance_m)
+        found = nearest >= 0
+        texts["本地地址"] = np.array(address_index.addresses(nearest), dtype=object)
+        # 門牌點的地址轉回經緯度即為該點本身的座標
+        for col, source in (("本地地址_迴轉緯度", address_index.lat), ("本地地址_迴轉經度", address_index.lng)):
+            floats[col] = np.full(n, np.nan, dtype=np.float64)
+            floats[col][found] = source[nearest[found]]
+        floats["本地_誤差_m"] = np.round(haversine_distance_batch(
+            floats["原始_緯度"], floats["原始_經度"], floats["本地地址_迴轉緯度"], floats["本地地址_迴轉經度"]), 2)
+
+    return df.assign(**floats, **texts)
+
+
+# 輸出欄位順序: 縣市、區、段、地號、Google地址、Google_誤差_m、Nominatim地址、Nominatim_誤差_m，其他欄位放後面
+OUTPUT_COLUMN_ORDER = [
+    "縣市",
+    "區",
+    "段",
+    "地號",
+    "Google地址",
+    "Google_誤差_m",
+    "Nominatim地址",
+    "Nominatim_誤差_m",
+    "本地地址",
+    "本地_誤差_m",
+    "原始_經度",
+    "原始_緯度",
+    "Google地址_迴轉經度",
+    "Google地址_迴轉緯度",
+    "Nominatim地址_原始",
+    "Nominatim地址_迴轉經度",
+    "Nominatim地址_迴轉緯度",
+    "本地地址_迴轉經度",
+    "本地地址_迴轉緯度",
+    "反查來源距離_m"
+]
+
+def order_result_columns(df: "pd.DataFrame") -> "pd.DataFrame":
+    # 只保留存在於 df 中的欄位，避免 KeyError
+    desired_existing = [c for c in OUTPUT_COLUMN_ORDER if c in df.columns]
+    remaining = [c for c in df.columns if c not in desired_existing]
+    return df[desired_existing + remaining]
+
+## --------------------------- 分塊處理 ---------------------------
+
+def process_chunks(chunks, writer, api_key: Optional[str], land_options: Optional[dict] = None,
+                   rate_limits=None, concurrency: int = 16, buffer_size: int = 32, reuse_radius_m: float = 0.0,
+                   address_index=None, local_max_distance: Optional[float] = None) -> dict:
+    """
+    逐塊處理大型輸入:每塊 (table_io.iter_table_chunks 的 DataFrame) 查地號、地理編碼、組欄位後
+    立即交給 writer (table_io.ResultWriter) 寫出,只有目前這一塊留在記憶體中。
+    每塊各自以 location2lat_stream + geocode_stream 串流處理 (地號查詢與地理編碼同時進行);
+    瀏覽器 (或查詢後端) 與 AsyncGeocoder 只建立一次供所有塊共用 (見 LandSession、geocode_stream_batches),
+    地號與地理編碼快取也跨塊共用,重複的地號不會重查。
+    回傳各狀態 (ok / not_found / error) 的地號筆數。
+    """
+    from async_geocode import geocode_stream_batches
+    from location2latlng import LandSession, location2lat_stream
+    from table_io import data_list_from_frame
+
+    counts = {"ok": 0, "not_found": 0, "error": 0}
+
+    def _land_stream(data_list, session):
+        for record in location2lat_stream(data_list, records=True, session=session, **(land_options or {})):
+            counts[record.status] += 1
+            yield record.index, record.info
+
+    def _batches(session):
+        for chunk in chunks:
+            yield (chunk, time.perf_counter()), _land_stream(data_list_from_frame(chunk), session)
+
+    def _write(tag, land_map, rows):
+        chunk, start = tag
+        records = {j: {"land": land, "geocode": rows.get(j)} for j, land in land_map.items()}
+        writer.write(order_result_columns(assemble_result_columns(
+            chunk.reset_index(drop=True), records, None, address_index, local_max_distance)))
+        metrics.observe("chunk_seconds", time.perf_counter() - start)
+        print(f"已輸出第 {chunk.index[0] + 1}~{chunk.index[-1] + 1} 列 ({time.perf_counter() - start:.1f} 秒),"
+              f"累計 {writer.rows} 列")
+
+    with LandSession() as session:
+        geocode_stream_batches(_batches(session), _write, api_key, rate_limits=rate_limits,
+                               concurrency=concurrency, buffer_size=buffer_size, reuse_radius_m=reuse_radius_m)
+    return counts
 
 ## --------------------------- 主程式執行區塊 ---------------------------
 
 if __name__ == "__main__":
+    import argparse
+    from geocode_cache import GeocodeCache, set_default_cache, DEFAULT_CACHE_PATH
+    from async_geocode import DEFAULT_RATE_LIMITS, geocode_rows, geocode_stream
+    from location2latlng import location2lat_records, location2lat_stream
+    from parcel_cache import parcel_key
+    from checkpoint import CheckpointJournal
+    from http_session import configure_session, session_stats
+    from table_io import data_list_from_frame
+
+    parser = argparse.ArgumentParser(description="地號 -> 經緯度 -> 地址,並計算地址迴轉誤差")
+    parser.add_argument("--no-cache", action="store_true", help="不使用地理編碼快取 (每筆都呼叫 API)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="地理編碼快取檔案位置")
+    parser.add_argument("--cache-precision", type=int, default=6, help="反向查詢快取鍵的經緯度小數位數")
+    parser.add_argument("--no-parcel-cache", action="store_true", help="不使用地號查詢結果快取 (每筆都開瀏覽器查詢)")
+    parser.add_argument("--wait-profile", choices=["fast", "safe"], default="safe",
+                        help="地號查詢頁面的等待設定 (fast: 逾時短、輪詢密;safe: 逾時長)")
+    parser.add_argument("--workers", type=int, default=1, help="平行查詢地號的瀏覽器數量 (>1 時使用 headless)")
+    parser.add_argument("--google-qps", type=float, default=DEFAULT_RATE_LIMITS["google"][0], help="Google 每秒請求數上限")
+    parser.add_argument("--google-burst", type=int, default=DEFAULT_RATE_LIMITS["google"][1], help="Google 瞬間可連發的請求數")
+    parser.add_argument("--nominatim-qps", type=float, default=DEFAULT_RATE_LIMITS["nominatim"][0], help="Nominatim 每秒請求數上限")
+    parser.add_argument("--nominatim-burst", type=int, default=DEFAULT_RATE_LIMITS["nominatim"][1], help="Nominatim 瞬間可連發的請求數")
+    parser.add_argument("--reuse-radius", type=float, default=0.0,
+                        help="反查地址時,沿用此半徑 (公尺) 內已查過地號的地址,不再呼叫 API;0 表示停用")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時處理的列數")
+    parser.add_argument("--stream", action="store_true",
+                        help="串流模式:每查到一筆地號就立即進行地理編碼,查詢與地理編碼同時進行")
+    parser.add_argument("--buffer-size", type=int, default=32, help="串流模式中等待地理編碼的地號數上限")
+    parser.add_argument("--resume", action="store_true", help="從檢查點續跑,跳過上次已完成的列")
+    parser.add_argument("--checkpoint", default=None, help="檢查點檔案位置 (預設為 <Excel 檔名>.checkpoint.jsonl)")
+    parser.add_argument("--coords-only", action="store_true",
+                        help="只取坐標:查詢結果已有坐標時不點開詳細資料 (沒有國土利用、所屬所等欄位)")
+    parser.add_argument("--extract", choices=["webdriver", "js"], default="webdriver",
+                        help="地號查詢結果的擷取方式 (js: 每筆以一次注入的 JavaScript 送出並讀取結果)")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="每筆地號最多查詢幾次 (失敗的地號在整批查完後以重新載入的頁面或新的瀏覽器重試)")
+    parser.add_argument("--address-points", default=None,
+                        help="本地門牌點資料 (CSV / Parquet,欄位: 地址、緯度、經度,或 AddressPointIndex.save 的目錄),"
+                             "有指定時加入本地地址欄位")
+    parser.add_argument("--local-max-distance", type=float, default=100.0,
+                        help="本地門牌點與地號的最大距離 (公尺),超過時本地地址留空;"
+                             "--address-points 為存檔目錄時不能超過建立索引時的 cell_m")
+    parser.add_argument("--input", default=None,
+                        help="分塊模式的輸入檔 (.csv / .parquet / .xlsx);有指定時逐塊讀取並逐塊寫出結果,不整份載入")
+    parser.add_argument("--output", default=None,
+                        help="分塊模式的輸出檔 (.csv / .parquet,預設為 <輸入檔名>.result.csv);--resume 時接續既有的 CSV")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="分塊模式每塊的列數")
+    parser.add_argument("--sheet", default=None, help="分塊模式讀取 xlsx 的工作表名稱 (預設為第一個)")
+    parser.add_argument("--export-xlsx", default=None, help="分塊模式完成後另外轉出的 xlsx 檔 (選用,逐塊寫入)")
+    parser.add_argument("--metrics-json", default=None,
+                        help="執行結束時寫出各步驟耗時與計數的 JSON 摘要 (預設為 <Excel 檔名>.metrics.json)")
+    parser.add_argument("--metrics-prom", default=None,
+                        help="另外寫出 Prometheus text 格式的指標檔 (例如給 node_exporter textfile collector)")
+    parser.add_argument("--pool-size", type=int, default=None, help="每個服務保留的 keep-alive 連線數 (預設依服務設定)")
+    parser.add_argument("--max-retries", type=int, default=None, help="暫時性錯誤 (429/5xx/逾時) 的最多重試次數")
+    args = parser.parse_args()
+
+    for provider in ("google", "nominatim"):
+        session_options = {}
+        if args.pool_size is not None:
+            session_options["pool_maxsize"] = args.pool_size
+        if args.max_retries is not None:
+            session_options["max_retries"] = args.max_retries
+        if session_options:
+            configure_session(provider, **session_options)
+
+    address_index = None
+    if args.address_points:
+        from offline_geocoder import AddressPointIndex
+        address_index = AddressPointIndex.open(args.address_points, cell_m=args.local_max_distance)
+        print(f"已載入本地門牌點 {len(address_index)} 筆。")
+
+    geocode_cache = GeocodeCache(path=args.cache_path, precision=args.cache_precision, bypass=args.no_cache)
+    set_default_cache(geocode_cache)
+
+    # 讀取 API Key (只需讀取一次)
+    google_api_key = load_api_key()
+
+    rate_limits = {
+        "google": (args.google_qps, args.google_burst),
+        "nominatim": (args.nominatim_qps, args.nominatim_burst),
+    }
+    land_options = dict(use_cache=not args.no_parcel_cache, wait_profile=args.wait_profile,
+                        workers=args.workers, coords_only=args.coords_only,
+                        extract=args.extract, max_attempts=args.max_attempts)
+
+    def report_run(output_path: str) -> None:
+        """輸出快取與連線統計,並寫出 metrics 檔。"""
+        stats = geocode_cache.stats()
+        print(f"\n地理編碼快取: 命中 {stats['hits']} 次、未命中 {stats['misses']} 次,共 {stats['entries']} 筆")
+        geocode_cache.close()
+        for provider, counters in session_stats().items():
+            print(f"{provider}: 請求 {counters['requests']} 次、重試 {counters['retries']} 次、失敗 {counters['failures']} 次,"
+                  f"新建連線 {counters['connections_opened']} 條、重用 {counters['connections_reused']} 次")
+
+        registry = metrics.get_metrics()
+        metrics_path = args.metrics_json or f"{output_path}.metrics.json"
+        registry.write_json(metrics_path)
+        print(f"各步驟耗時與計數已寫入 {metrics_path}")
+        if args.metrics_prom:
+            registry.write_prometheus(args.metrics_prom)
+
+    if args.input:
+        # 分塊模式:逐塊讀取輸入、逐塊寫出結果,記憶體用量不隨輸入列數增加
+        # 輸出檔本身即為檢查點:--resume 時跳過已寫出的列數 (以塊為單位寫出)
+        from table_io import ResultWriter, export_xlsx, iter_table_chunks
+
+        output_file = args.output or f"{os.path.splitext(args.input)[0]}.result.csv"
+        with ResultWriter(output_file, append=args.resume) as writer:
+            if writer.rows:
+                print(f"從 {output_file} 續跑:已輸出 {writer.rows} 列。")
+            print(f"⏳ 正在分塊處理 {args.input} (每塊 {args.chunk_size} 列)...")
+            counts = process_chunks(iter_table_chunks(args.input, args.chunk_size, args.sheet, skip=writer.rows),
+                                    writer, google_api_key, land_options, rate_limits=rate_limits,
+                                    concurrency=args.concurrency, buffer_size=args.buffer_size,
+                                    reuse_radius_m=args.reuse_radius, address_index=address_index,
+                                    local_max_distance=args.local_max_distance)
+        print(f"地號查詢:成功 {counts['ok']} 筆、查無坐標 {counts['not_found']} 筆、失敗 {counts['error']} 筆。")
+        report_run(output_file)
+        print(f"\n✅ 結果已輸出到 {output_file} (共 {writer.rows} 列)。")
+        if args.export_xlsx:
+            rows_exported = export_xlsx(output_file, args.export_xlsx, args.chunk_size)
+            print(f"✅ 已另外轉出 {args.export_xlsx} ({rows_exported} 列)。")
+        exit()
 
     excel_file = "locatoin2address.xlsx"
     try:
@@ -223,132 +593,96 @@ if __name__ == "__main__":
         print(f"❌ 錯誤:找不到檔案 {excel_file}。請確認檔案是否存在。")
         exit()
 
-    # 讀取 API Key (只需讀取一次)
-    google_api_key = load_api_key()
 
-    # 建立新的欄位
-    df["原始_經度"] = None
-    df["原始_緯度"] = None
-    df["Google地址"] = None
-    df["Nominatim地址"] = None
-    df["Nominatim地址_原始"] = None  # 新增:儲存 Nominatim 原始地址
-    df["Google地址_迴轉緯度"] = None
-    df["Google地址_迴轉經度"] = None
-    df["Nominatim地址_迴轉緯度"] = None
-    df["Nominatim地址_迴轉經度"] = None
-    df["Google_誤差_m"] = None      # Google 地址轉回經緯度與原經緯度的距離 (公尺)
-    df["Nominatim_誤差_m"] = None   # Nominatim 地址轉回經緯度與原經緯度的距離 (公尺)
-
-
-    # 從 Excel 組 data_list
-    data_list = []
     # 檢查必要的欄位是否存在
     required_cols = ["縣市", "區", "段", "地號"]
     if not all(col in df.columns for col in required_cols):
         print(f"❌ 錯誤:Excel 檔案中缺少必要的欄位 ({', '.join(required_cols)})。")
         exit()
 
-    for _, row in df.iterrows():
-        data_list.append({
-            "city": row["縣市"],
-            "area": row["區"],
-            "section": row["段"],
-            "landcode": str(row["地號"])
-        })
-    
-    # 呼叫 location2lat 取得原始經緯度
-    print("⏳ 正在進行地號轉換經緯度...")
-    results = location2lat(data_list)
+    # 從 Excel 組 data_list (整欄取出,不逐列 iterrows)
+    data_list = data_list_from_frame(df)
+
+
+    # 檢查點:每完成一列就寫入一行,--resume 時跳過已完成的列 (地號需與當時相同)
+    journal = CheckpointJournal(args.checkpoint or f"{excel_file}.checkpoint.jsonl")
+    keys = [parcel_key(data) for data in data_list]
+    if args.resume:
+        done = {idx for idx, rec in journal.load().items()
+                if idx < len(keys) and tuple(rec["parcel"]) == keys[idx]}
+        print(f"從檢查點續跑:已完成 {len(done)} 筆,剩餘 {len(data_list) - len(done)} 筆。")
+    else:
+        journal.reset()
+        done = set()
+    todo = [idx for idx in range(len(data_list)) if idx not in done]
+    todo_data = [data_list[idx] for idx in todo]
+
+    def save_row(idx: int, land: dict, row: dict) -> None:
+        journal.write(idx, keys[idx], land, row)
+        print(f"處理 {df.at[idx,'地號']} → 原始經緯度: {land.get('緯度_WGS84')}, {land.get('經度_WGS84')}"
+              f" | Google 誤差: {row['Google_誤差_m']} 公尺 | Nominatim 誤差: {row['Nominatim_誤差_m']} 公尺")
+
+    if args.stream:
+        # 串流模式:地號查詢與地理編碼同時進行
+        print("⏳ 正在進行地號轉換經緯度與地理編碼 (串流模式)...")
+        land_records = {}
+
+        def _land_stream():
+            # 記下每筆的查詢狀態,地理編碼只需要 (index, 結果)
+            for record in location2lat_stream(todo_data, records=True, **land_options):
+                land_records[record.index] = record
+                yield record.index, record.info
+
+        land_map, _ = geocode_stream(_land_stream(), google_api_key,
+                                     rate_limits=rate_limits, concurrency=args.concurrency,
+                                     buffer_size=args.buffer_size, reuse_radius_m=args.reuse_radius,
+                                     on_result=lambda j, land, row: save_row(todo[j], land, row))
+        results = [land_map.get(j, {}) for j in range(len(todo))]
+        land_records = [land_records.get(j) for j in range(len(todo))]
+    else:
+        # 呼叫 location2lat_records 取得原始經緯度與每筆的查詢狀態
+        print("⏳ 正在進行地號轉換經緯度...")
+        land_records = location2lat_records(todo_data, **land_options)
+        results = [record.info for record in land_records]
     print("✅ 地號轉換經緯度完成。")
 
-    # 填回 Excel
-    for idx, r in enumerate(results):
-        
+    # 查無坐標的列沒有地理編碼結果,直接寫入檢查點 (地理編碼留空),--resume 時不再查詢;
+    # 查詢失敗 (重試後仍失敗) 的列不會寫入檢查點,下次 --resume 時會重新查詢
+    failed = [(todo[j], record) for j, record in enumerate(land_records) if record and record.status == "error"]
+    not_found = 0
+    for j, record in enumerate(land_records):
+        if record and record.status == "not_found":
+            journal.write(todo[j], keys[todo[j]], record.info, None)
+            not_found += 1
+    print(f"地號查詢:成功 {len(todo) - len(failed) - not_found} 筆、查無坐標 {not_found} 筆、失敗 {len(failed)} 筆。")
+    for idx, record in failed:
+        print(f"  ❌ {df.at[idx,'地號']} (嘗試 {record.attempts} 次): {record.error}")
+
+    # 收集成功取得經緯度的列
+    rows = []
+    for j, r in enumerate(results):
         original_lat = r.get("緯度_WGS84")
         original_lng = r.get("經度_WGS84")
-        
+
         # 檢查經緯度是否成功取得
         if original_lat is None or original_lng is None:
-            print(f"\n跳過處理 {df.at[idx,'地號']}:無法取得經緯度。")
+            print(f"\n跳過處理 {df.at[todo[j],'地號']}:無法取得經緯度。")
             continue
-            
-        df.at[idx, "原始_緯度"] = original_lat
-        df.at[idx, "原始_經度"] = original_lng
+        rows.append((j, original_lat, original_lng))
 
-        print(f"\n處理 {df.at[idx,'地號']} → 原始經緯度: {original_lat}, {original_lng}")
-        
-        # 1. 反向地理編碼 (Reverse Geocoding: 經緯度 -> 地址)
-        addresses = reverse_geocode_both(original_lat, original_lng, google_api_key)
-        google_addr = addresses["google"]
-        nominatim_data = addresses["nominatim"]
-        
-        df.at[idx, "Google地址"] = google_addr
-        
-        # 儲存 Nominatim 的原始地址和格式化地址
-        if nominatim_data:
-            df.at[idx, "Nominatim地址"] = nominatim_data["formatted"]
-            df.at[idx, "Nominatim地址_原始"] = nominatim_data["original"]
-            nominatim_addr_for_geocoding = nominatim_data["original"]  # 使用原始地址進行回轉
-        else:
-            nominatim_addr_for_geocoding = None
+    if not args.stream:
+        # 反向/正向地理編碼:各列與各服務並行處理,只由各服務的限速器控制速度
+        print(f"\n⏳ 正在進行地理編碼 ({len(rows)} 筆)...")
+        geocode_rows([(lat, lng) for _, lat, lng in rows], google_api_key,
+                     rate_limits=rate_limits, concurrency=args.concurrency, reuse_radius_m=args.reuse_radius,
+                     on_row=lambda k, row: save_row(todo[rows[k][0]], results[rows[k][0]], row))
 
-        # 2. 地理編碼 (Geocoding: 地址 -> 經緯度) 與距離計算
-        
-        # --- Google 地址處理 ---
-        if google_addr and google_api_key:
-            re_latlng_g = geocode_google(google_addr, google_api_key)
-            if re_latlng_g:
-                re_lat_g, re_lng_g = re_latlng_g
-                df.at[idx, "Google地址_迴轉緯度"] = re_lat_g
-                df.at[idx, "Google地址_迴轉經度"] = re_lng_g
-                
-                # 計算距離 (公尺)
-                distance_g = haversine_distance(original_lat, original_lng, re_lat_g, re_lng_g)
-                df.at[idx, "Google_誤差_m"] = round(distance_g, 2)
-                print(f"  > Google 地址回轉誤差: {round(distance_g, 2)} 公尺")
-
-        time.sleep(1) # Google API 速率限制
-
-        # --- Nominatim 地址處理 (使用原始地址) ---
-        if nominatim_addr_for_geocoding:
-            re_latlng_n = geocode_nominatim(nominatim_addr_for_geocoding)
-            if re_latlng_n:
-                re_lat_n, re_lng_n = re_latlng_n
-                df.at[idx, "Nominatim地址_迴轉緯度"] = re_lat_n
-                df.at[idx, "Nominatim地址_迴轉經度"] = re_lng_n
-
-                # 計算距離 (公尺)
-                distance_n = haversine_distance(original_lat, original_lng, re_lat_n, re_lng_n)
-                df.at[idx, "Nominatim_誤差_m"] = round(distance_n, 2)
-                print(f"  > Nominatim 地址回轉誤差: {round(distance_n, 2)} 公尺")
-            else:
-                print(f"  > Nominatim 無法將原始地址轉回經緯度")
-
-        time.sleep(1) # Nominatim 速率限制
-
-    # 調整欄位順序: 縣市、區、段、地號、Google地址、Google_誤差_m、Nominatim地址、Nominatim_誤差_m，其他欄位放後面
-    desired_first = [
-        "縣市",
-        "區",
-        "段",
-        "地號",
-        "Google地址",
-        "Google_誤差_m",
-        "Nominatim地址",
-        "Nominatim_誤差_m",
-        "原始_經度",
-        "原始_緯度",
-        "Google地址_迴轉經度",
-        "Google地址_迴轉緯度",
-        "Nominatim地址_原始",
-        "Nominatim地址_迴轉經度",
-        "Nominatim地址_迴轉緯度"
-    ]
+    # 由檢查點組出最終結果 (包含之前執行已完成的列),各欄位先收集成陣列再整欄寫入
+    df = assemble_result_columns(df, journal.load(), keys, address_index, args.local_max_distance)
+    journal.close()
 
-    # 只保留存在於 df 中的欄位，避免 KeyError
-    desired_existing = [c for c in desired_first if c in df.columns]
-    remaining = [c for c in df.columns if c not in desired_existing]
-    df = df[desired_existing + remaining]
+    df = order_result_columns(df)
+    report_run(excel_file)
 
     df.to_excel(excel_file, index=False)
     print(f"\n✅ 結果已輸出到 {excel_file},包含地址迴轉誤差分析。")
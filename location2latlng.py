@@ -1,17 +1,73 @@
+import json
+import os
+import threading
 import time
+from typing import NamedTuple, Optional
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import Select, WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import re
+from selenium.common.exceptions import TimeoutException
 
+import metrics
+from land_parser import parse_land_info
+from twd97 import complete_coordinates
+from parcel_cache import get_default_parcel_cache, parcel_key
 
-def set_chrome_options(headless: bool = False):
+
+## --------------------------- chromedriver 路徑 ---------------------------
+
+# 記錄上次解析到的 chromedriver 路徑,之後的執行直接使用,不再每次連網檢查版本
+DRIVER_CACHE_PATH = "chromedriver_path.json"
+
+_driver_path = None
+
+
+def resolve_chromedriver(refresh: bool = False) -> str:
+    """
+    取得 chromedriver 路徑,同一個行程只解析一次。順序:
+      1. 環境變數 CHROMEDRIVER_PATH (固定使用指定的 driver)
+      2. DRIVER_CACHE_PATH 中記錄、且檔案仍存在的路徑
+      3. ChromeDriverManager().install() 下載或檢查版本,並記錄到 DRIVER_CACHE_PATH
+    refresh=True 時略過 2,重新向 ChromeDriverManager 取得 (例如 Chrome 更新後版本不符)。
+    """
+    global _driver_path
+    pinned = os.getenv("CHROMEDRIVER_PATH")
+    if pinned:
+        return pinned
+    if _driver_path and not refresh:
+        return _driver_path
+
+    if not refresh and os.path.exists(DRIVER_CACHE_PATH):
+        try:
+            with open(DRIVER_CACHE_PATH, "r", encoding="utf-8") as f:
+                path = json.load(f).get("path")
+            if path and os.path.exists(path):
+                _driver_path = path
+                return path
+        except (OSError, ValueError) as e:
+            print(f"讀取 {DRIVER_CACHE_PATH} 發生錯誤: {e}")
+
+    # 只有需要下載/檢查時才載入 webdriver_manager
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    _driver_path = ChromeDriverManager().install()
+    try:
+        with open(DRIVER_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"path": _driver_path}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"寫入 {DRIVER_CACHE_PATH} 發生錯誤: {e}")
+    return _driver_path
+
+
+def set_chrome_options(headless: Optional[bool] = None):
+    """headless 未指定時依環境變數 CHROME_HEADLESS (=1 時不顯示視窗)。"""
+    if headless is None:
+        headless = os.getenv("CHROME_HEADLESS", "") == "1"
     chrome_opts = Options()
     if headless:
         chrome_opts.add_argument("--headless=new")  # Selenium 4.12+ 建議 new headless
@@ -19,21 +75,277 @@ def set_chrome_options(headless: bool = False):
     chrome_opts.add_argument("--start-maximized")
     # 可在此加入更多 options (如 user-agent, disable-infobars...)
 
-    # 自動下載並啟用 chromedriver
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_opts)
+    # 使用快取的 chromedriver;啟動失敗 (例如 Chrome 已更新、版本不符) 時重新取得一次
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver()), options=chrome_opts)
+    except Exception as e:
+        if os.getenv("CHROMEDRIVER_PATH"):
+            raise
+        print(f"chromedriver 啟動失敗,重新取得 driver: {e}")
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver(refresh=True)), options=chrome_opts)
     return driver
 
-def initialize_web(driver, url: str):
+# 可用環境變數 NLSC_URL 改為其他位址 (例如 bench_pipeline.py 的本地模擬頁面)
+NLSC_URL = os.getenv("NLSC_URL", "https://maps.nlsc.gov.tw/T09/mapshow.action#")
+
+## --------------------------- 等待設定 ---------------------------
+
+# 每一步改為等待實際的 DOM 條件，而不是固定 sleep；timeout 為單一條件的最長等待秒數
+#   poll: 檢查條件的間隔秒數
+#   esc_pause: 連按 ESC 之間的間隔秒數
+WAIT_PROFILES = {
+    "fast": {"timeout": 5, "poll": 0.05, "esc_pause": 0.02},
+    "safe": {"timeout": 15, "poll": 0.2, "esc_pause": 0.08},
+}
+DEFAULT_WAIT_PROFILE = "safe"
+
+QUERY_MENU_XPATH = '//*[@id="map_header"]/div[4]/ul[3]/li/a'
+SECTION_SELECT_XPATH = '//*[@id="submenu_pos"]/table/tbody/tr[2]/td[2]/span/span[1]/span'
+DETAIL_XPATH = '//*[@id="qryLand_tab1"]/table/tbody/tr[1]/td'
+
+
+def get_wait_profile(profile="safe") -> dict:
+    """profile 可為 "fast" / "safe" 或自訂 dict (缺少的鍵以 safe 補齊)。"""
+    if isinstance(profile, dict):
+        return {**WAIT_PROFILES[DEFAULT_WAIT_PROFILE], **profile}
+    return WAIT_PROFILES[profile]
+
+
+def _make_wait(driver, profile: dict, timeout=None):
+    return WebDriverWait(driver, timeout or profile["timeout"], poll_frequency=profile["poll"])
+
+
+def _press_escape(driver, times: int, pause: float):
+    actions = ActionChains(driver)
+    for _ in range(times):
+        actions.send_keys(Keys.ESCAPE).perform()
+        if pause:
+            time.sleep(pause)  # 避免按太快
+
+
+def _select_has_option(element_id: str, text: str):
+    """條件：<select id=element_id> 的選項中已出現 text (一次 execute_script 完成檢查)。"""
+    script = (
+        "var s = document.getElementById(arguments[0]);"
+        "if (!s) return false;"
+        "for (var i = 0; i < s.options.length; i++) {"
+        "  if (s.options[i].text.trim() === arguments[1]) return true;"
+        "}"
+        "return false;"
+    )
+    return lambda driver: driver.execute_script(script, element_id, text)
+
+
+# 回傳 <select id=arguments[0]> 的 [第一個 <option> 元素, 各選項文字]
+_SELECT_OPTIONS_SCRIPT = (
+    "var s = document.getElementById(arguments[0]);"
+    "if (!s) return [null, []];"
+    "var texts = [];"
+    "for (var i = 0; i < s.options.length; i++) texts.push(s.options[i].text.trim());"
+    "return [s.options.length ? s.options[0] : null, texts];"
+)
+
+
+def _select_snapshot(driver, element_id: str):
+    """記下 <select> 目前的選項 (第一個 <option> 元素與全部選項文字)，供 _select_reloaded 比對。"""
+    try:
+        first, texts = driver.execute_script(_SELECT_OPTIONS_SCRIPT, element_id)
+        return first, texts
+    except Exception:
+        return None, []
+
+
+def _select_reloaded(element_id: str, text: str, snapshot):
+    """
+    條件：<select> 的選項已在 snapshot 之後重新載入 (第一個 <option> 換成新的元素，或選項清單不同)，
+    且出現 text。上層選單改變後用來等下層選單載入新選項；只檢查 text 是否出現時，
+    新舊選項都有的名稱 (例如各縣市都有的 "東區"、"中正區") 會在舊選項上就成立。
+    """
+    old_first, old_texts = snapshot
+
+    def _check(driver):
+        first, texts = driver.execute_script(_SELECT_OPTIONS_SCRIPT, element_id)
+        if text not in texts:
+            return False
+        return texts != old_texts or (first is not None and first != old_first)
+    return _check
+
+
+# 回傳 select2 搜尋結果中文字恰為 arguments[0] 的選項元素
+_SELECT2_MATCHES_SCRIPT = (
+    "var items = document.querySelectorAll('.select2-results__option'), found = [];"
+    "for (var i = 0; i < items.length; i++) {"
+    "  if (items[i].textContent.trim() === arguments[0]) found.push(items[i]);"
+    "}"
+    "return found;"
+)
+
+
+def _select2_results(driver) -> list:
+    """目前頁面上所有 select2 搜尋結果的選項元素。"""
+    return driver.find_elements(By.CLASS_NAME, "select2-results__option")
+
+
+def _select2_result_ready(text: str, old_results=()):
+    """
+    條件：select2 搜尋結果清單中已出現 text 這個段名，且該選項不是 old_results 中的舊元素。
+    區域改變後，上一個區域的搜尋結果可能還留在頁面上，同名的段 (各區常有相同段名) 不能算數。
+    """
+    old_results = set(old_results)
+
+    def _check(driver):
+        return any(item not in old_results for item in driver.execute_script(_SELECT2_MATCHES_SCRIPT, text))
+    return _check
+
+
+def _section_text(rendered: str) -> str:
+    """select2 顯示的段名 (去掉清除選取的 "×" 與前後空白)。"""
+    return (rendered or "").replace("×", "").strip()
+
+
+def _select2_selected(text: str):
+    """條件：select2 顯示的已選段名恰為 text (不能用包含判斷，"後湖段後湖小段" 包含 "後湖段")。"""
+    def _check(driver):
+        rendered = driver.find_element(By.XPATH, SECTION_SELECT_XPATH).text
+        return _section_text(rendered) == text
+    return _check
+
+
+# 一次取得查詢表單目前的縣市、區域與段名 (select2 顯示文字),用來判斷哪些欄位需要重新選擇
+_FORM_STATE_SCRIPT = (
+    "function selected(id) {"
+    "  var s = document.getElementById(id);"
+    "  if (!s || s.selectedIndex < 0) return '';"
+    "  return s.options[s.selectedIndex].text.trim();"
+    "}"
+    "var section = document.evaluate(arguments[0], document, null,"
+    "  XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;"
+    "return [selected('city'), selected('area_office'), section ? section.textContent : ''];"
+)
+
+
+def _form_state(driver):
+    """回傳查詢表單目前的 (縣市, 區域, 段名)。"""
+    try:
+        city, area, section = driver.execute_script(_FORM_STATE_SCRIPT, SECTION_SELECT_XPATH)
+        return city, area, _section_text(section)
+    except Exception:
+        return "", "", ""
+
+
+def group_order(data_list) -> list:
+    """
+    依 (縣市, 區域, 段) 分組後的查詢順序 (data_list 的 index 列表)。
+    同組的地號連續查詢時只需改地號;同組內維持原本的先後順序。
+    """
+    return sorted(range(len(data_list)), key=lambda i: parcel_key(data_list[i])[:3])
+
+
+# 一次 execute_async_script 完成「輸入地號、送出、等結果、點詳細資料、等詳細資料」並回傳文字,
+# 取代逐步的 find_element / click / wait (每一步都是一次 WebDriver 往返)。
+# 參數: 地號, 查詢選單 XPath, 詳細資料 XPath, 逾時 (ms), 輪詢間隔 (ms), 是否只取坐標
+# 回傳: {"info": 查詢結果視窗文字, "detail": 詳細資料文字, "error": 錯誤訊息}
+_EXTRACT_SCRIPT = r"""
+var landcode = arguments[0], menuXPath = arguments[1], detailXPath = arguments[2],
+    timeout = arguments[3], poll = arguments[4], coordsOnly = arguments[5],
+    done = arguments[arguments.length - 1];
+function byXPath(xp) {
+  return document.evaluate(xp, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+function last(selector) {
+  var list = document.querySelectorAll(selector);
+  return list.length ? list[list.length - 1] : null;
+}
+function visible(el) {
+  return !!(el && (el.offsetWidth || el.offsetHeight || el.getClientRects().length));
+}
+var infoText = null;
+function waitFor(check, next, what) {
+  var start = Date.now();
+  (function tick() {
+    var value = null;
+    try { value = check(); } catch (e) {}
+    if (value) return next(value);
+    if (Date.now() - start > timeout) return done({info: infoText, error: '等待逾時: ' + what});
+    setTimeout(tick, poll);
+  })();
+}
+
+var oldInfo = last('[id="DMAPS_Info"]'), oldText = oldInfo ? oldInfo.innerText : '';
+var input = document.getElementById('landcode');
+input.value = landcode;
+input.dispatchEvent(new Event('input', {bubbles: true}));
+input.dispatchEvent(new Event('change', {bubbles: true}));
+document.getElementById('div_cross_query').click();
+
+waitFor(function () {
+  var el = last('[id="DMAPS_Info"]');
+  return el && (el !== oldInfo || el.innerText !== oldText) ? el : null;
+}, function (info) {
+  infoText = info.innerText;
+  if (coordsOnly && /經緯度WGS84:|TWD97坐標/.test(infoText)) return done({info: infoText});
+  // 同 query_exist: 查詢視窗被關掉時重新打開
+  if (!visible(document.getElementById('city'))) {
+    var menu = byXPath(menuXPath);
+    if (menu) menu.click();
+  }
+  var box = last('[id="div_cross"]');
+  // 沒有詳細資料區塊為查無資料 (與 webdriver 流程相同);有區塊卻沒有按鈕視為錯誤
+  if (!box) return done({info: infoText});
+  var button = box.querySelector('input[type="button"]');
+  if (!button) return done({info: infoText, error: '找不到詳細資料按鈕'});
+  var oldDetail = byXPath(detailXPath), oldDetailText = oldDetail ? oldDetail.innerText : '';
+  button.click();
+  waitFor(function () {
+    var el = byXPath(detailXPath);
+    if (!visible(el) || el.innerText.indexOf('經緯度') < 0) return null;
+    return el !== oldDetail || el.innerText !== oldDetailText ? el : null;
+  }, function (detail) {
+    done({info: infoText, detail: detail.innerText});
+  }, '詳細資料');
+}, '查詢結果');
+"""
+
+# 地號查詢結果的擷取方式
+#   webdriver: 逐步以 WebDriver 操作 (原本的流程)
+#   js: 以 _EXTRACT_SCRIPT 一次往返完成
+EXTRACT_MODES = ("webdriver", "js")
+
+
+def _new_element_present(locator, old_element, old_text: str):
+    """條件：元素存在，且與送出前不是同一個元素或內容已更新 (避免拿到上一筆的結果)。"""
+    def _check(driver):
+        elements = driver.find_elements(*locator)
+        if not elements:
+            return False
+        element = elements[-1]
+        if old_element is None or element != old_element:
+            return element
+        return element if element.text != old_text else False
+    return _check
+
+
+def _text_loaded(locator, marker: str):
+    """條件：元素可見且文字已包含 marker (詳細資料載入完成)。"""
+    def _check(driver):
+        element = EC.visibility_of_element_located(locator)(driver)
+        if element and marker in element.text:
+            return element
+        return False
+    return _check
+
+
+def initialize_web(driver, url: str, wait_profile="safe"):
+    profile = get_wait_profile(wait_profile)
     try:
         driver.get(url)
-        time.sleep(0.5)
+        _make_wait(driver, profile).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        _make_wait(driver, profile).until(EC.element_to_be_clickable((By.XPATH, QUERY_MENU_XPATH)))
 
         # 使用 ActionChains 傳送 ESC 鍵（按 5 次）
-        actions = ActionChains(driver)
-        for _ in range(5):
-            actions.send_keys(Keys.ESCAPE).perform()
-            time.sleep(0.08)  # 秒數可調，避免按太快
+        _press_escape(driver, 5, profile["esc_pause"])
 
         # 如果你想確認頁面狀態，可加些檢查 (例如抓 title)
         # print("完成：按下 Esc 5 次。頁面 title:", driver.title)
@@ -42,168 +354,515 @@ def initialize_web(driver, url: str):
 
 
 
-def location2lat_chrome(driver, data_list):
-    """
-    data_list: list of dict, 每個 dict 包含 city、area、section、landcode
-    範例: [{"city":"桃園市","area":"中壢區","section":"大路段","landcode":"815"}]
+def open_query_panel(driver, wait_profile="safe"):
+    """打開地號查詢視窗並等待縣市選單出現。"""
+    profile = get_wait_profile(wait_profile)
+    driver.find_element(By.XPATH, QUERY_MENU_XPATH).click()
+    _make_wait(driver, profile).until(EC.visibility_of_element_located((By.ID, "city")))
+    # js 擷取模式的 execute_async_script 內含兩段等待 (查詢結果、詳細資料)
+    driver.set_script_timeout(profile["timeout"] * 2 + 5)
 
-    回傳: list of dict，每個 dict 是 parse_land_info 的結果
-    """
-    wait = WebDriverWait(driver, 10)
-    results = []  # 用來收集每筆查詢結果的 dict
 
-    try:
-        # 打開查詢頁面
-        driver.find_element(By.XPATH, '//*[@id="map_header"]/div[4]/ul[3]/li/a').click()
-        time.sleep(0.5)
-
-        for data in data_list:
-            city_name = data.get("city", "")
-            area_name = data.get("area", "")
-            section_name = data.get("section", "")
-            landcode_val = data.get("landcode", "")
-
-            # 選擇縣市
-            county_select_elem = driver.find_element(By.ID, "city")
-            county_select = Select(county_select_elem)
+def _extract_js(driver, landcode: str, profile: dict, coords_only: bool) -> dict:
+    """
+    以 _EXTRACT_SCRIPT 一次完成送出與擷取，回傳 parse_land_info 格式的結果 (查無資料為空 dict)。
+    腳本回報錯誤 (等待逾時、找不到詳細資料按鈕) 時拋出 TimeoutException。
+    """
+    result = driver.execute_async_script(
+        _EXTRACT_SCRIPT, landcode, QUERY_MENU_XPATH, DETAIL_XPATH,
+        int(profile["timeout"] * 1000), max(int(profile["poll"] * 1000), 10), coords_only,
+    ) or {}
+    if coords_only and result.get("info"):
+        quick = parse_land_info(result["info"])
+        if quick.get("緯度_WGS84") is not None or quick.get("TWD97_N") is not None:
+            return complete_coordinates(quick)
+    if result.get("detail"):
+        return complete_coordinates(parse_land_info(result["detail"]))
+    if result.get("error"):
+        # 與 webdriver 流程相同,逾時等錯誤直接拋出,由呼叫端排入重試 (不當成查無資料)
+        raise TimeoutException(f"地號 {landcode} 擷取失敗: {result['error']}")
+    return {}
+
+
+@metrics.timed("land_query_seconds")
+def query_land(driver, data, wait_profile="safe", coords_only: bool = False, extract: str = "webdriver") -> dict:
+    """
+    查詢單一地號，回傳 parse_land_info 的結果；找不到詳細資料時回傳空 dict。
+    查詢視窗須已由 open_query_panel 打開。瀏覽器或頁面層級的錯誤會直接拋出，交給呼叫端處理。
+
+    WGS84 / TWD97 / 度分秒三種坐標只要取得其中一種，其餘由 twd97 模組在本地換算補齊。
+    coords_only=True 時，若查詢結果視窗 (DMAPS_Info) 已顯示坐標，就不再點開詳細資料
+    (此時只有坐標欄位，沒有國土利用、所屬所等欄位)。
+    extract="js" 時，選好縣市、區域、段之後的步驟改以一次 execute_async_script 完成 (見 _EXTRACT_SCRIPT)，
+    回傳格式與 "webdriver" 相同。
+    """
+    profile = get_wait_profile(wait_profile)
+    wait = _make_wait(driver, profile)
+
+    city_name = data.get("city", "")
+    area_name = data.get("area", "")
+    section_name = data.get("section", "")
+    landcode_val = data.get("landcode", "")
+
+    # 只重新選擇值有變動的欄位：與上一筆同縣市、區域、段時只需改地號
+    # 上層欄位變動後，下層選單會重新載入，因此下層一律重選
+    with metrics.timer("land_step_seconds", step="form_state"):
+        current_city, current_area, current_section = _form_state(driver)
+    change_city = current_city != city_name
+    change_area = change_city or current_area != area_name
+    change_section = change_area or not section_name or section_name != current_section
+    for field, changed in (("city", change_city), ("area", change_area), ("section", change_section)):
+        if not changed:
+            metrics.inc("land_form_skipped_total", field=field)
+
+    # 上層欄位改變前先記下下層選單目前的選項，之後等它換成新的選項才選擇，避免選到上一個縣市 / 區域的舊選項
+    if change_section:
+        old_results = _select2_results(driver)
+
+    if change_city:
+        # 等縣市選單載入後選擇縣市
+        with metrics.timer("land_step_seconds", step="city"):
+            wait.until(_select_has_option("city", city_name))
+            area_snapshot = _select_snapshot(driver, "area_office")
+            county_select = Select(driver.find_element(By.ID, "city"))
             county_select.select_by_visible_text(city_name)
-            time.sleep(0.5)
 
-            # 選擇區域
-            city_select_elem = driver.find_element(By.ID, "area_office")
-            city_select = Select(city_select_elem)
+    if change_area:
+        # 選擇區域：縣市改變時等區域選單重新載入該縣市的選項
+        with metrics.timer("land_step_seconds", step="area"):
+            if change_city:
+                wait.until(_select_reloaded("area_office", area_name, area_snapshot))
+            else:
+                wait.until(_select_has_option("area_office", area_name))
+            city_select = Select(driver.find_element(By.ID, "area_office"))
             city_select.select_by_visible_text(area_name)
-            time.sleep(0.5)
 
-            # 選擇段名
-            location_select_elem = driver.find_element(By.XPATH, '//*[@id="submenu_pos"]/table/tbody/tr[2]/td[2]/span/span[1]/span')
+    if change_section:
+        # 選擇段名：等搜尋結果出現該段名再按 Enter，並確認已選取
+        with metrics.timer("land_step_seconds", step="section"):
+            location_select_elem = wait.until(EC.element_to_be_clickable((By.XPATH, SECTION_SELECT_XPATH)))
             location_select_elem.click()
-            search_field = driver.find_element(By.CLASS_NAME, "select2-search__field")
+            search_field = wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "select2-search__field")))
             search_field.clear()
             search_field.send_keys(section_name)
+            wait.until(_select2_result_ready(section_name, old_results))
             search_field.send_keys(Keys.ENTER)
-            time.sleep(0.5)
-
-            # 輸入地號
-            landcode_elem = driver.find_element(By.ID, "landcode")
-            landcode_elem.click()
-            landcode_elem.clear()
-            landcode_elem.send_keys(landcode_val)
-            time.sleep(0.5)
-
-            # 按送出
-            submit_btn = driver.find_element(By.ID, "div_cross_query")
-            submit_btn.click()
-            print(f"查詢 {city_name} {area_name} {section_name} {landcode_val}")
-            time.sleep(1)
-
-            # 等待查詢結果
-            wait.until(EC.presence_of_element_located((By.ID, "DMAPS_Info")))
-            actions = ActionChains(driver)
-            for _ in range(3):
-                actions.send_keys(Keys.ESCAPE).perform()
-                time.sleep(0.08)
-
-            query_exist(driver)  # 你的檢查函式
-
-            # 找所有 div_cross(詳細按鈕)
-            div_cross_list = driver.find_elements(By.XPATH, '//*[@id="div_cross"]')
-            if div_cross_list:
-                last_div = div_cross_list[-1]  # 取最後一個
-                try:
-                    # 按下 ESC 鍵關閉可能的彈跳視窗
-                    actions = ActionChains(driver)
-                    actions.send_keys(Keys.ESCAPE).perform()
-                    time.sleep(0.08)
-
-                    # 點擊最後一個 div_cross 裡的第一個按鈕
-                    button = last_div.find_element(By.XPATH, './/input[@type="button"][1]')
-                    button.click()
-
-                    # 等待詳細資訊出現
-                    div_imfo = wait.until(
-                        EC.visibility_of_element_located((By.XPATH, '//*[@id="qryLand_tab1"]/table/tbody/tr[1]/td'))
-                    )
-                    # 解析文字成 dict
-                    div_imfo_dict = parse_land_info(div_imfo.text)
-                    results.append(div_imfo_dict)  # 收集結果
-                    time.sleep(1)
-
-                except Exception as e:
-                    print(f"最後一個 div_cross 找不到按鈕，錯誤: {e}")
+            wait.until(_select2_selected(section_name))
+
+    if extract == "js":
+        print(f"查詢 {city_name} {area_name} {section_name} {landcode_val}")
+        with metrics.timer("land_step_seconds", step="js_extract"):
+            return _extract_js(driver, str(landcode_val), profile, coords_only)
+
+    # 輸入地號
+    with metrics.timer("land_step_seconds", step="landcode"):
+        landcode_elem = driver.find_element(By.ID, "landcode")
+        landcode_elem.click()
+        landcode_elem.clear()
+        landcode_elem.send_keys(landcode_val)
+
+        # 記下送出前的結果視窗，用來判斷新結果是否已出現
+        old_info = driver.find_elements(By.ID, "DMAPS_Info")
+        old_info = old_info[-1] if old_info else None
+        old_text = old_info.text if old_info is not None else ""
+
+    # 按送出並等待查詢結果
+    with metrics.timer("land_step_seconds", step="submit"):
+        submit_btn = driver.find_element(By.ID, "div_cross_query")
+        submit_btn.click()
+        print(f"查詢 {city_name} {area_name} {section_name} {landcode_val}")
+        info_elem = wait.until(_new_element_present((By.ID, "DMAPS_Info"), old_info, old_text))
+    if coords_only:
+        quick = parse_land_info(info_elem.text)
+        if quick.get("緯度_WGS84") is not None or quick.get("TWD97_N") is not None:
+            return complete_coordinates(quick)
+
+    with metrics.timer("land_step_seconds", step="reopen_panel"):
+        _press_escape(driver, 3, profile["esc_pause"])
+        query_exist(driver, profile)  # 你的檢查函式
+
+    # 找所有 div_cross(詳細按鈕)
+    div_cross_list = driver.find_elements(By.XPATH, '//*[@id="div_cross"]')
+    div_imfo_dict = {}
+    if div_cross_list:
+        last_div = div_cross_list[-1]  # 取最後一個
+        # 詳細資料載入失敗時直接拋出 (不當成查無資料)，由呼叫端排入重試
+        with metrics.timer("land_step_seconds", step="detail"):
+            # 按下 ESC 鍵關閉可能的彈跳視窗
+            _press_escape(driver, 1, profile["esc_pause"])
+
+            # 點擊最後一個 div_cross 裡的第一個按鈕
+            button = last_div.find_element(By.XPATH, './/input[@type="button"][1]')
+            button.click()
+
+            # 等待詳細資訊出現且內容載入完成
+            div_imfo = wait.until(_text_loaded((By.XPATH, DETAIL_XPATH), "經緯度"))
+        # 解析文字成 dict
+        div_imfo_dict = complete_coordinates(parse_land_info(div_imfo.text))
+    return div_imfo_dict
+
+
+## --------------------------- 逐筆結果與重試 ---------------------------
+
+class LandResult(NamedTuple):
+    """
+    單一地號的查詢紀錄，index 為在輸入 list 中的位置。
+    status: "ok" (取得坐標)、"not_found" (頁面正常但查無坐標)、"error" (重試後仍失敗)
+    attempts: 實際查詢次數 (快取命中為 0)
+    seconds: 查詢耗時，各次嘗試合計 (快取命中為 0)
+    """
+    index: int
+    status: str
+    info: dict
+    error: Optional[str] = None
+    attempts: int = 1
+    seconds: float = 0.0
 
-    except Exception as e:
-        print("發生錯誤：", e)
+
+def _land_status(info: dict) -> str:
+    return "ok" if info.get("緯度_WGS84") is not None else "not_found"
+
+
+def _driver_alive(driver) -> bool:
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+
+def query_with_retries(items, query, recover=None, max_attempts: int = 3):
+    """
+    依序查詢 items ([(index, data), ...])，每筆完成時 yield LandResult。
+
+    單筆拋出例外不會中止整批：該筆排入重試佇列，並呼叫 recover(fresh=False) 恢復頁面狀態後繼續下一筆。
+    第一輪結束後，重試佇列中的地號在 recover(fresh=True) (重新載入頁面或重啟瀏覽器) 後再查一次，
+    每筆最多查詢 max_attempts 次，最後仍失敗的地號以 status="error" 回報最後一次的錯誤。
+    recover 回傳 False 表示無法恢復 (例如瀏覽器無法重啟)，剩餘地號直接留到下一輪。
+    """
+    recover = recover or (lambda fresh: True)
+    pending = list(items)
+    attempts = {}
+    errors = {}
+    elapsed = {}
+    for round_ in range(max(1, max_attempts)):
+        if round_ > 0:
+            if not pending:
+                break
+            print(f"重試 {len(pending)} 筆失敗的地號 (第 {round_ + 1}/{max_attempts} 次)")
+            if not recover(True):
+                break
+        failed = []
+        for k, (index, data) in enumerate(pending):
+            attempts[index] = attempts.get(index, 0) + 1
+            start = time.perf_counter()
+            try:
+                info = query(data)
+            except Exception as e:
+                elapsed[index] = elapsed.get(index, 0.0) + time.perf_counter() - start
+                errors[index] = f"{type(e).__name__}: {e}".strip()
+                print(f"第 {index} 筆查詢失敗 ({attempts[index]}/{max_attempts}): {errors[index]}")
+                metrics.inc("land_failures_total")
+                failed.append((index, data))
+                if not recover(False):
+                    failed.extend(pending[k + 1:])
+                    break
+                continue
+            elapsed[index] = elapsed.get(index, 0.0) + time.perf_counter() - start
+            yield LandResult(index, _land_status(info), info, None, attempts[index], elapsed[index])
+        if failed and round_ + 1 < max_attempts:
+            metrics.inc("land_retries_total", len(failed))
+        pending = failed
+    for index, data in pending:
+        yield LandResult(index, "error", {}, errors.get(index, "瀏覽器無法使用，未能查詢"), attempts.get(index, 0),
+                         elapsed.get(index, 0.0))
+
+
+def location2lat_chrome_records(driver, data_list, wait_profile="safe", coords_only: bool = False,
+                                extract: str = "webdriver", max_attempts: int = 3, restart=None, session=None):
+    """
+    以單一瀏覽器逐筆查詢，每筆完成時 yield LandResult (見 query_with_retries)。
+    查詢順序依 (縣市, 區域, 段) 分組 (見 group_order)，index 仍為在 data_list 中的原始位置。
+
+    單筆失敗時重新打開查詢視窗後繼續；重試輪改為重新載入頁面。
+    瀏覽器已無回應時，若有提供 restart (回傳已載入頁面的新 driver) 就換新的瀏覽器，否則剩餘地號回報為 error。
+    結束 (或中途關閉 generator) 時關閉瀏覽器；有提供 session (LandSession) 時改為交還給 session 供下一批沿用。
+    """
+    state = {"driver": driver}
+
+    def _recover(fresh: bool) -> bool:
+        current = state["driver"]
+        if current is not None and _driver_alive(current):
+            try:
+                if fresh:
+                    initialize_web(current, NLSC_URL, wait_profile)
+                open_query_panel(current, wait_profile)
+                return True
+            except Exception as e:
+                print("重新打開查詢視窗失敗：", e)
+        if restart is None:
+            return False
+        if current is not None:
+            try:
+                current.quit()
+            except Exception:
+                pass
+        state["driver"] = None
+        metrics.inc("chrome_restarts_total")
+        print("重新啟動瀏覽器")
+        try:
+            state["driver"] = restart()
+            open_query_panel(state["driver"], wait_profile)
+            return True
+        except Exception as e:
+            print("瀏覽器重新啟動失敗：", e)
+            return False
+
+    def _query(data):
+        if state["driver"] is None:
+            raise RuntimeError("瀏覽器無法使用")
+        return query_land(state["driver"], data, wait_profile, coords_only, extract)
+
+    try:
+        # 打開查詢頁面 (失敗時視同第一次恢復)
+        _recover(False)
+        yield from query_with_retries([(index, data_list[index]) for index in group_order(data_list)],
+                                      _query, _recover, max_attempts)
     finally:
         # input("按 Enter 鍵關閉瀏覽器...")
-        driver.quit()
+        if state["driver"] is not None:
+            if session is not None:
+                session.give_driver(state["driver"])
+            else:
+                state["driver"].quit()
+
+
+def location2lat_chrome_iter(driver, data_list, wait_profile="safe", coords_only: bool = False,
+                             extract: str = "webdriver", max_attempts: int = 3):
+    """
+    逐筆查詢並在每筆完成時立即 yield (index, parse_land_info 結果)，查詢失敗的地號為空 dict。
+    查詢順序依 (縣市, 區域, 段) 分組，失敗的地號在最後重試 (見 location2lat_chrome_records)。
+    """
+    for record in location2lat_chrome_records(driver, data_list, wait_profile, coords_only, extract,
+                                              max_attempts):
+        yield record.index, record.info
+
+
+def location2lat_chrome(driver, data_list, wait_profile="safe", coords_only: bool = False,
+                        extract: str = "webdriver", max_attempts: int = 3):
+    """
+    data_list: list of dict, 每個 dict 包含 city、area、section、landcode
+    範例: [{"city":"桃園市","area":"中壢區","section":"大路段","landcode":"815"}]
+    wait_profile: "fast" / "safe" 或自訂 dict，見 WAIT_PROFILES
+    coords_only: 只需要坐標時略過詳細資料視窗，見 query_land
+    extract: "webdriver" / "js"，js 時每筆以一次 execute_async_script 送出並擷取結果，見 query_land
+    max_attempts: 同一筆地號最多查詢幾次 (失敗的地號在最後重試)
+
+    回傳: list of dict，每個 dict 是 parse_land_info 的結果，與 data_list 順序一一對應
+          (查詢失敗的地號為空 dict，失敗原因見 location2lat_chrome_records)
+    """
+    results = [{} for _ in data_list]  # 用來收集每筆查詢結果的 dict
+    for index, info in location2lat_chrome_iter(driver, data_list, wait_profile, coords_only, extract,
+                                                max_attempts):
+        results[index] = info
     return results  # 回傳整理好的 dict 列表
 
-def query_exist(driver):
+def query_exist(driver, wait_profile="safe"):
+    profile = get_wait_profile(wait_profile)
     try:
-        driver.find_element(By.XPATH, '//*[@id="map_header"]/div[4]/ul[3]/li/a').click()
-        wait = WebDriverWait(driver, 3)  # 最多等 3 秒
+        driver.find_element(By.XPATH, QUERY_MENU_XPATH).click()
+        wait = _make_wait(driver, profile, timeout=min(3, profile["timeout"]))  # 最多等 3 秒
         wait.until(EC.visibility_of_element_located((By.XPATH, '//*[@id="city"]')))
         # print("查詢框存在")
-    except Exception as e:
-        driver.find_element(By.XPATH, '//*[@id="map_header"]/div[4]/ul[3]/li/a').click()
+    except Exception:
+        driver.find_element(By.XPATH, QUERY_MENU_XPATH).click()
         # print("查詢框不存在，重新開啟查詢視窗")
-        
-import re
 
-def parse_land_info(text: str) -> dict:
+
+class LandSession:
     """
-    將查詢結果文字解析成欄位字典
-    
-    text: 查詢結果整段文字
-    回傳: dict，欄位如下：
-        行政區、經度_WGS84、緯度_WGS84、經緯度_DMS、
-        國土利用、TWD97_E、TWD97_N、所屬所、地段、地號
-    """
-    result = {}
-
-    # 行政區
-    match = re.search(r'行政區:(.+)', text)
-    if match:
-        result['行政區'] = match.group(1).strip()
-
-    # WGS84
-    match = re.search(r'經緯度WGS84:(\d+\.\d+),(\d+\.\d+)', text)
-    if match:
-        result['經度_WGS84'] = float(match.group(1))
-        result['緯度_WGS84'] = float(match.group(2))
-
-    # 度分秒
-    match = re.search(r'經緯度:(.+)', text)
-    if match:
-        result['經緯度_DMS'] = match.group(1).strip()
-
-    # 國土利用
-    match = re.search(r'國土利用現況調查:(.+)', text)
-    if match:
-        result['國土利用'] = match.group(1).strip()
-
-    # TWD97
-    match = re.search(r'TWD97坐標 E:(\d+\.\d+) N:(\d+\.\d+)', text)
-    if match:
-        result['TWD97_E'] = float(match.group(1))
-        result['TWD97_N'] = float(match.group(2))
-
-    # 所、地段、地號
-    match = re.search(r'(.+所 .+)\s+(.+)\s+(\d+)地號', text)
-    if match:
-        result['所屬所'] = match.group(1).strip()
-        result['地段'] = match.group(2).strip()
-        result['地號'] = match.group(3).strip()
-
-    return result
-
-def location2lat(data_list):
-    url = "https://maps.nlsc.gov.tw/T09/mapshow.action#"
-    driver = set_chrome_options(headless=False)
-    initialize_web(driver, url)
-    location_dict = location2lat_chrome(driver, data_list)
-    return location_dict
+    跨多次 location2lat_stream 共用的查詢資源：閒置的瀏覽器 (單一瀏覽器或 pool 的各 worker) 與 land_backends 後端。
+    分塊處理時每塊各自查詢，但瀏覽器只在第一次需要時啟動，之後的塊直接沿用；close() 時才全部關閉。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._drivers = []
+        self._backend = None
+
+    def take_driver(self):
+        """取出一個閒置的瀏覽器，沒有時回傳 None (由呼叫端自行啟動)。"""
+        with self._lock:
+            return self._drivers.pop() if self._drivers else None
+
+    def give_driver(self, driver) -> None:
+        """查詢結束後交還瀏覽器；已無回應的直接關閉。"""
+        if not _driver_alive(driver):
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return
+        with self._lock:
+            self._drivers.append(driver)
+
+    def land_backend(self, name: str):
+        """取得 (第一次呼叫時建立) land_backends 的查詢後端。"""
+        with self._lock:
+            if self._backend is None:
+                from land_backends import get_backend
+                self._backend = get_backend(name)
+            return self._backend
+
+    def close(self) -> None:
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+            backend, self._backend = self._backend, None
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        if backend is not None:
+            backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _scrape_iter(data_list, wait_profile="safe", workers: int = 1, backend: str = "selenium",
+                 coords_only: bool = False, extract: str = "webdriver", max_attempts: int = 3, session=None):
+    """
+    依設定的後端查詢地號，每筆完成時 yield LandResult；順序不保證與輸入相同。
+    session (LandSession): 沿用其中的瀏覽器 / 後端，結束時交還而不關閉。
+    """
+    if backend != "selenium":
+        from land_backends import get_backend
+        land_backend = session.land_backend(backend) if session else get_backend(backend)
+        try:
+            yield from query_with_retries(list(enumerate(data_list)), land_backend.lookup,
+                                          land_backend.recover, max_attempts)
+        finally:
+            if session is None:
+                land_backend.close()
+        return
+    if workers > 1:
+        import queue
+        import threading
+        from chrome_pool import location2lat_pool
+
+        done = queue.Queue()
+        finished = object()
+        # 先依 (縣市, 區域, 段) 分組再切給各 worker，同一段的地號盡量落在同一個瀏覽器
+        order = group_order(data_list)
+
+        def _run_pool():
+            try:
+                location2lat_pool([data_list[i] for i in order], workers=workers, wait_profile=wait_profile,
+                                  coords_only=coords_only, extract=extract, max_attempts=max_attempts,
+                                  on_record=lambda record: done.put(record._replace(index=order[record.index])),
+                                  session=session)
+            finally:
+                done.put(finished)
+
+        threading.Thread(target=_run_pool, daemon=True).start()
+        records = iter(done.get, finished)
+    else:
+        def _restart():
+            driver = set_chrome_options()
+            initialize_web(driver, NLSC_URL, wait_profile)
+            return driver
+
+        driver = session.take_driver() if session else None
+        records = location2lat_chrome_records(driver or _restart(), data_list, wait_profile, coords_only, extract,
+                                              max_attempts, restart=_restart, session=session)
+    reported = set()
+    for record in records:
+        reported.add(record.index)
+        yield record
+    # 所有瀏覽器都中止時，沒查到的地號視為失敗
+    for index in range(len(data_list)):
+        if index not in reported:
+            yield LandResult(index, "error", {}, "查詢中止", 0)
+
+
+def location2lat_stream(data_list, use_cache: bool = True, wait_profile="safe", workers: int = 1,
+                        backend: str = "selenium", coords_only: bool = False, extract: str = "webdriver",
+                        max_attempts: int = 3, records: bool = False, session=None):
+    """
+    location2lat 的串流版本：每個地號一有結果就 yield (index, parse_land_info 結果)，
+    index 為在 data_list 中的位置，輸出順序為完成順序 (快取命中的會最先出現)。
+    records=True 時改為 yield LandResult (含 status / error / attempts)。
+    session: LandSession，多次呼叫 (例如分塊處理) 共用同一組瀏覽器 / 後端，見 LandSession。
+    """
+    cache = get_default_parcel_cache() if use_cache else None
+
+    # 合併重複地號：每個 key 只查一次，結果分給所有相同地號的 index
+    indices = {}
+    unique = {}
+    for index, data in enumerate(data_list):
+        key = parcel_key(data)
+        indices.setdefault(key, []).append(index)
+        unique.setdefault(key, data)
+
+    pending = []
+    for key, data in unique.items():
+        cached = cache.get(key) if cache else None
+        if cached:
+            for index in indices[key]:
+                if records:
+                    yield LandResult(index, _land_status(cached), dict(cached), None, 0)
+                else:
+                    yield index, dict(cached)
+        else:
+            pending.append((key, data))
+
+    if not pending:
+        return
+    print(f"地號快取命中 {len(unique) - len(pending)} 筆，需查詢 {len(pending)} 筆")
+    for record in _scrape_iter([data for _, data in pending], wait_profile, workers, backend,
+                               coords_only, extract, max_attempts, session):
+        key = pending[record.index][0]
+        # coords_only 的結果缺少國土利用、所屬所等欄位，不寫入快取，以免之後完整查詢直接拿到不完整的資料
+        if cache and not coords_only:
+            cache.set(key, record.info)
+        for index in indices[key]:
+            if records:
+                yield record._replace(index=index, info=dict(record.info))
+            else:
+                yield index, dict(record.info)
+
+
+def location2lat_records(data_list, use_cache: bool = True, wait_profile="safe", workers: int = 1,
+                         backend: str = "selenium", coords_only: bool = False, extract: str = "webdriver",
+                         max_attempts: int = 3) -> list:
+    """與 location2lat 相同，但回傳 LandResult 的 list (與 data_list 順序一一對應)，可區分查無資料與查詢失敗。"""
+    results = [None] * len(data_list)
+    for record in location2lat_stream(data_list, use_cache, wait_profile, workers, backend,
+                                      coords_only, extract, max_attempts, records=True):
+        results[record.index] = record
+    return results
+
+
+def location2lat(data_list, use_cache: bool = True, wait_profile="safe", workers: int = 1,
+                 backend: str = "selenium", coords_only: bool = False, extract: str = "webdriver",
+                 max_attempts: int = 3):
+    """
+    地號 -> parse_land_info 結果，回傳 list 與 data_list 順序一一對應。
+
+    先查地號快取並合併重複的地號，只有快取未命中的地號才會開啟瀏覽器查詢；
+    全部命中時完全不啟動 Chrome。
+    workers > 1 時以多個 headless 瀏覽器平行查詢 (見 chrome_pool.location2lat_pool)。
+    backend="http" 時改用 land_backends.HttpLandBackend 呼叫相容的查詢端點 (LAND_QUERY_URL，例如效能測試的模擬服務)，不開瀏覽器。
+    coords_only=True 時只取坐標 (見 query_land)，可省去點開詳細資料的時間；此時的結果不寫入地號快取。
+    extract="js" 時每筆的送出與擷取以一次 execute_async_script 完成 (見 query_land)。
+    單筆失敗不會中止整批：失敗的地號在最後重試，每筆最多 max_attempts 次 (見 query_with_retries)。
+    """
+    return [record.info for record in location2lat_records(data_list, use_cache, wait_profile, workers, backend,
+                                                           coords_only, extract, max_attempts)]
 
 
 if __name__ == "__main__":
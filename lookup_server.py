@@ -0,0 +1,338 @@
+"""
+常駐的地號查詢服務:啟動時先開好數個查詢 session (瀏覽器已載入頁面並打開查詢視窗),
+地號快取與地理編碼 (限速器、快取、沿用鄰近地址的索引) 都留在記憶體中,
+之後每個請求只需要實際的查詢時間,不必每次啟動 Chrome。
+
+同時到達的請求先在 batch_window 內集合成一批 (合併重複地號、跳過快取命中),
+依 (縣市, 區域, 段) 排序後交給閒置的 session 查詢。
+
+HTTP JSON API:
+    GET  /lookup?city=桃園市&area=中壢區&section=大路段&landcode=815[&address=0]
+    POST /lookup   {"parcels": [{"city": ..., "area": ..., "section": ..., "landcode": ...}, ...],
+                    "address": true}
+         -> {"results": [{"status": "ok", "error": null, "attempts": 1, "land": {...}, "address": {...}}, ...]}
+    GET  /health   各 session 與佇列狀態
+    GET  /metrics  Prometheus text 格式的指標
+
+用法:
+    python lookup_server.py --sessions 2 --wait-profile fast
+    python lookup_server.py --port 8765 --no-address
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from land_backends import get_backend
+from location2latlng import LandResult, _land_status, group_order, query_with_retries
+from parcel_cache import get_default_parcel_cache, parcel_key
+
+# 單一請求最多可查詢的地號數
+MAX_PARCELS_PER_REQUEST = 1000
+
+
+class LandLookupService:
+    """
+    保持 sessions 個已初始化的查詢後端 (land_backends.LandBackend),把同時到達的查詢集合成小批次分派給閒置的 session。
+
+    max_batch: 每批最多幾個 (不重複的) 地號
+    batch_window: 收到第一筆後最多再等幾秒集合同一批
+    max_attempts: 同一筆地號最多查詢幾次 (見 query_with_retries)
+    """
+
+    def __init__(self, backend: str = "selenium", sessions: int = 1, max_batch: int = 16,
+                 batch_window: float = 0.02, max_attempts: int = 3, use_cache: bool = True, **backend_options):
+        self.max_batch = max(1, max_batch)
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self.cache = get_default_parcel_cache() if use_cache else None
+        self.sessions = [get_backend(backend, **backend_options) for _ in range(max(1, sessions))]
+        self._idle: "queue.Queue" = queue.Queue()
+        self._requests: "queue.Queue" = queue.Queue()
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._closed = False
+
+    ## ---- 啟動 / 關閉 ----
+
+    def start(self) -> "LandLookupService":
+        """依序開啟每個 session (瀏覽器一次啟動一個,避免 chromedriver 互相干擾),再啟動分派執行緒。"""
+        for i, session in enumerate(self.sessions):
+            start = time.perf_counter()
+            session.open()
+            print(f"session {i} 已就緒 ({time.perf_counter() - start:.1f} 秒)")
+            self._idle.put(session)
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def close(self) -> None:
+        self._closed = True
+        self._requests.put(None)
+        for session in self.sessions:
+            try:
+                session.close()
+            except Exception as e:
+                print(f"關閉 session 發生錯誤: {e}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            busy = self._busy
+        return {"sessions": len(self.sessions), "busy": busy, "queued": self._requests.qsize()}
+
+    ## ---- 查詢 ----
+
+    def submit(self, data: dict) -> Future:
+        """排入一個地號查詢,回傳完成時結果為 LandResult (index 固定為 0) 的 Future。"""
+        future: Future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("查詢服務已關閉"))
+            return future
+        # 快取命中的直接回覆,不必排隊等待 session
+        cached = self.cache.get(parcel_key(data)) if self.cache else None
+        if cached:
+            future.set_result(LandResult(0, _land_status(cached), dict(cached), None, 0))
+            return future
+        self._requests.put((data, future))
+        return future
+
+    def lookup_many(self, data_list: List[dict], timeout: Optional[float] = None) -> List[LandResult]:
+        """查詢多個地號並等待全部完成,回傳與 data_list 順序一一對應的 LandResult。"""
+        futures = [self.submit(data) for data in data_list]
+        return [future.result(timeout)._replace(index=i) for i, future in enumerate(futures)]
+
+    def _collect(self, first) -> list:
+        """以第一筆請求開始一批,在 batch_window 內繼續收集直到 max_batch 個不重複地號。"""
+        batch = [first]
+        keys = {parcel_key(first[0])}
+        deadline = time.monotonic() + self.batch_window
+        while len(keys) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._requests.put(None)
+                break
+            batch.append(item)
+            keys.add(parcel_key(item[0]))
+        return batch
+
+    def _dispatch(self) -> None:
+        while True:
+            first = self._requests.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+
+            # 合併重複地號:每個地號只查一次,結果分給所有等待的請求
+            waiting: Dict[tuple, list] = {}
+            unique: Dict[tuple, dict] = {}
+            for data, future in batch:
+                key = parcel_key(data)
+                waiting.setdefault(key, []).append(future)
+                unique.setdefault(key, data)
+
+            metrics.inc("lookup_batches_total")
+            metrics.inc("lookup_batch_parcels_total", len(unique))
+            # 等待閒置的 session,在它自己的執行緒中查詢這一批
+            session = self._idle.get()
+            threading.Thread(target=self._run_batch, args=(session, list(unique.items()), waiting),
+                             daemon=True).start()
+
+    def _run_batch(self, session, items: list, waiting: Dict[tuple, list]) -> None:
+        with self._lock:
+            self._busy += 1
+        order = group_order([data for _, data in items])
+        try:
+            records = query_with_retries([(i, items[i][1]) for i in order], session.lookup,
+                                         session.recover, self.max_attempts)
+            for record in records:
+                key = items[record.index][0]
+                if self.cache:
+                    self.cache.set(key, record.info)
+                for future in waiting.pop(key, []):
+                    future.set_result(record._replace(index=0, info=dict(record.info)))
+        except Exception as e:
+            print(f"批次查詢發生錯誤: {e}")
+        finally:
+            # 沒有結果的請求 (例如 session 發生未預期的錯誤) 回報為失敗
+            for futures in waiting.values():
+                for future in futures:
+                    future.set_result(LandResult(0, "error", {}, "查詢中止", 0))
+            with self._lock:
+                self._busy -= 1
+            self._idle.put(session)
+
+
+class GeocodeWorker:
+    """在背景執行緒中保持一個 asyncio 事件迴圈與 AsyncGeocoder,所有請求共用同一組限速器與快取。"""
+
+    def __init__(self, api_key: Optional[str], rate_limits=None, reuse_radius_m: float = 0.0):
+        from async_geocode import AsyncGeocoder
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+        async def _create():
+            return AsyncGeocoder(api_key, rate_limits, reuse_radius_m=reuse_radius_m)
+
+        self.geocoder = asyncio.run_coroutine_threadsafe(_create(), self._loop).result()
+
+    def geocode_rows(self, coords: List[tuple], concurrency: int = 16) -> List[dict]:
+        """多筆經緯度並行地理編碼 (見 AsyncGeocoder.geocode_rows),可由多個請求執行緒同時呼叫。"""
+        return asyncio.run_coroutine_threadsafe(self.geocoder.geocode_rows(coords, concurrency), self._loop).result()
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+## --------------------------- HTTP API ---------------------------
+
+def _record_json(record: LandResult, address: Optional[dict]) -> dict:
+    return {"status": record.status, "error": record.error, "attempts": record.attempts,
+            "land": record.info, "address": address}
+
+
+def make_handler(service: LandLookupService, geocoder: Optional[GeocodeWorker]):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body, content_type: str = "application/json; charset=utf-8"):
+            data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _lookup(self, parcels: list, with_address: bool) -> None:
+            if not isinstance(parcels, list) or not all(isinstance(p, dict) for p in parcels):
+                self._send(400, {"error": "parcels 必須是地號 dict 的 list"})
+                return
+            if len(parcels) > MAX_PARCELS_PER_REQUEST:
+                self._send(413, {"error": f"單一請求最多 {MAX_PARCELS_PER_REQUEST} 筆"})
+                return
+            start = time.perf_counter()
+            data_list = [{"city": p.get("city", ""), "area": p.get("area", ""),
+                          "section": p.get("section", ""), "landcode": str(p.get("landcode", ""))}
+                         for p in parcels]
+            records = service.lookup_many(data_list)
+            addresses = [None] * len(records)
+            if with_address and geocoder:
+                found = [i for i, record in enumerate(records) if record.status == "ok"]
+                rows = geocoder.geocode_rows([(records[i].info["緯度_WGS84"], records[i].info["經度_WGS84"])
+                                              for i in found])
+                for i, row in zip(found, rows):
+                    addresses[i] = row
+            results = [_record_json(record, address) for record, address in zip(records, addresses)]
+            metrics.observe("server_request_seconds", time.perf_counter() - start, path="/lookup")
+            self._send(200, {"results": results})
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            metrics.inc("server_requests_total", path=url.path, method="GET")
+            if url.path == "/lookup":
+                if not q.get("landcode"):
+                    self._send(400, {"error": "缺少 landcode"})
+                    return
+                self._lookup([q], q.get("address", "1") != "0")
+            elif url.path == "/health":
+                self._send(200, {"ok": True, **service.status()})
+            elif url.path == "/metrics":
+                self._send(200, metrics.get_metrics().prometheus_text(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            metrics.inc("server_requests_total", path=url.path, method="POST")
+            if url.path != "/lookup":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            except ValueError:
+                self._send(400, {"error": "請求內容不是 JSON"})
+                return
+            if isinstance(body, list):
+                body = {"parcels": body}
+            if not isinstance(body, dict):
+                self._send(400, {"error": "請求內容必須是 JSON 物件或地號 dict 的 list"})
+                return
+            self._lookup(body.get("parcels", []), bool(body.get("address", True)))
+
+    return Handler
+
+
+## --------------------------- 主程式執行區塊 ---------------------------
+
+if __name__ == "__main__":
+    import argparse
+    from async_geocode import DEFAULT_RATE_LIMITS
+    from geocode_cache import GeocodeCache, set_default_cache, DEFAULT_CACHE_PATH
+    from latlng2address import load_api_key
+
+    parser = argparse.ArgumentParser(description="常駐的地號 -> 經緯度 -> 地址查詢服務 (HTTP JSON API)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, default=1, help="常駐的查詢 session (瀏覽器) 數量")
+    parser.add_argument("--wait-profile", choices=["fast", "safe"], default="safe")
+    parser.add_argument("--extract", choices=["webdriver", "js"], default="webdriver")
+    parser.add_argument("--max-batch", type=int, default=16, help="每批最多的地號數")
+    parser.add_argument("--batch-window-ms", type=float, default=20, help="集合同一批請求的最長等待 (毫秒)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="每筆地號最多查詢幾次")
+    parser.add_argument("--no-parcel-cache", action="store_true", help="不使用地號查詢結果快取")
+    parser.add_argument("--no-address", action="store_true", help="只查坐標,不做反向地理編碼")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="地理編碼快取檔案位置")
+    parser.add_argument("--reuse-radius", type=float, default=0.0,
+                        help="反查地址時,沿用此半徑 (公尺) 內已查過地號的地址;0 表示停用")
+    parser.add_argument("--google-qps", type=float, default=DEFAULT_RATE_LIMITS["google"][0])
+    parser.add_argument("--nominatim-qps", type=float, default=DEFAULT_RATE_LIMITS["nominatim"][0])
+    args = parser.parse_args()
+
+    backend_options = dict(headless=os.getenv("CHROME_HEADLESS", "1") == "1",
+                           wait_profile=args.wait_profile, extract=args.extract)
+    service = LandLookupService("selenium", sessions=args.sessions, max_batch=args.max_batch,
+                                batch_window=args.batch_window_ms / 1000, max_attempts=args.max_attempts,
+                                use_cache=not args.no_parcel_cache, **backend_options)
+
+    geocoder = None
+    if not args.no_address:
+        set_default_cache(GeocodeCache(path=args.cache_path))
+        rate_limits = {"google": (args.google_qps, max(1, int(args.google_qps))),
+                       "nominatim": (args.nominatim_qps, max(1, int(args.nominatim_qps)))}
+        geocoder = GeocodeWorker(load_api_key(), rate_limits, args.reuse_radius)
+
+    with service:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(service, geocoder))
+        server.daemon_threads = True
+        print(f"查詢服務已啟動: http://{args.host}:{server.server_address[1]}/lookup")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n停止查詢服務")
+        finally:
+            server.server_close()
+            if geocoder:
+                geocoder.close()
@@ -0,0 +1,242 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+# 延遲分布的桶上限 (秒),涵蓋單一 DOM 步驟 (數毫秒) 到整筆地號查詢 (數十秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """固定桶的延遲分布:記錄每個桶的筆數、總和與最小/最大值,百分位數由桶內線性內插估計。"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後一格為 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    執行期間的計數器 (counter)、量測值 (gauge) 與延遲分布 (histogram),以名稱加標籤 (labels) 區分。
+    每次記錄只是一次 dict 查找與加法 (加鎖),可以在正式執行時持續開啟。
+    enabled=False 時所有記錄都不做事。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, Histogram] = {}
+        self.started = time.time()
+
+    ## ---- 記錄 ----
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """計時區塊並記錄到 name 的延遲分布,標記 result="ok";區塊拋出例外時標記 result="error"。"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(name, time.perf_counter() - start, **labels, result="error")
+            raise
+        self.observe(name, time.perf_counter() - start, **labels, result="ok")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+        self.started = time.time()
+
+    ## ---- 匯出 ----
+
+    def summary(self) -> dict:
+        """整理成可寫成 JSON 的摘要 (每個延遲分布附上次數、平均、p50/p95/p99 與最大值)。"""
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = [(key, hist.count, hist.sum, hist.min, hist.max,
+                           hist.quantile(0.5), hist.quantile(0.95), hist.quantile(0.99))
+                          for key, hist in self._histograms.items()]
+        return {
+            "started": self.started,
+            "elapsed_s": round(time.time() - self.started, 3),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters)],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(gauges)],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": count, "sum_s": round(total, 6),
+                 "mean_s": round(total / count, 6), "min_s": round(low, 6), "max_s": round(high, 6),
+                 "p50_s": round(p50, 6), "p95_s": round(p95, 6), "p99_s": round(p99, 6)}
+                for (name, labels), count, total, low, high, p50, p95, p99 in sorted(histograms, key=lambda h: h[0])
+            ],
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition 格式 (可給 node_exporter 的 textfile collector 讀取)。"""
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(((key, list(h.counts), h.buckets, h.sum, h.count)
+                                 for key, h in self._histograms.items()), key=lambda h: h[0])
+        lines = []
+        typed = set()
+        for kind, items in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in items:
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {kind}")
+                    typed.add(name)
+                lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), counts, buckets, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for upper, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{fmt(labels, [('le', upper)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        # 先寫暫存檔再改名,避免 collector 讀到寫到一半的檔案
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+
+## --------------------------- 共用實例 ---------------------------
+
+# 環境變數 METRICS_DISABLED=1 可關閉所有記錄
+_default = MetricsRegistry(enabled=os.getenv("METRICS_DISABLED", "") != "1")
+
+
+def get_metrics() -> MetricsRegistry:
+    return _default
+
+
+def set_metrics(registry: MetricsRegistry) -> None:
+    """替換共用實例 (例如常駐程式每批次使用新的實例)。"""
+    global _default
+    _default = registry
+
+
+# 模組層級的捷徑,每次呼叫時才取用共用實例
+def inc(name: str, value: float = 1, **labels) -> None:
+    _default.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    _default.set_gauge(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    _default.observe(name, seconds, **labels)
+
+
+def timer(name: str, **labels):
+    return _default.timer(name, **labels)
+
+
+def timed(name: str, **labels):
+    """
+    函式裝飾器:記錄每次呼叫的時間到 name 的延遲分布,並依回傳值標記 result:
+    ok (有結果)、empty (None 或空值)、error (拋出例外)。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = "error"
+            try:
+                value = func(*args, **kwargs)
+                result = "ok" if value else "empty"
+                return value
+            finally:
+                _default.observe(name, time.perf_counter() - start, **labels, result=result)
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+import json
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from geocode_cache import normalize_address
+
+# 每度緯度約略的公尺數 (決定網格大小用)
+_M_PER_DEG = 111_320.0
+# 地球半徑 (m),與 haversine_distance 相同
+_R = 6371000.0
+
+# 門牌點檔案預設的欄位名稱
+DEFAULT_COLUMNS = ("地址", "緯度", "經度")
+
+# 存檔時的陣列名稱 (每個陣列一個 .npy,載入時可用 mmap 直接對應到檔案)
+_ARRAYS = ("lat", "lng", "keys", "blob", "offsets")
+
+
+def _equirect_m(lat1, lng1, lat2, lng2):
+    """局部等距圓柱投影的距離 (公尺),在數百公尺內與 Haversine 相差不到毫米,用於挑選最近點。"""
+    x = np.radians(lng2 - lng1) * np.cos(np.radians(lat1))
+    y = np.radians(lat2 - lat1)
+    return _R * np.hypot(x, y)
+
+
+class AddressPointIndex:
+    """
+    以本地門牌點資料 (地址, 緯度, 經度) 做反向地理編碼的空間索引,不需要網路。
+
+    所有點依網格編號排序後存成幾個連續的 NumPy 陣列:
+        lat / lng   float64 座標
+        keys        每個點的網格編號 (已排序,以 searchsorted 找出某格的點)
+        blob        所有地址的 UTF-8 位元組串接
+        offsets     第 i 個地址在 blob 中的範圍為 offsets[i]:offsets[i+1]
+    可用 save() 存成 .npy 目錄,之後以 load(mmap=True) 直接對應檔案,不需整份讀進記憶體。
+
+    cell_m: 網格邊長 (公尺),也是最近點搜尋的最大距離上限 (只搜尋周圍 3x3 格)。
+            以 load() 載入的目錄沿用建立時的 cell_m;查詢時的 max_distance_m 超過 cell_m 會被限制在 cell_m
+            (第一次發生時印出提醒),需要更大的距離時請以較大的 cell_m 重新建立並存檔。
+    """
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, keys: np.ndarray, blob: np.ndarray,
+                 offsets: np.ndarray, meta: dict):
+        self.lat = lat
+        self.lng = lng
+        self.keys = keys
+        self.blob = blob
+        self.offsets = offsets
+        self.meta = meta
+        self.cell_m = meta["cell_m"]
+        self._cell_lat = meta["cell_lat"]
+        self._cell_lng = meta["cell_lng"]
+        self._i0, self._j0 = meta["i0"], meta["j0"]
+        self._rows, self._cols = meta["rows"], meta["cols"]
+        self._forward = None
+        self._warned_limit = False
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    ## ---- 建立 / 存取 ----
+
+    @classmethod
+    def from_arrays(cls, addresses: Iterable[str], lat, lng, cell_m: float = 100.0) -> "AddressPointIndex":
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        addresses = np.asarray(list(addresses), dtype=object)
+        valid = np.isfinite(lat) & np.isfinite(lng)
+        lat, lng, addresses = lat[valid], lng[valid], addresses[valid]
+        if not len(lat):
+            raise ValueError("門牌點資料中沒有有效的座標")
+
+        # 經度方向的格子依資料中最高緯度放寬,確保任一點周圍 3x3 格涵蓋 cell_m 的半徑
+        cell_lat = cell_m / _M_PER_DEG
+        cell_lng = cell_lat / max(np.cos(np.radians(np.abs(lat).max())), 1e-6)
+        i = np.floor(lat / cell_lat).astype(np.int64)
+        j = np.floor(lng / cell_lng).astype(np.int64)
+        i0, j0 = int(i.min()), int(j.min())
+        rows, cols = int(i.max()) - i0 + 1, int(j.max()) - j0 + 1
+        keys = (i - i0) * cols + (j - j0)
+
+        order = np.argsort(keys, kind="stable")
+        encoded = [str(a).encode("utf-8") for a in addresses[order]]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        meta = {"cell_m": float(cell_m), "cell_lat": cell_lat, "cell_lng": float(cell_lng),
+                "i0": i0, "j0": j0, "rows": rows, "cols": cols}
+        return cls(lat[order], lng[order], keys[order], blob, offsets, meta)
+
+    @classmethod
+    def from_file(cls, path: str, columns: Tuple[str, str, str] = DEFAULT_COLUMNS,
+                  cell_m: float = 100.0) -> "AddressPointIndex":
+        """
+        讀取門牌點檔案 (CSV 或 Parquet) 建立索引。
+        columns: (地址, 緯度, 經度) 的欄位名稱
+        """
+        import pandas as pd
+
+        address_col, lat_col, lng_col = columns
+        if path.lower().endswith(".parquet"):
+            df = pd.read_parquet(path, columns=list(columns))
+        else:
+            df = pd.read_csv(path, usecols=list(columns), dtype={address_col: str})
+        return cls.from_arrays(df[address_col].to_numpy(), df[lat_col].to_numpy(), df[lng_col].to_numpy(), cell_m)
+
+    def save(self, directory: str) -> None:
+        """把索引存成目錄 (每個陣列一個 .npy 與 meta.json)。"""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "AddressPointIndex":
+        """載入 save() 存的索引;mmap=True 時陣列直接對應檔案,由作業系統按需讀取。"""
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS}
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(meta=meta, **arrays)
+
+    @classmethod
+    def open(cls, path: str, cell_m: float = 100.0) -> "AddressPointIndex":
+        """path 為 save() 的目錄時直接載入,否則視為 CSV / Parquet 檔重新建立。"""
+        if os.path.isdir(path):
+            return cls.load(path)
+        return cls.from_file(path, cell_m=cell_m)
+
+    def address(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def addresses(self, indices) -> List[Optional[str]]:
+        """依索引取出地址,索引為 -1 (找不到) 的位置為 None。"""
+        return [self.address(i) if i >= 0 else None for i in indices]
+
+    ## ---- 查詢 ----
+
+    def _cells(self, lat, lng):
+        i = np.floor(lat / self._cell_lat).astype(np.int64) - self._i0
+        j = np.floor(lng / self._cell_lng).astype(np.int64) - self._j0
+        return i, j
+
+    def _limit(self, max_distance_m: Optional[float]) -> float:
+        """實際使用的最大距離:max_distance_m 與 cell_m 取小 (搜尋範圍只有周圍 3x3 格)。"""
+        if max_distance_m is None:
+            return self.cell_m
+        if max_distance_m > self.cell_m and not self._warned_limit:
+            print(f"本地門牌點索引的網格為 {self.cell_m:g} 公尺,最大距離 {max_distance_m:g} 公尺超過網格,"
+                  f"實際以 {self.cell_m:g} 公尺為上限 (需要更大的距離請以較大的 cell_m 重新建立索引)")
+            self._warned_limit = True
+        return min(max_distance_m, self.cell_m)
+
+    def nearest(self, lat: float, lng: float,
+                max_distance_m: Optional[float] = None) -> Optional[Tuple[str, float, float, float]]:
+        """
+        單點查詢:回傳最近門牌點的 (地址, 緯度, 經度, 距離公尺),超過 max_distance_m 時回傳 None。
+        max_distance_m 超過 cell_m 時以 cell_m 為上限 (見 _limit)。
+        """
+        limit = self._limit(max_distance_m)
+        if not (np.isfinite(lat) and np.isfinite(lng)):
+            return None
+        ci = int(np.floor(lat / self._cell_lat)) - self._i0
+        cj = int(np.floor(lng / self._cell_lng)) - self._j0
+        cell_keys = [i * self._cols + j
+                     for i in range(max(ci - 1, 0), min(ci + 2, self._rows))
+                     for j in range(max(cj - 1, 0), min(cj + 2, self._cols))]
+        if not cell_keys:
+            return None
+        # 周圍各格的範圍以兩次 searchsorted 一起找出
+        starts = np.searchsorted(self.keys, cell_keys, "left").tolist()
+        ends = np.searchsorted(self.keys, cell_keys, "right").tolist()
+        best, best_dist = -1, np.inf
+        for start, end in zip(starts, ends):
+            if start == end:
+                continue
+            dist = _equirect_m(lat, lng, self.lat[start:end], self.lng[start:end])
+            k = int(dist.argmin())
+            if dist[k] < best_dist:
+                best, best_dist = start + k, float(dist[k])
+        if best < 0 or best_dist > limit:
+            return None
+        return self.address(best), float(self.lat[best]), float(self.lng[best]), best_dist
+
+    def nearest_batch(self, lat, lng, max_distance_m: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批次查詢:回傳 (最近點索引, 距離公尺) 兩個陣列,找不到 (或座標為 NaN) 的位置為 (-1, NaN)。
+        對周圍 3x3 格各做一次向量化的 searchsorted,把所有候選點攤平後一次計算距離並取各查詢的最小值。
+        max_distance_m 超過 cell_m 時以 cell_m 為上限 (見 _limit)。
+        """
+        limit = self._limit(max_distance_m)
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        lng = np.asarray(lng, dtype=np.float64).ravel()
+        best_idx = np.full(len(lat), -1, dtype=np.int64)
+        best_dist = np.full(len(lat), np.inf)
+
+        finite = np.nonzero(np.isfinite(lat) & np.isfinite(lng))[0]
+        ci, cj = self._cells(lat[finite], lng[finite])
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                i, j = ci + di, cj + dj
+                ok = (i >= 0) & (i < self._rows) & (j >= 0) & (j < self._cols)
+                q = finite[ok]
+                cell_keys = i[ok] * self._cols + j[ok]
+                start = np.searchsorted(self.keys, cell_keys, "left")
+                counts = np.searchsorted(self.keys, cell_keys, "right") - start
+                if not counts.any():
+                    continue
+                # 每個查詢的候選點:start 起連續 counts 個
+                owner = np.repeat(q, counts)
+                first = np.cumsum(counts) - counts
+                cand = np.repeat(start, counts) + np.arange(counts.sum()) - np.repeat(first, counts)
+                dist = _equirect_m(lat[owner], lng[owner], self.lat[cand], self.lng[cand])
+                # 依 (查詢, 距離) 排序後,每個查詢的第一筆即為此格中最近的點
+                order = np.lexsort((dist, owner))
+                owner, cand, dist = owner[order], cand[order], dist[order]
+                head = np.ones(len(owner), dtype=bool)
+                head[1:] = owner[1:] != owner[:-1]
+                owner, cand, dist = owner[head], cand[head], dist[head]
+                better = dist < best_dist[owner]
+                best_idx[owner[better]] = cand[better]
+                best_dist[owner[better]] = dist[better]
+
+        miss = best_dist > limit
+        best_idx[miss] = -1
+        best_dist[miss] = np.nan
+        return best_idx, best_dist
+
+    def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """正向查詢:地址 (正規化後) 完全相同的門牌點座標,用於計算地址迴轉誤差。"""
+        if self._forward is None:
+            self._forward = {}
+            for i in range(len(self)):
+                self._forward.setdefault(normalize_address(self.address(i)), i)
+        i = self._forward.get(normalize_address(address))
+        return None if i is None else (float(self.lat[i]), float(self.lng[i]))
+
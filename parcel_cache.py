@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+import metrics
+
+DEFAULT_PARCEL_CACHE_PATH = "parcel_cache.sqlite"
+
+
+def _normalize_text(value) -> str:
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value))
+    return "".join(text.split())
+
+
+def parcel_key(data: dict) -> Tuple[str, str, str, str]:
+    """
+    將 {city, area, section, landcode} 正規化為快取鍵。
+    地號去除前導零,Excel 讀入的 815.0 也會轉成 815。
+    """
+    landcode = _normalize_text(data.get("landcode", ""))
+    if landcode.endswith(".0"):
+        landcode = landcode[:-2]
+    if landcode.isdigit():
+        landcode = landcode.lstrip("0") or "0"
+    return (
+        _normalize_text(data.get("city", "")),
+        _normalize_text(data.get("area", "")),
+        _normalize_text(data.get("section", "")),
+        landcode,
+    )
+
+
+class ParcelCache:
+    """
+    以 SQLite 儲存的地號查詢結果 (parse_land_info 的 dict)。
+    只存成功取得經緯度的結果,失敗的地號下次仍會重新查詢。
+    """
+
+    def __init__(self, path: str = DEFAULT_PARCEL_CACHE_PATH, bypass: bool = False):
+        self.path = path
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parcel ("
+            " city TEXT NOT NULL, area TEXT NOT NULL, section TEXT NOT NULL, landcode TEXT NOT NULL,"
+            " value TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (city, area, section, landcode))"
+        )
+        self._conn.commit()
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[dict]:
+        if self.bypass:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM parcel WHERE city = ? AND area = ? AND section = ? AND landcode = ?", key
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            metrics.inc("cache_lookups_total", cache="parcel", result="miss")
+            return None
+        self.hits += 1
+        metrics.inc("cache_lookups_total", cache="parcel", result="hit")
+        return json.loads(row[0])
+
+    def set(self, key: Tuple[str, str, str, str], value: dict) -> None:
+        if self.bypass or not value or value.get("緯度_WGS84") is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parcel (city, area, section, landcode, value, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM parcel").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ParcelCache] = None
+
+
+def get_default_parcel_cache() -> ParcelCache:
+    """
+    取得模組共用的地號快取,第一次呼叫時才建立。
+    環境變數 PARCEL_CACHE_PATH 可指定檔案位置,PARCEL_CACHE_BYPASS=1 可停用快取。
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ParcelCache(
+            path=os.getenv("PARCEL_CACHE_PATH", DEFAULT_PARCEL_CACHE_PATH),
+            bypass=os.getenv("PARCEL_CACHE_BYPASS", "") == "1",
+        )
+    return _default_cache
+
+
+def set_default_parcel_cache(cache: Optional[ParcelCache]) -> None:
+    global _default_cache
+    _default_cache = cache
@@ -0,0 +1,55 @@
+import math
+from typing import Any, Optional, Tuple
+
+from latlng2address import haversine_distance_batch
+from offline_geocoder import _M_PER_DEG
+
+
+class GridIndex:
+    """
+    以固定大小網格分桶的空間索引,用來找出某點半徑範圍內最近的已知點。
+    cell_m: 網格邊長 (公尺),接近常用的查詢半徑時效率最好。
+    """
+
+    def __init__(self, cell_m: float = 25.0):
+        self.cell_deg = cell_m / _M_PER_DEG
+        self._cells = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def add(self, lat: float, lng: float, payload: Any) -> None:
+        self._cells.setdefault(self._cell(lat, lng), []).append((lat, lng, payload))
+        self._size += 1
+
+    def remove(self, lat: float, lng: float, payload: Any) -> None:
+        bucket = self._cells.get(self._cell(lat, lng), [])
+        for i, (_, _, p) in enumerate(bucket):
+            if p is payload:
+                del bucket[i]
+                self._size -= 1
+                return
+
+    def nearest(self, lat: float, lng: float, radius_m: float) -> Optional[Tuple[Any, float]]:
+        """回傳半徑 radius_m 內最近一點的 (payload, 距離公尺),沒有則回傳 None。"""
+        if not self._cells or radius_m <= 0:
+            return None
+        d_lat = radius_m / _M_PER_DEG
+        d_lng = radius_m / (_M_PER_DEG * max(math.cos(math.radians(lat)), 1e-6))
+        i0, j0 = self._cell(lat - d_lat, lng - d_lng)
+        i1, j1 = self._cell(lat + d_lat, lng + d_lng)
+
+        candidates = [point for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                      for point in self._cells.get((i, j), ())]
+        if not candidates:
+            return None
+        # 周圍各格的候選點一次算完距離
+        dists = haversine_distance_batch(lat, lng, [p[0] for p in candidates], [p[1] for p in candidates])
+        k = int(dists.argmin())
+        if dists[k] > radius_m:
+            return None
+        return candidates[k][2], float(dists[k])
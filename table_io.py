@@ -0,0 +1,223 @@
+import csv
+import math
+import os
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+# 組成地號查詢所需的欄位
+REQUIRED_COLUMNS = ("縣市", "區", "段", "地號")
+
+# Excel 單一工作表的列數上限 (含標題列)
+XLSX_MAX_ROWS = 1_048_576
+
+
+def _kind(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return "xlsx"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".csv", ".txt"):
+        return "csv"
+    raise ValueError(f"不支援的檔案格式: {path} (可用 .csv / .parquet / .xlsx)")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("讀寫 Parquet 需要安裝 pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+## --------------------------- 分塊讀取 ---------------------------
+
+def _xlsx_chunks(path: str, chunk_size: int, sheet_name: Optional[str]) -> Iterator["pd.DataFrame"]:
+    """以 openpyxl 的 read-only 模式逐列讀取,每 chunk_size 列組成一個 DataFrame。"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        buffer = []
+        for row in rows:
+            # read-only 模式下空白列仍會出現,全部為 None 時略過
+            if all(v is None for v in row):
+                continue
+            buffer.append(row[:len(header)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_table_chunks(path: str, chunk_size: int = 5000, sheet_name: Optional[str] = None,
+                      skip: int = 0) -> Iterator["pd.DataFrame"]:
+    """
+    分塊讀取 CSV / Parquet / xlsx,每次 yield 最多 chunk_size 列的 DataFrame,記憶體用量與檔案大小無關。
+    DataFrame 的 index 為該列在整個檔案中的位置 (從 0 起算,不含標題列)。
+    skip: 略過前面幾列 (續跑時跳過已輸出的列)。
+    地號欄位一律以字串讀入,避免 CSV 中的 "0815" 變成 815。
+    """
+    kind = _kind(path)
+    if kind == "csv":
+        chunks = pd.read_csv(path, chunksize=chunk_size, dtype={"地號": str},
+                             skiprows=range(1, skip + 1) if skip else None)
+        offset = skip
+        skip = 0
+    elif kind == "parquet":
+        pyarrow = _require_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size))
+        offset = 0
+    else:
+        chunks = _xlsx_chunks(path, chunk_size, sheet_name)
+        offset = 0
+
+    for chunk in chunks:
+        # 只有標題列的檔案,或續跑時所有列都已輸出,不產生空的塊
+        if chunk.empty:
+            continue
+        if skip:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                offset += len(chunk)
+                continue
+            chunk = chunk.iloc[skip:]
+            offset += skip
+            skip = 0
+        chunk = chunk.reset_index(drop=True)
+        chunk.index += offset
+        offset += len(chunk)
+        yield chunk
+
+
+def data_list_from_frame(df: "pd.DataFrame") -> List[dict]:
+    """把 (縣市, 區, 段, 地號) 欄位整欄取出組成 location2lat 的 data_list (不逐列 iterrows)。"""
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise KeyError(f"缺少必要的欄位: {', '.join(missing)}")
+    landcodes = ["" if v is None or (isinstance(v, float) and math.isnan(v))
+                 else str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+                 for v in df["地號"].tolist()]
+    return [{"city": city, "area": area, "section": section, "landcode": landcode}
+            for city, area, section, landcode in zip(df["縣市"].tolist(), df["區"].tolist(),
+                                                     df["段"].tolist(), landcodes)]
+
+
+## --------------------------- 逐塊寫出 ---------------------------
+
+class ResultWriter:
+    """
+    逐塊附加寫出結果:.csv 直接附加 (第一塊寫標題列);.parquet 以 pyarrow.ParquetWriter 每塊寫成一個 row group。
+    append=True 且 CSV 檔已存在時接在後面 (續跑);Parquet 無法附加到既有檔案,一律重新寫。
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.kind = _kind(path)
+        if self.kind == "xlsx":
+            raise ValueError("逐塊輸出只支援 .csv / .parquet,xlsx 請在最後以 export_xlsx 轉出")
+        self.rows = 0
+        self._columns = None
+        self._parquet = None
+        self._schema = None
+        self._has_header = False
+        if self.kind == "csv" and append and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.rows = count_csv_rows(path)
+            with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                self._columns = next(csv.reader(f), None)
+            self._has_header = self._columns is not None
+        elif self.kind == "csv":
+            open(path, "w").close()
+
+    def write(self, df: "pd.DataFrame") -> None:
+        if self._columns is None:
+            self._columns = list(df.columns)
+        else:
+            # 各塊欄位順序以第一塊為準,缺少的欄位補空值
+            df = df.reindex(columns=self._columns)
+        if self.kind == "csv":
+            header = not self._has_header
+            # 只有檔案開頭寫 BOM,讓 Excel 直接開啟時能正確辨識 UTF-8
+            df.to_csv(self.path, mode="a", header=header, index=False,
+                      encoding="utf-8-sig" if header else "utf-8")
+            self._has_header = True
+        else:
+            self._write_parquet(df)
+        self.rows += len(df)
+
+    def _write_parquet(self, df: "pd.DataFrame") -> None:
+        pyarrow = _require_pyarrow()
+        # 文字欄位統一存成字串 (第一塊全為空值時型別才不會被推斷成 null)
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = [None if v is None or (isinstance(v, float) and math.isnan(v)) else str(v)
+                           for v in df[col].tolist()]
+        if self._schema is None:
+            fields = []
+            for field in pyarrow.Schema.from_pandas(df, preserve_index=False):
+                if pyarrow.types.is_null(field.type) or df[field.name].dtype == object:
+                    field = pyarrow.field(field.name, pyarrow.string())
+                fields.append(field)
+            self._schema = pyarrow.schema(fields)
+            self._parquet = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        table = pyarrow.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._parquet.write_table(table)
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def count_csv_rows(path: str) -> int:
+    """CSV 的資料列數 (不含標題列),逐列讀取不載入整個檔案。"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def export_xlsx(source: str, xlsx_path: str, chunk_size: int = 5000) -> int:
+    """
+    把 ResultWriter 輸出的 CSV / Parquet 轉成 xlsx:以 openpyxl 的 write-only 模式逐塊寫入,
+    不需要整份資料在記憶體中。超過 Excel 單一工作表上限時自動接續到新的工作表。回傳寫出的列數。
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    total = 0
+    header = None
+    for chunk in iter_table_chunks(source, chunk_size):
+        if header is None:
+            header = list(chunk.columns)
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet is None or sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"結果{len(workbook.worksheets) + 1}" if sheet else "結果")
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append([None if isinstance(v, float) and math.isnan(v) else v for v in row])
+            sheet_rows += 1
+            total += 1
+    if sheet is None:
+        workbook.create_sheet("結果")
+    workbook.save(xlsx_path)
+    return total
@@ -0,0 +1,129 @@
+"""
+HttpLandBackend 對相容查詢端點的測試:在本機啟動一個重播固定回應的 HTTP 服務,
+確認送出的查詢參數,以及三種回應格式都解析成與 parse_land_info 相同的 dict。
+
+用法: python -m pytest -q test_land_backends.py
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from land_backends import HttpLandBackend, get_backend
+from land_parser import parse_land_info
+from location2latlng import query_with_retries
+from twd97 import complete_coordinates
+
+DETAIL_TEXT = (
+    "中壢地政事務所 中壢區\n大路段\n815地號\n"
+    "行政區:桃園市中壢區\n"
+    "經緯度WGS84:121.223456,24.953123\n"
+    "經緯度:121°13'24.44\"E 24°57'11.24\"N\n"
+    "國土利用現況調查:住宅\n"
+    "TWD97坐標 E:268000.12 N:2761000.34"
+)
+
+# 地號 -> (狀態碼, Content-Type, 回應內容)
+RESPONSES = {
+    "1": (200, "application/json; charset=utf-8", json.dumps({
+        "行政區": "桃園市中壢區", "經度_WGS84": "121.223456", "緯度_WGS84": "24.953123",
+        "所屬所": "中壢地政事務所 中壢區", "地段": "大路段", "地號": "1",
+    }, ensure_ascii=False)),
+    "2": (200, "application/json; charset=utf-8", json.dumps({"text": DETAIL_TEXT}, ensure_ascii=False)),
+    "3": (200, "text/html; charset=utf-8",
+          "<table><tr><td>" + DETAIL_TEXT.replace("\n", "<br>") + "</td></tr></table>"),
+    "4": (200, "application/json; charset=utf-8", "[]"),
+    "5": (503, "text/plain; charset=utf-8", "unavailable"),
+}
+
+
+@pytest.fixture
+def replay_server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            params = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+            requests_seen.append(params)
+            status, content_type, body = RESPONSES[params["landcode"]]
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}/query", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def _parcel(landcode: str) -> dict:
+    return {"city": "桃園市", "area": "中壢區", "section": "大路段", "landcode": landcode}
+
+
+def test_sends_parcel_fields_as_query_params(replay_server):
+    url, seen = replay_server
+    with HttpLandBackend(url) as backend:
+        backend.lookup(_parcel("1"))
+    assert seen == [_parcel("1")]
+
+
+def test_json_fields_response(replay_server):
+    url, _ = replay_server
+    with HttpLandBackend(url) as backend:
+        info = backend.lookup(_parcel("1"))
+    assert info["緯度_WGS84"] == 24.953123 and info["經度_WGS84"] == 121.223456
+    assert info["地段"] == "大路段" and info["地號"] == "1"
+    # 缺少的坐標由 twd97 在本地換算補齊
+    assert info["TWD97_E"] is not None and info["經緯度_DMS"]
+
+
+@pytest.mark.parametrize("landcode", ["2", "3"])
+def test_text_responses_match_parse_land_info(replay_server, landcode):
+    url, _ = replay_server
+    with HttpLandBackend(url) as backend:
+        info = backend.lookup(_parcel(landcode))
+    assert info == complete_coordinates(parse_land_info(DETAIL_TEXT))
+
+
+def test_empty_response_is_not_found(replay_server):
+    url, _ = replay_server
+    with HttpLandBackend(url) as backend:
+        records = list(query_with_retries([(0, _parcel("4"))], backend.lookup, backend.recover))
+    assert records[0].status == "not_found" and records[0].info == {}
+
+
+def test_server_error_is_retried_then_reported(replay_server):
+    url, seen = replay_server
+    with HttpLandBackend(url) as backend:
+        with pytest.raises(requests.HTTPError):
+            backend.lookup(_parcel("5"))
+        records = list(query_with_retries([(0, _parcel("5"))], backend.lookup, backend.recover, max_attempts=2))
+    assert records[0].status == "error" and records[0].attempts == 2
+    assert len(seen) == 3
+
+
+def test_requires_an_endpoint(monkeypatch):
+    monkeypatch.setattr("land_backends.LAND_QUERY_URL", "")
+    with pytest.raises(ValueError):
+        get_backend("http")
+
+
+def test_import_does_not_load_selenium():
+    code = "import sys, land_backends; print('selenium' in sys.modules or 'location2latlng' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
@@ -0,0 +1,45 @@
+"""
+parse_land_info 的回歸測試:以 fixtures/land_detail_texts.txt 的查詢結果文字與 bench_parser.EDGE_CASES
+(欄位不在行首) 確認結果與舊版解析器 (parse_land_info_legacy) 完全相同。
+
+用法: python -m pytest -q test_land_parser.py
+"""
+import os
+
+import pytest
+
+from bench_parser import EDGE_CASES, load_corpus, parse_land_info_legacy
+from land_parser import parse_land_info, parse_many
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "land_detail_texts.txt")
+CORPUS = load_corpus(CORPUS_PATH)
+
+
+@pytest.mark.parametrize("text", CORPUS, ids=[f"fixture-{i}" for i in range(len(CORPUS))])
+def test_matches_legacy_on_fixture(text):
+    assert parse_land_info(text) == parse_land_info_legacy(text)
+
+
+@pytest.mark.parametrize("text", EDGE_CASES, ids=[f"edge-{i}" for i in range(len(EDGE_CASES))])
+def test_matches_legacy_on_mid_line_fields(text):
+    assert parse_land_info(text) == parse_land_info_legacy(text)
+
+
+def test_parse_many_matches_single():
+    texts = CORPUS + EDGE_CASES
+    assert [record.to_dict() for record in parse_many(texts)] == [parse_land_info(t) for t in texts]
+
+
+def test_detail_text_fields():
+    assert parse_land_info(CORPUS[0]) == {
+        "行政區": "桃園市中壢區",
+        "經度_WGS84": 121.223456,
+        "緯度_WGS84": 24.953123,
+        "經緯度_DMS": "121°13'24.44\"E 24°57'11.24\"N",
+        "國土利用": "住宅",
+        "TWD97_E": 272564.24,
+        "TWD97_N": 2760603.96,
+        "所屬所": "中壢地政事務所 中壢區",
+        "地段": "大路段",
+        "地號": "815",
+    }
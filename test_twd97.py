@@ -0,0 +1,74 @@
+"""
+twd97 換算與度分秒格式的測試:以 fixtures/twd97_pairs.csv 的成對坐標驗證兩個方向的換算,
+並確認本地補齊的「經緯度_DMS」與網站詳細資料的格式相同。
+地號快取 (parcel_cache.sqlite) 中有網站回傳的成對坐標時一併比對。
+
+用法: python -m pytest -q test_twd97.py
+"""
+import numpy as np
+import pytest
+
+from bench_twd97 import load_records
+from land_parser import parse_land_info
+from parcel_cache import DEFAULT_PARCEL_CACHE_PATH
+from twd97 import (
+    complete_coordinates,
+    format_dms,
+    load_reference_pairs,
+    twd97_to_wgs84,
+    validate_against_records,
+    wgs84_to_twd97,
+)
+
+PAIRS = load_reference_pairs()
+
+# 網站詳細資料的坐標欄位 (同 test_land_backends.DETAIL_TEXT)
+SITE_TEXT = (
+    "經緯度WGS84:121.223456,24.953123\n"
+    "經緯度:121°13'24.44\"E 24°57'11.24\"N"
+)
+
+
+@pytest.mark.parametrize("pair", PAIRS, ids=[p["地點"] for p in PAIRS])
+def test_wgs84_to_twd97(pair):
+    e, n = wgs84_to_twd97(pair["緯度_WGS84"], pair["經度_WGS84"])
+    assert abs(e - pair["TWD97_E"]) < 0.01 and abs(n - pair["TWD97_N"]) < 0.01
+
+
+@pytest.mark.parametrize("pair", PAIRS, ids=[p["地點"] for p in PAIRS])
+def test_twd97_to_wgs84(pair):
+    lat, lng = twd97_to_wgs84(pair["TWD97_E"], pair["TWD97_N"])
+    assert abs(lat - pair["緯度_WGS84"]) < 1e-7 and abs(lng - pair["經度_WGS84"]) < 1e-7
+
+
+def test_array_input_matches_scalars():
+    lat = np.array([p["緯度_WGS84"] for p in PAIRS])
+    lng = np.array([p["經度_WGS84"] for p in PAIRS])
+    e, n = wgs84_to_twd97(lat, lng)
+    assert np.allclose(e, [p["TWD97_E"] for p in PAIRS], atol=0.01)
+    assert np.allclose(n, [p["TWD97_N"] for p in PAIRS], atol=0.01)
+
+
+def test_validate_against_reference_pairs():
+    stats = validate_against_records(PAIRS)
+    assert stats["count"] == len(PAIRS) and stats["max_m"] < 0.01
+
+
+def test_format_dms_matches_site_text():
+    site = parse_land_info(SITE_TEXT)
+    assert format_dms(site["緯度_WGS84"], site["經度_WGS84"]) == site["經緯度_DMS"]
+    assert format_dms(-33.5, -70.25) == "70°15'0.00\"W 33°30'0.00\"S"
+
+
+def test_completed_dms_matches_scraped_column():
+    scraped = parse_land_info(SITE_TEXT)
+    local = complete_coordinates({"緯度_WGS84": scraped["緯度_WGS84"], "經度_WGS84": scraped["經度_WGS84"]})
+    assert local["經緯度_DMS"] == scraped["經緯度_DMS"]
+
+
+def test_site_pairs_in_parcel_cache():
+    stats = validate_against_records(load_records(DEFAULT_PARCEL_CACHE_PATH))
+    if not stats["count"]:
+        pytest.skip(f"{DEFAULT_PARCEL_CACHE_PATH} 中沒有網站回傳的成對坐標")
+    # 網站的 TWD97 取到公分
+    assert stats["max_m"] < 0.05
@@ -0,0 +1,157 @@
+"""
+TWD97 (TM2 二度分帶) 與 WGS84 經緯度互轉,以及度分秒格式化。
+
+使用 GRS80 橢球與 Krüger 級數 (取到 n³ 項,誤差在毫米等級),
+所有函式皆可傳入純量或 NumPy 陣列,傳入陣列時一次轉換整欄。
+"""
+import os
+
+import numpy as np
+
+# GRS80 橢球
+_A = 6378137.0
+_F = 1 / 298.257222101
+
+# TM2 二度分帶 (台灣本島 121°E)
+LON0 = 121.0
+K0 = 0.9999
+FALSE_EASTING = 250000.0
+FALSE_NORTHING = 0.0
+
+# 成對坐標的參考資料 (EPSG:4326 與 EPSG:3826 TWD97 / TM2 zone 121 的對應點),供測試與 bench_twd97 驗證
+REFERENCE_PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "twd97_pairs.csv")
+
+_N = _F / (2 - _F)
+_RECTIFYING_A = _A / (1 + _N) * (1 + _N**2 / 4 + _N**4 / 64)
+_E = 2 * np.sqrt(_N) / (1 + _N)   # 第一偏心率
+
+_ALPHA = (
+    _N / 2 - 2 * _N**2 / 3 + 5 * _N**3 / 16,
+    13 * _N**2 / 48 - 3 * _N**3 / 5,
+    61 * _N**3 / 240,
+)
+_BETA = (
+    _N / 2 - 2 * _N**2 / 3 + 37 * _N**3 / 96,
+    _N**2 / 48 + _N**3 / 15,
+    17 * _N**3 / 480,
+)
+_DELTA = (
+    2 * _N - 2 * _N**2 / 3 - 2 * _N**3,
+    7 * _N**2 / 3 - 8 * _N**3 / 5,
+    56 * _N**3 / 15,
+)
+
+
+def _result(value):
+    """純量輸入回傳 float,陣列輸入回傳陣列。"""
+    return float(value) if np.ndim(value) == 0 else value
+
+
+def wgs84_to_twd97(lat, lng, lon0: float = LON0):
+    """WGS84 (緯度, 經度) -> TWD97 (E, N),單位:公尺。"""
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    dlam = np.radians(np.asarray(lng, dtype=np.float64) - lon0)
+
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - _E * np.arctanh(_E * sin_phi))
+    xi_p = np.arctan2(t, np.cos(dlam))
+    eta_p = np.arctanh(np.sin(dlam) / np.sqrt(1 + t * t))
+
+    xi, eta = xi_p, eta_p
+    for j, alpha in enumerate(_ALPHA, start=1):
+        xi = xi + alpha * np.sin(2 * j * xi_p) * np.cosh(2 * j * eta_p)
+        eta = eta + alpha * np.cos(2 * j * xi_p) * np.sinh(2 * j * eta_p)
+
+    e = FALSE_EASTING + K0 * _RECTIFYING_A * eta
+    n = FALSE_NORTHING + K0 * _RECTIFYING_A * xi
+    return _result(e), _result(n)
+
+
+def twd97_to_wgs84(e, n, lon0: float = LON0):
+    """TWD97 (E, N) -> WGS84 (緯度, 經度),單位:度。"""
+    xi = (np.asarray(n, dtype=np.float64) - FALSE_NORTHING) / (K0 * _RECTIFYING_A)
+    eta = (np.asarray(e, dtype=np.float64) - FALSE_EASTING) / (K0 * _RECTIFYING_A)
+
+    xi_p, eta_p = xi, eta
+    for j, beta in enumerate(_BETA, start=1):
+        xi_p = xi_p - beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_p = eta_p - beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+
+    chi = np.arcsin(np.sin(xi_p) / np.cosh(eta_p))
+    phi = chi
+    for j, delta in enumerate(_DELTA, start=1):
+        phi = phi + delta * np.sin(2 * j * chi)
+    lam = np.arctan2(np.sinh(eta_p), np.cos(xi_p))
+
+    return _result(np.degrees(phi)), _result(lon0 + np.degrees(lam))
+
+
+def _to_dms(value: float, precision: int, positive: str, negative: str) -> str:
+    hemisphere = negative if value < 0 else positive
+    value = abs(value)
+    degrees = int(value)
+    minutes_full = (value - degrees) * 60
+    minutes = int(minutes_full)
+    seconds = round((minutes_full - minutes) * 60, precision)
+    # 進位處理 (例如 59.999 秒四捨五入成 60)
+    if seconds >= 60:
+        seconds -= 60
+        minutes += 1
+    if minutes >= 60:
+        minutes -= 60
+        degrees += 1
+    return f"{degrees}°{minutes}'{seconds:.{precision}f}\"{hemisphere}"
+
+
+def format_dms(lat: float, lng: float, precision: int = 2) -> str:
+    """
+    經緯度格式化為度分秒,格式與網站詳細資料的「經緯度」欄位相同 (經度在前,以空白分隔並標示東西/南北),
+    例如 121°13'24.44"E 24°57'11.24"N
+    """
+    return f"{_to_dms(lng, precision, 'E', 'W')} {_to_dms(lat, precision, 'N', 'S')}"
+
+
+def complete_coordinates(info: dict) -> dict:
+    """
+    parse_land_info 的結果只要有 WGS84 或 TWD97 其中一組坐標,就在本地補齊另一組與度分秒欄位。
+    回傳新的 dict,原本已有的欄位不會被覆寫;本地換算的坐標記在 "坐標換算" 欄位 (例如 "TWD97")。
+    """
+    info = dict(info)
+    has_wgs84 = info.get("緯度_WGS84") is not None and info.get("經度_WGS84") is not None
+    has_twd97 = info.get("TWD97_E") is not None and info.get("TWD97_N") is not None
+    if has_wgs84 and not has_twd97:
+        e, n = wgs84_to_twd97(info["緯度_WGS84"], info["經度_WGS84"])
+        info["TWD97_E"], info["TWD97_N"] = round(e, 2), round(n, 2)
+        info["坐標換算"] = "TWD97"
+    elif has_twd97 and not has_wgs84:
+        lat, lng = twd97_to_wgs84(info["TWD97_E"], info["TWD97_N"])
+        info["緯度_WGS84"], info["經度_WGS84"] = round(lat, 7), round(lng, 7)
+        info["坐標換算"] = "WGS84"
+    if info.get("經緯度_DMS") is None and info.get("緯度_WGS84") is not None and info.get("經度_WGS84") is not None:
+        info["經緯度_DMS"] = format_dms(info["緯度_WGS84"], info["經度_WGS84"])
+    return info
+
+
+def load_reference_pairs(path: str = REFERENCE_PAIRS_PATH) -> list:
+    """讀取成對坐標的參考檔 (CSV,欄位: 地點、緯度_WGS84、經度_WGS84、TWD97_E、TWD97_N),回傳 dict 的 list。"""
+    import csv
+
+    with open(path, encoding="utf-8") as f:
+        return [{k: v if k == "地點" else float(v) for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+def validate_against_records(records) -> dict:
+    """
+    以網站回傳的成對坐標驗證轉換結果:對網站同時給了 WGS84 與 TWD97 的紀錄 (排除本地換算的),
+    把 WGS84 轉成 TWD97 後與網站的 TWD97 比較,回傳筆數與誤差 (公尺) 統計。
+    """
+    pairs = [r for r in records
+             if "坐標換算" not in r
+             and all(r.get(k) is not None for k in ("緯度_WGS84", "經度_WGS84", "TWD97_E", "TWD97_N"))]
+    if not pairs:
+        return {"count": 0, "max_m": None, "mean_m": None}
+    lat = np.array([r["緯度_WGS84"] for r in pairs])
+    lng = np.array([r["經度_WGS84"] for r in pairs])
+    e, n = wgs84_to_twd97(lat, lng)
+    err = np.hypot(e - np.array([r["TWD97_E"] for r in pairs]), n - np.array([r["TWD97_N"] for r in pairs]))
+    return {"count": len(pairs), "max_m": float(err.max()), "mean_m": float(err.mean())}